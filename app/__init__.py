@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from . import migrator
+migrator.migrator.up()
+
 from . import models
 from . import db
+from . import versions
 from . import utils
 
 from . import schema
@@ -15,5 +18,6 @@ from . import projects
 from . import equipment
 from . import groups
 from . import works
+from . import admin
 
 utils.fill_database_by_initial_values()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+from fastapi import APIRouter, Depends, status
+from app.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from app.db import db, get_session
+from app.models import User
+from app.history import ASSIGNMENTS, compact
+from app.auth import get_current_user
+from app.auth.cache import principal_cache
+from app.cache import profile_cache
+from app.analytics.views import refresher
+from app.analytics.effectivity import snapshot
+from app.admin import schema
+
+router = APIRouter(tags=['admin'])
+
+
+@router.get('/api/admin/auth/cache', status_code=status.HTTP_200_OK, responses={
+    200: {'model': schema.CacheStats},
+    401: {'model': schema.UnauthorizedError},
+    403: {'model': schema.ForbiddenError},
+})
+def api_admin_auth_cache(
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin and not current_user.is_superuser:
+        return JSONResponse(
+            {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
+        )
+
+    return JSONResponse(principal_cache.stats(), status.HTTP_200_OK)
+
+
+@router.get('/api/admin/profiles/cache', status_code=status.HTTP_200_OK, responses={
+    200: {'model': schema.ResponseCacheStats},
+    401: {'model': schema.UnauthorizedError},
+    403: {'model': schema.ForbiddenError},
+})
+def api_admin_profiles_cache(
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin and not current_user.is_superuser:
+        return JSONResponse(
+            {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
+        )
+
+    return JSONResponse(profile_cache.stats(), status.HTTP_200_OK)
+
+
+@router.get('/api/admin/analytics/refresher', status_code=status.HTTP_200_OK, responses={
+    200: {'model': schema.RefresherStats},
+    401: {'model': schema.UnauthorizedError},
+    403: {'model': schema.ForbiddenError},
+})
+def api_admin_analytics_refresher(
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin and not current_user.is_superuser:
+        return JSONResponse(
+            {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
+        )
+
+    return JSONResponse(refresher.stats(), status.HTTP_200_OK)
+
+
+@router.get('/api/admin/analytics/snapshot', status_code=status.HTTP_200_OK, responses={
+    200: {'model': schema.SnapshotStats},
+    401: {'model': schema.UnauthorizedError},
+    403: {'model': schema.ForbiddenError},
+})
+def api_admin_analytics_snapshot(
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin and not current_user.is_superuser:
+        return JSONResponse(
+            {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
+        )
+
+    return JSONResponse(snapshot.stats(), status.HTTP_200_OK)
+
+
+@router.get('/api/admin/db/pool', status_code=status.HTTP_200_OK, responses={
+    200: {'model': schema.PoolStats},
+    401: {'model': schema.UnauthorizedError},
+    403: {'model': schema.ForbiddenError},
+})
+def api_admin_db_pool(
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin and not current_user.is_superuser:
+        return JSONResponse(
+            {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
+        )
+
+    return JSONResponse(db.pool_stats(), status.HTTP_200_OK)
+
+
+@router.post('/api/admin/assignments/compact', status_code=status.HTTP_200_OK, responses={
+    200: {'model': schema.Compaction},
+    401: {'model': schema.UnauthorizedError},
+    403: {'model': schema.ForbiddenError},
+})
+def api_admin_assignments_compact(
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    if not current_user.is_admin and not current_user.is_superuser:
+        return JSONResponse(
+            {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
+        )
+
+    # One transaction per log, so that inserts wait for one table at once
+    deleted = {}
+    for model in ASSIGNMENTS:
+        deleted[model.__tablename__] = compact(session, model)
+        session.commit()
+
+    return JSONResponse({'deleted': deleted}, status.HTTP_200_OK)
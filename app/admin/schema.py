@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from typing import Optional
+
+from datetime import datetime
+from pydantic import BaseModel
+
+from app.schema import UnauthorizedError
+from app.schema import ForbiddenError
+
+
+class CacheStats(BaseModel):
+    size: int
+    max_size: int
+    ttl: float
+    hits: int
+    misses: int
+    invalidations: int
+    hit_rate: float
+
+
+class ResponseCacheStats(BaseModel):
+    size: int
+    max_size: int
+    ttl: float
+    hits: int
+    misses: int
+    invalidations: int
+    hit_rate: float
+
+
+class RefresherStats(BaseModel):
+    delay: float
+    max_delay: float
+    changed: list[str]
+    refreshes: int
+    failures: int
+
+
+class SnapshotStats(BaseModel):
+    works: int
+    rebuilt_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    rebuilds: int
+    updates: int
+
+
+class PoolStats(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    max_overflow: int
+    checkouts: int
+    timeouts: int
+    checkout_time_avg_ms: float
+    checkout_time_max_ms: float
+    leak_threshold: float
+    leaks_detected: int
+    leaks_reclaimed: int
+
+
+class Compaction(BaseModel):
+    deleted: dict[str, int]
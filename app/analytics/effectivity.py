@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import threading
+import time
+
+from datetime import datetime
+
+import numpy as np
+
+from sqlalchemy import case
+from sqlalchemy import func
+from sqlalchemy import select
+
+from app.db import db
+from app.models import Work, Contract, Project, Group, AssociationUserGroup
+from app.versions import on_commit, changed_tables, changed_rows
+
+# Tables whose changes change the entities or their headcounts
+HEADCOUNT_TABLES = {
+    'contracts', 'projects', 'groups', 'users',
+    'associations_user_group', 'associations_contract_project'
+}
+
+
+def load_works(session, ids=None):
+    query = select(
+        Work.id,
+        Work.cost,
+        func.coalesce(Work.contract_id, -1),
+        func.coalesce(Work.project_id, -1),
+        func.coalesce(Work.group_id, -1)
+    )
+    if ids is not None:
+        query = query.where(Work.id.in_(ids))
+    data = session.execute(query.order_by(Work.id)).all()
+    columns = list(zip(*data)) or [()] * 5
+    return (
+        np.array(columns[0], dtype=np.int64),
+        np.array(columns[1], dtype=np.float64),
+        np.array(columns[2:], dtype=np.int64).reshape(3, len(data))
+    )
+
+
+def load_headcounts(session):
+    # Sorted ids of contracts, projects and groups with their member numbers
+    members = func.count(AssociationUserGroup.user_id.distinct())
+    queries = {
+        # At least one, as contracts report it
+        'contracts': select(Contract.id, case(
+            (Contract.users_number > 1, Contract.users_number), else_=1
+        )),
+        'projects': select(Project.id, members).outerjoin(
+            AssociationUserGroup,
+            AssociationUserGroup.group_id == Project.group_id
+        ).group_by(Project.id),
+        'groups': select(Group.id, members).outerjoin(
+            AssociationUserGroup,
+            AssociationUserGroup.group_id == Group.id
+        ).group_by(Group.id)
+    }
+    headcounts = {}
+    for entity, query in queries.items():
+        data = session.execute(query.order_by(query.selected_columns[0])).all()
+        data = np.array([tuple(x) for x in data], dtype=np.int64)
+        headcounts[entity] = data.reshape(len(data), 2).T
+    return headcounts
+
+
+def group_by(ids, keys, values):
+    # Sums and numbers of values by key, for the ids; keys which are not
+    # ids (-1 for none) are skipped. Ids are serial, so positions are
+    # looked up in a table indexed by id: the last slot stands for
+    # the keys out of range.
+    if len(ids) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+    size = int(ids.max()) + 1
+    lookup = np.full(size + 1, -1, dtype=np.int64)
+    lookup[ids] = np.arange(len(ids))
+    positions = lookup[np.where((keys >= 0) & (keys < size), keys, size)]
+    found = positions >= 0
+    positions = positions[found]
+    sums = np.bincount(positions, weights=values[found], minlength=len(ids))
+    counts = np.bincount(positions, minlength=len(ids))
+    return sums, counts
+
+
+class Ranking:
+    # Metrics of every entity of one kind, computed at once
+    def __init__(self, ids, users_number, works_total_cost, works_number):
+        self.ids = ids
+        self.users_number = users_number
+        self.works_total_cost = works_total_cost
+        self.works_number = works_number
+        self.effectivity = works_total_cost / np.maximum(users_number, 1)
+
+    def metric(self, name):
+        return getattr(self, name)
+
+    def describe(self, name, percentiles, bins):
+        values = self.metric(name)
+        if len(values) == 0:
+            return {
+                'count': 0, 'sum': 0.0, 'mean': None, 'min': None, 'max': None,
+                'percentiles': {str(x): None for x in percentiles},
+                'histogram': {'edges': [], 'counts': []}
+            }
+        counts, edges = np.histogram(values, bins=bins)
+        return {
+            'count': len(values),
+            'sum': float(values.sum()),
+            'mean': float(values.mean()),
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'percentiles': dict(zip(
+                [str(x) for x in percentiles],
+                np.percentile(values, percentiles).tolist()
+            )),
+            'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()}
+        }
+
+    def top(self, name, limit, ascending=False):
+        # Partial sort: only the limit best values are ordered
+        values = self.metric(name)
+        limit = min(limit, len(values))
+        if limit == 0:
+            return []
+        order = values if ascending else -values
+        if limit < len(values):
+            best = np.argpartition(order, limit - 1)[:limit]
+        else:
+            best = np.arange(len(values))
+        # Equal values are ordered by id
+        best = best[np.lexsort((self.ids[best], order[best]))]
+        return [
+            {
+                'id': int(self.ids[x]),
+                'effectivity': float(self.effectivity[x]),
+                'works_total_cost': float(self.works_total_cost[x]),
+                'works_number': int(self.works_number[x]),
+                'users_number': int(self.users_number[x])
+            }
+            for x in best
+        ]
+
+
+class EffectivitySnapshot:
+    # Costs and keys of all works and headcounts of all entities kept in
+    # NumPy arrays. Commits mark the changed works, which are read again
+    # and patched into copies of the arrays; changes of entities and
+    # memberships reload the headcounts. Rankings are computed again on
+    # the next read, which takes milliseconds even for a hundred thousand
+    # entities. Changes made by other processes are picked up by a full
+    # rebuild after max_age, so the data is complete as of the last
+    # rebuild, which is what rankings report.
+    ENTITIES = ('contracts', 'projects', 'groups')
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.rebuilds = 0
+        self.updates = 0
+        self.rebuilt_at = None
+        self.updated_at = None
+        self.__built = None
+        # (ids, costs, keys, headcounts), replaced as a whole
+        self.__state = None
+        self.__positions = {}
+        self.__rankings = None
+        # None stands for all the works
+        self.__changed_works = set()
+        self.__changed_headcounts = False
+        # Guards the fields above; loads run outside of it, one at a time
+        self.__lock = threading.Lock()
+        self.__loading = threading.Lock()
+
+    def touch(self, keys):
+        tables = changed_tables(keys)
+        with self.__lock:
+            if 'works' in tables and self.__changed_works is not None:
+                rows = changed_rows(keys, 'works')
+                if rows is None:
+                    self.__changed_works = None
+                else:
+                    self.__changed_works.update(rows)
+            if not tables.isdisjoint(HEADCOUNT_TABLES):
+                self.__changed_headcounts = True
+
+    def rankings(self):
+        # Rankings by entity and the time of the last rebuild. One thread
+        # loads the changes, the others are served the current rankings
+        # meanwhile; only the first build is waited for.
+        if self.__stale():
+            if self.__loading.acquire(blocking=self.__state is None):
+                try:
+                    if self.__stale():
+                        self.__load()
+                finally:
+                    self.__loading.release()
+
+        with self.__lock:
+            state, rankings = self.__state, self.__rankings
+            rebuilt_at = self.rebuilt_at
+        if rankings is None or rankings[0] is not state:
+            rankings = (state, self.__rank(state))
+            with self.__lock:
+                if self.__state is state:
+                    self.__rankings = rankings
+        return rankings[1], rebuilt_at
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'works': 0 if self.__state is None else len(self.__state[0]),
+                'rebuilt_at': self.rebuilt_at,
+                'updated_at': self.updated_at,
+                'rebuilds': self.rebuilds,
+                'updates': self.updates
+            }
+
+    def __stale(self):
+        with self.__lock:
+            return (
+                self.__built is None
+                or time.monotonic() - self.__built > self.max_age
+                or self.__changed_works != set()
+                or self.__changed_headcounts
+            )
+
+    def __load(self):
+        # Changes marked from now on are left for the next load
+        with self.__lock:
+            rebuild = (
+                self.__built is None
+                or time.monotonic() - self.__built > self.max_age
+                or self.__changed_works is None
+            )
+            changed_works = self.__changed_works
+            changed_headcounts = self.__changed_headcounts
+            self.__changed_works = set()
+            self.__changed_headcounts = False
+        try:
+            if rebuild:
+                self.__rebuild()
+            else:
+                self.__update(changed_works, changed_headcounts)
+        except Exception:
+            with self.__lock:
+                self.__built = None
+            raise
+
+    def __rebuild(self):
+        built, rebuilt_at = time.monotonic(), datetime.utcnow()
+        with db.session('effectivity snapshot', read_only=True) as session:
+            ids, costs, keys = load_works(session)
+            headcounts = load_headcounts(session)
+        self.__positions = {x: i for i, x in enumerate(ids.tolist())}
+        with self.__lock:
+            self.__state = (ids, costs, keys, headcounts)
+            self.__built = built
+            self.rebuilt_at = rebuilt_at
+            self.updated_at = rebuilt_at
+            self.rebuilds += 1
+
+    def __update(self, changed_works, changed_headcounts):
+        ids, costs, keys, headcounts = self.__state
+        changed = sorted(changed_works)
+        with db.session('effectivity snapshot', read_only=True) as session:
+            found, found_costs, found_keys = load_works(session, changed) if changed else (
+                np.zeros(0, dtype=np.int64), None, None
+            )
+            if changed_headcounts:
+                headcounts = load_headcounts(session)
+
+        # Readers may rank the current arrays, so the copies are patched
+        costs, keys = costs.copy(), keys.copy()
+
+        # Deleted works stay as rows without cost and keys
+        for id in set(changed) - set(found.tolist()):
+            position = self.__positions.get(id)
+            if position is not None:
+                costs[position] = 0.0
+                keys[:, position] = -1
+
+        added = []
+        for i, id in enumerate(found.tolist()):
+            position = self.__positions.get(id)
+            if position is None:
+                added.append(i)
+                continue
+            costs[position] = found_costs[i]
+            keys[:, position] = found_keys[:, i]
+        if added:
+            for i, id in enumerate(found[added].tolist()):
+                self.__positions[id] = len(ids) + i
+            ids = np.concatenate((ids, found[added]))
+            costs = np.concatenate((costs, found_costs[added]))
+            keys = np.concatenate((keys, found_keys[:, added]), axis=1)
+
+        with self.__lock:
+            self.__state = (ids, costs, keys, headcounts)
+            self.updated_at = datetime.utcnow()
+            self.updates += 1
+
+    def __rank(self, state):
+        _, costs, keys, headcounts = state
+        rankings = {}
+        for row, entity in enumerate(self.ENTITIES):
+            ids, users_number = headcounts[entity]
+            sums, counts = group_by(ids, keys[row], costs)
+            rankings[entity] = Ranking(ids, users_number, sums, counts)
+        return rankings
+
+
+snapshot = EffectivitySnapshot(max_age=config.ANALYTICS_SNAPSHOT_MAX_AGE)
+
+on_commit(snapshot.touch)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, status
+from app.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.models import User, Department, Group, Project, Contract
+from app.analytics.views import WORK_COSTS, HEADCOUNTS, refresher
+from app.analytics.effectivity import snapshot
+
+from app.auth import get_current_user
+from app.analytics import schema
+
+router = APIRouter(tags=['analytics'])
+
+# Dimension and the model its keys are ids of
+DIMENSIONS = {
+    'group': Group,
+    'department': Department,
+    'project': Project,
+    'contract': Contract,
+    'total': None
+}
+
+# View, its metrics with the values of the entities it has no rows for,
+# and the dimensions it covers
+ROLLUP_VIEWS = [
+    (
+        WORK_COSTS,
+        {'works_number': 0, 'total_cost': 0.0},
+        ('group', 'project', 'contract', 'total')
+    ),
+    (
+        HEADCOUNTS,
+        {'users_number': 0},
+        ('group', 'department', 'project', 'contract', 'total')
+    )
+]
+
+
+def make_rollup(dimension, key):
+    item = {'id': key, 'name': None}
+    for _, metrics, dimensions in ROLLUP_VIEWS:
+        if dimension in dimensions:
+            item.update(metrics)
+    return item
+
+
+def rollup_order(item):
+    # Totals and rows without an entity go last
+    return item['id'] is None, item['id'] or 0
+
+
+@router.get('/api/analytics/rollups', response_model=schema.Rollups, responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_analytics_rollups(
+    dimension: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    if dimension is not None and dimension not in DIMENSIONS:
+        return JSONResponse(
+            {'msg': 'invalid dimension'}, status.HTTP_400_BAD_REQUEST
+        )
+    dimensions = [dimension] if dimension is not None else list(DIMENSIONS)
+
+    # Rows of both views merged by dimension and key
+    rollups = {x: {} for x in dimensions}
+    for view, metrics, _ in ROLLUP_VIEWS:
+        query = select(view.c.dimension, view.c.key, *[view.c[x] for x in metrics])
+        query = query.where(view.c.dimension.in_(dimensions))
+        for row in session.execute(query):
+            items = rollups[row.dimension]
+            if row.key not in items:
+                items[row.key] = make_rollup(row.dimension, row.key)
+            for name in metrics:
+                items[row.key][name] = getattr(row, name)
+
+    for name, items in rollups.items():
+        model = DIMENSIONS[name]
+        ids = [x for x in items if x is not None]
+        if model is None or not ids:
+            continue
+        names = session.execute(
+            select(model.id, model.name).where(model.id.in_(ids))
+        ).all()
+        for id, value in names:
+            items[id]['name'] = value
+
+    return JSONResponse({
+        'rollups': {
+            name: sorted(items.values(), key=rollup_order)
+            for name, items in rollups.items()
+        },
+        'refreshed_at': refresher.refreshed_at(session)
+    }, status.HTTP_200_OK)
+
+
+RANKED_ENTITIES = {
+    'contracts': Contract,
+    'projects': Project,
+    'groups': Group
+}
+
+RANKED_METRICS = ('effectivity', 'works_total_cost')
+
+PERCENTILES = (10, 25, 50, 75, 90, 95, 99)
+
+
+@router.get('/api/analytics/effectivity', response_model=schema.EffectivityDistribution, responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_analytics_effectivity(
+    entity: str = 'contracts',
+    metric: str = 'effectivity',
+    limit: int = 10,
+    ascending: bool = False,
+    bins: int = 10,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    if entity not in RANKED_ENTITIES:
+        return JSONResponse(
+            {'msg': 'invalid entity'}, status.HTTP_400_BAD_REQUEST
+        )
+    if metric not in RANKED_METRICS:
+        return JSONResponse(
+            {'msg': 'invalid metric'}, status.HTTP_400_BAD_REQUEST
+        )
+    if limit < 0 or limit > config.ANALYTICS_TOP_MAX_LIMIT:
+        return JSONResponse(
+            {'msg': 'invalid limit'}, status.HTTP_400_BAD_REQUEST
+        )
+    if bins < 1 or bins > 100:
+        return JSONResponse(
+            {'msg': 'invalid bins'}, status.HTTP_400_BAD_REQUEST
+        )
+
+    rankings, updated_at = snapshot.rankings()
+    ranking = rankings[entity]
+    top = ranking.top(metric, limit, ascending)
+
+    model = RANKED_ENTITIES[entity]
+    if top:
+        names = dict(session.execute(
+            select(model.id, model.name).where(
+                model.id.in_([x['id'] for x in top])
+            )
+        ).all())
+        for item in top:
+            item['name'] = names.get(item['id'])
+
+    return JSONResponse({
+        'entity': entity,
+        'metric': metric,
+        **ranking.describe(metric, PERCENTILES, bins),
+        'top': top,
+        'updated_at': updated_at
+    }, status.HTTP_200_OK)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from typing import Optional
+
+from datetime import datetime
+from pydantic import BaseModel
+
+from app.schema import BadRequestError
+from app.schema import UnauthorizedError
+
+
+class Rollup(BaseModel):
+    # id and name are null for the totals and for the rows without
+    # a group, department, project or contract
+    id: Optional[int] = None
+    name: Optional[str] = None
+    works_number: Optional[int] = None
+    total_cost: Optional[float] = None
+    users_number: Optional[int] = None
+
+
+class Rollups(BaseModel):
+    rollups: dict[str, list[Rollup]]
+    refreshed_at: dict[str, Optional[datetime]]
+
+
+class Histogram(BaseModel):
+    edges: list[float]
+    counts: list[int]
+
+
+class RankedItem(BaseModel):
+    id: int
+    name: Optional[str] = None
+    effectivity: float
+    works_total_cost: float
+    works_number: int
+    users_number: int
+
+
+class EffectivityDistribution(BaseModel):
+    entity: str
+    metric: str
+    count: int
+    sum: float
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    percentiles: dict[str, Optional[float]]
+    histogram: Histogram
+    top: list[RankedItem]
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import logging
+import threading
+import time
+
+from datetime import datetime
+
+from sqlalchemy import column
+from sqlalchemy import select
+from sqlalchemy import table
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from app.db import db
+from app.models import AnalyticsRefresh
+from app.versions import on_commit, changed_tables
+
+logger = logging.getLogger(__name__)
+
+
+WORK_COSTS = table(
+    'analytics_work_costs',
+    column('dimension'),
+    column('key'),
+    column('works_number'),
+    column('total_cost')
+)
+
+HEADCOUNTS = table(
+    'analytics_headcounts',
+    column('dimension'),
+    column('key'),
+    column('users_number')
+)
+
+
+class ViewRefresher:
+    # Refreshes materialized views in a background thread. A commit
+    # changing a source table of a view marks it as changed; the view is
+    # refreshed once there were no changes for delay seconds, or max_delay
+    # seconds after the first change, so bursts of writes cost one refresh.
+    def __init__(self, views, delay, max_delay):
+        # views map view names to the names of their source tables
+        self.views = views
+        self.delay = delay
+        self.max_delay = max_delay
+        self.refreshes = 0
+        self.failures = 0
+        # view -> (first change, last change)
+        self.__changed = {}
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__thread = None
+
+    def attach(self, engine):
+        if engine.dialect.name != 'postgresql':
+            return
+        on_commit(self.touch)
+        self.__thread = threading.Thread(
+            target=self.__watch, name='analytics-refresher', daemon=True
+        )
+        self.__thread.start()
+
+    def touch(self, keys):
+        tables = changed_tables(keys)
+        now = time.monotonic()
+        with self.__lock:
+            for view, sources in self.views.items():
+                if sources.isdisjoint(tables):
+                    continue
+                first, _ = self.__changed.get(view, (now, now))
+                self.__changed[view] = (first, now)
+        self.__wakeup.set()
+
+    def due(self, now):
+        with self.__lock:
+            return [
+                view for view, (first, last) in self.__changed.items()
+                if now - last >= self.delay or now - first >= self.max_delay
+            ]
+
+    def refresh(self, view):
+        # Changes made while the view is refreshed mark it changed again.
+        # Another worker refreshing the same view holds the lock; then, as
+        # after a failure, the view is tried again after the delay.
+        with self.__lock:
+            self.__changed.pop(view, None)
+        try:
+            with db.session('refresh %s' % view) as session:
+                locked = session.execute(
+                    text('SELECT pg_try_advisory_xact_lock(hashtext(:name))'),
+                    {'name': view}
+                ).scalar()
+                if locked:
+                    session.execute(text(
+                        'REFRESH MATERIALIZED VIEW CONCURRENTLY %s' % view
+                    ))
+                    query = postgresql.insert(AnalyticsRefresh).values(
+                        name=view, refreshed_at=datetime.utcnow()
+                    )
+                    query = query.on_conflict_do_update(
+                        index_elements=[AnalyticsRefresh.name],
+                        set_={'refreshed_at': query.excluded.refreshed_at}
+                    )
+                    session.execute(query)
+                    session.commit()
+        except Exception:
+            locked = False
+            self.failures += 1
+            logger.exception('Refresh of %s failed', view)
+
+        if locked:
+            self.refreshes += 1
+            return
+        now = time.monotonic()
+        with self.__lock:
+            self.__changed.setdefault(view, (now, now))
+
+    def refreshed_at(self, session):
+        return dict(session.execute(
+            select(AnalyticsRefresh.name, AnalyticsRefresh.refreshed_at).where(
+                AnalyticsRefresh.name.in_(list(self.views))
+            )
+        ).all())
+
+    def stats(self):
+        with self.__lock:
+            changed = sorted(self.__changed)
+        return {
+            'delay': self.delay,
+            'max_delay': self.max_delay,
+            'changed': changed,
+            'refreshes': self.refreshes,
+            'failures': self.failures
+        }
+
+    def __watch(self):
+        while True:
+            self.__wakeup.wait(max(self.delay / 2, 0.1))
+            self.__wakeup.clear()
+            for view in self.due(time.monotonic()):
+                self.refresh(view)
+
+
+refresher = ViewRefresher(
+    {
+        WORK_COSTS.name: {'works'},
+        HEADCOUNTS.name: {
+            'users', 'associations_user_group', 'projects',
+            'associations_contract_project'
+        }
+    },
+    delay=config.ANALYTICS_REFRESH_DELAY,
+    max_delay=config.ANALYTICS_REFRESH_MAX_DELAY
+)
+
+refresher.attach(db.engine)
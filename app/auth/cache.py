@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import threading
+import time
+
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import object_session
+
+from app.models import User
+
+
+class Principal:
+    # Detached snapshot of the authenticated user, safe to share between threads
+    __slots__ = ('id', 'email', 'is_superuser', 'is_admin', 'security_version')
+
+    def __init__(self, id, email, is_superuser, is_admin, security_version):
+        self.id = id
+        self.email = email
+        self.is_superuser = is_superuser
+        self.is_admin = is_admin
+        self.security_version = security_version
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            user.id, user.email, user.is_superuser, user.is_admin,
+            user.security_version or 0
+        )
+
+
+class PrincipalCache:
+    # Entries are dropped by the ORM events of this process only; changes
+    # made by other workers are caught by checking cached principals
+    # against the revocations, see verify_token
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.__items = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, subject):
+        with self.__lock:
+            item = self.__items.get(subject)
+            if item is not None and item[1] > time.monotonic():
+                self.__items.move_to_end(subject)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self.__items[subject]
+            self.misses += 1
+            return None
+
+    def put(self, subject, principal):
+        if self.size <= 0:
+            return
+        with self.__lock:
+            self.__items[subject] = (principal, time.monotonic() + self.ttl)
+            self.__items.move_to_end(subject)
+            while len(self.__items) > self.size:
+                self.__items.popitem(last=False)
+
+    def invalidate(self, *subjects):
+        with self.__lock:
+            for subject in subjects:
+                if self.__items.pop(subject, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+
+    def stats(self):
+        with self.__lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self.__items),
+                'max_size': self.size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / requests if requests else 0.0
+            }
+
+
+principal_cache = PrincipalCache(
+    size=config.AUTH_PRINCIPAL_CACHE_SIZE,
+    ttl=config.AUTH_PRINCIPAL_CACHE_TTL
+)
+
+
+def _user_subjects(user):
+    # Current email and the one it was changed from in this flush (if any)
+    subjects = {user.email}
+    history = inspect(user).attrs.email.history
+    subjects.update(x for x in history.deleted if x is not None)
+    return subjects
+
+
+def _invalidate(target):
+    subjects = _user_subjects(target)
+    principal_cache.invalidate(*subjects)
+    # Drop them once more after commit: a concurrent request could reload
+    # the not yet committed row between the flush and the commit
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('principal_subjects', set()).update(subjects)
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_updated_user(mapper, connection, target):
+    state = inspect(target)
+    changed = any(
+        state.attrs[name].history.has_changes()
+        for name in ('email', 'is_admin', 'is_superuser')
+    )
+    if changed:
+        _invalidate(target)
+
+
+@event.listens_for(User, 'after_delete')
+def _invalidate_deleted_user(mapper, connection, target):
+    _invalidate(target)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    subjects = session.info.pop('principal_subjects', None)
+    if subjects:
+        principal_cache.invalidate(*subjects)
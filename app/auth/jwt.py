@@ -12,11 +12,14 @@ from sqlalchemy import select
 
 from app.db import db
 from app.models import User
+from app.auth.cache import Principal, principal_cache
+from app.auth.revocations import revocations
 
 
 SECRET_KEY = config.AUTH_SECRET_KEY
 ALGORITHM = config.AUTH_ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES
+STATELESS_TOKENS = config.AUTH_STATELESS_TOKENS
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/login')
 
@@ -29,19 +32,58 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
+def user_claims(user: User):
+    data = {'sub': user.email}
+    if STATELESS_TOKENS:
+        # Enough to authorize requests without loading the user
+        data.update({
+            'uid': user.id,
+            'su': user.is_superuser,
+            'adm': user.is_admin,
+            'ver': user.security_version or 0
+        })
+    return data
+
+
+def verify_claims(payload: dict, credentials_exception):
+    user_id, version = payload.get('uid'), payload.get('ver')
+    if user_id is None or version is None:
+        raise credentials_exception
+    if revocations.is_revoked(user_id, version):
+        raise credentials_exception
+    return Principal(
+        user_id,
+        payload.get('sub'),
+        bool(payload.get('su')),
+        bool(payload.get('adm')),
+        version
+    )
+
+
 def verify_token(token: str, credentials_exception):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get('sub')
         if email is None:
             raise credentials_exception
-        with db.Session() as session:
+        if STATELESS_TOKENS and 'uid' in payload:
+            return verify_claims(payload, credentials_exception)
+        # Changes of credentials and deletions revoke the security version
+        # of the user in every worker, so stale principals are loaded again
+        principal = principal_cache.get(email)
+        if principal is not None and not revocations.is_revoked(
+            principal.id, principal.security_version
+        ):
+            return principal
+        with db.session('verify_token') as session:
             user = session.execute(
                 select(User).filter_by(email=email)
             ).scalar_one_or_none()
         if user is None:
             raise credentials_exception
-        return user
+        principal = Principal.from_user(user)
+        principal_cache.put(email, principal)
+        return principal
     except JWTError:
         raise credentials_exception
 
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import threading
+import time
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy import insert
+from sqlalchemy import or_
+from sqlalchemy import select
+
+from app.db import db
+from app.models import User, TokenRevocation
+
+
+class RevocationFilter:
+    # Minimal accepted security version per user id, loaded incrementally
+    # from token_revocations. Rows older than the token lifetime can not
+    # affect any valid token, so they are never loaded. Ids are taken
+    # before commit, so a row may become visible after rows with higher
+    # ids: every refresh reads the rows created since margin before the
+    # previous one again, besides the rows with unseen ids.
+    def __init__(self, refresh_interval, lifetime, margin):
+        self.refresh_interval = refresh_interval
+        self.lifetime = lifetime
+        self.margin = margin
+        self.refreshes = 0
+        self.__versions = {}
+        self.__last_id = 0
+        self.__scanned_at = None
+        self.__refreshed_at = None
+        self.__lock = threading.Lock()
+
+    def is_revoked(self, user_id, security_version):
+        self.__refresh_if_stale()
+        return security_version < self.__versions.get(user_id, 0)
+
+    def revoke(self, user_id, security_version):
+        with self.__lock:
+            self.__add(user_id, security_version)
+
+    def stats(self):
+        return {
+            'users': len(self.__versions),
+            'last_id': self.__last_id,
+            'refreshes': self.refreshes
+        }
+
+    def __add(self, user_id, security_version):
+        if security_version > self.__versions.get(user_id, 0):
+            self.__versions[user_id] = security_version
+
+    def __refresh_if_stale(self):
+        now = time.monotonic()
+        refreshed_at = self.__refreshed_at
+        if refreshed_at is not None and now - refreshed_at < self.refresh_interval:
+            return
+        # Only one thread goes to the database; the others use the current state
+        if not self.__lock.acquire(blocking=refreshed_at is None):
+            return
+        try:
+            self.__refresh()
+            self.__refreshed_at = now
+        finally:
+            self.__lock.release()
+
+    def __refresh(self):
+        query = select(
+            TokenRevocation.id,
+            TokenRevocation.user_id,
+            TokenRevocation.security_version
+        )
+        scanned_at = datetime.utcnow()
+        if self.__scanned_at is None:
+            query = query.where(
+                TokenRevocation.created_at >= scanned_at - self.lifetime
+            )
+        else:
+            query = query.where(or_(
+                TokenRevocation.id > self.__last_id,
+                TokenRevocation.created_at >= self.__scanned_at - self.margin
+            ))
+        query = query.order_by(TokenRevocation.id)
+
+        with db.session('token_revocations') as session:
+            data = session.execute(query).all()
+
+        for row in data:
+            self.__add(row[1], row[2])
+            self.__last_id = max(self.__last_id, row[0])
+        self.__scanned_at = scanned_at
+        self.refreshes += 1
+
+
+revocations = RevocationFilter(
+    refresh_interval=config.AUTH_REVOCATIONS_REFRESH_SECONDS,
+    lifetime=timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES),
+    margin=timedelta(seconds=config.AUTH_REVOCATIONS_MARGIN_SECONDS)
+)
+
+
+def _credentials_changed(user):
+    state = inspect(user)
+    return any(
+        state.attrs[name].history.has_changes()
+        for name in ('email', 'is_admin', 'is_superuser')
+    )
+
+
+@event.listens_for(User, 'before_update')
+def _bump_security_version(mapper, connection, target):
+    if _credentials_changed(target):
+        target.security_version = (target.security_version or 0) + 1
+
+
+@event.listens_for(User, 'after_update')
+def _revoke_updated_user_tokens(mapper, connection, target):
+    if inspect(target).attrs.security_version.history.has_changes():
+        _revoke(connection, target.id, target.security_version)
+
+
+@event.listens_for(User, 'after_delete')
+def _revoke_deleted_user_tokens(mapper, connection, target):
+    _revoke(connection, target.id, (target.security_version or 0) + 1)
+
+
+def _revoke(connection, user_id, security_version):
+    connection.execute(
+        insert(TokenRevocation).values(
+            user_id=user_id,
+            security_version=security_version,
+            created_at=datetime.utcnow()
+        )
+    )
+    revocations.revoke(user_id, security_version)
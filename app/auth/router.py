@@ -2,23 +2,27 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
 
-from app.db import db
+from app.db import get_session
 from app.models import User
+from app.hashing import hasher, HasherBusyError
 
-from app.auth.jwt import create_access_token, get_current_user
+from app.auth.jwt import create_access_token, get_current_user, user_claims
 from app.auth import schema
 
 router = APIRouter(tags=['auth'])
 
 
 @router.post('/api/auth/login', response_model=schema.LoginResponse)
-def login(request: schema.LoginRequest):
-    with db.Session() as session:
-        user = session.execute(
-            select(User).filter_by(email=request.email)
-        ).scalar_one_or_none()
+def login(
+    request: schema.LoginRequest,
+    session: Session = Depends(get_session)
+):
+    user = session.execute(
+        select(User).filter_by(email=request.email)
+    ).scalar_one_or_none()
 
     if user is None:
         raise HTTPException(
@@ -33,9 +37,9 @@ def login(request: schema.LoginRequest):
         )
 
     # Generate a JWT Token
-    access_token = create_access_token(data={'sub': user.email})
+    access_token = create_access_token(data=user_claims(user))
 
-    return {
+    response = {
         'token': {
             'access_token': access_token,
             'token_type': 'bearer',
@@ -48,6 +52,23 @@ def login(request: schema.LoginRequest):
         }
     }
 
+    # Upgrade hashes made with outdated cost parameters while we know the password
+    if user.password_needs_rehash():
+        try:
+            password_hash = hasher.hash(request.password)
+        except HasherBusyError:
+            password_hash = None
+
+        if password_hash is not None:
+            session.execute(
+                update(User).where(User.id == user.id).values(
+                    password_hash=password_hash
+                )
+            )
+            session.commit()
+
+    return response
+
 # How to use JWT authorization:
 # @router.get('/api/users/me', response_model=schema.TokenData)
 # def get_me(current_user: User = Depends(get_current_user)):
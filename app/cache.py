@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import threading
+import time
+
+from collections import OrderedDict
+
+from fastapi import Request, Response, status
+
+from app.responses import JSONResponse
+from app.versions import make_etag, etag_matches, not_modified, selection_keys
+
+
+class ResponseCache:
+    # Rendered bodies by request, stored with the ETag they were rendered
+    # for. A commit bumping any version the body depends on changes the
+    # ETag, so the entry is not served any more. Entries are checked on
+    # every hit and need no refresh, ttl only bounds how long one is kept.
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.__items = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key, etag):
+        with self.__lock:
+            item = self.__items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            if item[0] != etag:
+                del self.__items[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if time.monotonic() - item[2] > self.ttl:
+                del self.__items[key]
+                self.misses += 1
+                return None
+            self.__items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, etag, body):
+        if self.size <= 0:
+            return
+        with self.__lock:
+            self.__items[key] = (etag, body, time.monotonic())
+            self.__items.move_to_end(key)
+            while len(self.__items) > self.size:
+                self.__items.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+
+    def stats(self):
+        with self.__lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self.__items),
+                'max_size': self.size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / requests if requests else 0.0
+            }
+
+
+profile_cache = ResponseCache(
+    size=config.PROFILE_CACHE_SIZE,
+    ttl=config.PROFILE_CACHE_TTL
+)
+
+
+def cache_key(request: Request):
+    # The inputs of the ETag, so that representations asked for with
+    # different Accept headers do not replace each other
+    return '%s?%s#%s' % (
+        request.url.path, request.url.query, request.headers.get('accept', '')
+    )
+
+
+def cached_profile(request: Request, session, selection, id, render):
+    # render(session, selection, id) returns the profile or None if there
+    # is no such item
+    etag = make_etag(session, request, selection_keys(selection, id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    key = cache_key(request)
+    body = profile_cache.get(key, etag)
+    if body is not None:
+        return Response(
+            body,
+            status.HTTP_200_OK,
+            headers={'ETag': etag},
+            media_type='application/json'
+        )
+
+    content = render(session, selection, id)
+    if content is None:
+        return JSONResponse(
+            {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
+        )
+
+    response = JSONResponse(
+        content, status.HTTP_200_OK, headers={'ETag': etag}
+    )
+    profile_cache.put(key, etag, response.body)
+    return response
@@ -3,11 +3,23 @@
 from typing import Optional
 from datetime import date, datetime
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from app.responses import JSONResponse
+from sqlalchemy import case
 from sqlalchemy import select
-
-from app.db import db
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.filters import name_search
+from app.fields import FieldSet, Relation
+from app.pagination import Page, parse_sort
+from app.streaming import accepts_ndjson, stream_ndjson
+from app.versions import make_etag, etag_matches, not_modified
+from app.versions import batch_keys, selection_keys
+from app.cache import cached_profile
+from app.profiles import Collection, fetch_profile
+from app.profiles import parse_ids, render_profiles
+from app.expand import expansions, expand_profiles, expanded_profile
 from app.models import User, Group, Contract, Project, Work
 from app.models import AssociationContractProject
 from app.models import AssignmentUserContract
@@ -19,63 +31,105 @@ from app.contracts import schema
 router = APIRouter(tags=['contracts'])
 
 
+CONTRACT_FIELDS = FieldSet(Contract, Contract.id, {
+    'id': Contract.id,
+    'name': Contract.name,
+    'start_date': Contract.start_date,
+    'finish_date': Contract.finish_date,
+    'chief': Relation(
+        User,
+        User.id == Contract.chief_id,
+        {'id': User.id, 'name': User.name},
+        local={'id': Contract.chief_id}
+    ),
+    'group': Relation(
+        Group,
+        Group.id == Contract.group_id,
+        {'id': Group.id, 'name': Group.name},
+        local={'id': Contract.group_id}
+    ),
+    'effectivity': Contract.effectivity,
+    'works_total_cost': Contract.works_total_cost,
+    # At least one, the divisor of the effectivity, as it always was
+    'users_number': case(
+        (Contract.users_number > 1, Contract.users_number), else_=1
+    )
+}, derived={
+    'effectivity': (
+        Work.contract_id, AssociationContractProject.contract_id,
+        Project, Group, AssociationUserGroup, User
+    ),
+    'works_total_cost': (Work.contract_id,),
+    'users_number': (
+        AssociationContractProject.contract_id,
+        Project, Group, AssociationUserGroup, User
+    )
+})
+
+
+CONTRACT_PROFILE_FIELDS = FieldSet(
+    Contract, Contract.id, CONTRACT_FIELDS.fields,
+    extra={
+        'projects': (AssociationContractProject.contract_id, Project),
+        'works': (Work.contract_id,)
+    },
+    derived=CONTRACT_FIELDS.derived
+)
+
+CONTRACT_SORT_KEYS = {
+    'id': (Contract.id,),
+    'effectivity': (Contract.effectivity, Contract.id)
+}
+
+
 @router.get('/api/contracts', response_model=list[schema.Contract])
 def api_contracts_get_all(
+    request: Request,
     id: Optional[int] = None,
     name: Optional[str] = None,
     start_date: Optional[date] = None,
     finish_date: Optional[date] = None,
-    current_user: User = Depends(get_current_user)
+    min_effectivity: Optional[float] = None,
+    max_effectivity: Optional[float] = None,
+    sort: str = 'id',
+    fields: Optional[str] = None,
+    page: Page = Depends(Page),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Contract.id,
-        Contract.name,
-        Contract.start_date,
-        Contract.finish_date,
-        User.id,
-        User.name,
-        Group.id,
-        Group.name
-    )
-    query = query.join(
-        User,
-        User.id == Contract.chief_id,
-        isouter=True
-    )
-    query = query.join(
-        Group,
-        Group.id == Contract.group_id,
-        isouter=True
-    )
+    selection = CONTRACT_FIELDS.select(fields)
+    keys, descending = parse_sort(sort, CONTRACT_SORT_KEYS)
+    etag = make_etag(session, request, selection_keys(selection))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = selection.query
     if name is not None and len(name) != 0:
-        query = query.filter(Contract.name.ilike(f'%{name}%'))
+        query = query.filter(name_search.filter(Contract.name, name))
     if start_date is not None:
         query = query.filter(Contract.start_date >= start_date)
     if finish_date is not None:
         query = query.filter(Contract.finish_date <= finish_date)
+    if min_effectivity is not None:
+        query = query.filter(Contract.effectivity >= min_effectivity)
+    if max_effectivity is not None:
+        query = query.filter(Contract.effectivity <= max_effectivity)
+
+    if accepts_ndjson(request):
+        query = page.order(query, *keys, descending=descending)
+        return stream_ndjson(
+            request, query, selection.make_item, headers={'ETag': etag}
+        )
 
-    with db.Session() as session:
-        data = session.execute(query).all()
+    data = page.fetch(session, query, *keys, descending=descending)
 
     items = []
     for row in data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'start_date': row[2],
-            'finish_date': row[3],
-            'chief': {
-                'id': row[4],
-                'name': row[5]
-            },
-            'group': {
-                'id': row[6],
-                'name': row[7]
-            }
-        }
-        items.append(item)
-
-    return items
+        items.append(selection.make_item(row))
+
+    return JSONResponse(
+        items, status.HTTP_200_OK, headers={**page.headers, 'ETag': etag}
+    )
 
 
 @router.post('/api/contracts', status_code=status.HTTP_201_CREATED, responses={
@@ -86,17 +140,17 @@ def api_contracts_get_all(
 })
 def api_contracts_create(
     request: schema.CreateContractRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    with db.Session() as session:
-        contract = session.execute(
-            select(Contract).filter_by(name=request.name)
-        ).scalar_one_or_none()
+    contract = session.execute(
+        select(Contract).filter_by(name=request.name)
+    ).scalar_one_or_none()
 
     if contract is not None:
         return JSONResponse(
@@ -114,15 +168,59 @@ def api_contracts_create(
     contract.start_date = request.start_date
     contract.finish_date = request.finish_date
 
-    with db.Session() as session:
-        session.add(contract)
-        session.commit()
+    session.add(contract)
+    session.flush()
 
-        contract_id = contract.id
+    contract_id = contract.id
+    session.commit()
 
     return JSONResponse({'id': contract_id}, status.HTTP_201_CREATED)
 
 
+CONTRACT_PROFILE_PARTS = {
+    'projects': Collection(
+        FieldSet(Project, Project.id, {
+            'id': Project.id,
+            'name': Project.name
+        }),
+        AssociationContractProject.contract_id,
+        joins=(
+            (
+                AssociationContractProject,
+                AssociationContractProject.project_id == Project.id
+            ),
+        )
+    ),
+    'works': Collection(
+        FieldSet(Work, Work.id, {
+            'id': Work.id,
+            'name': Work.name,
+            'cost': Work.cost
+        }),
+        Work.contract_id
+    )
+}
+
+
+def render_contract_profile(session, selection, id):
+    result = fetch_profile(session, selection, id, CONTRACT_PROFILE_PARTS)
+    if result is None:
+        return None
+    return selection.make_profile(*result)
+
+
+def render_contract_profiles(session, selection, ids):
+    return render_profiles(session, selection, ids, CONTRACT_PROFILE_PARTS)
+
+
+expansions.register('contracts', CONTRACT_PROFILE_FIELDS, render_contract_profiles, {
+    'chief': 'users',
+    'group': 'groups',
+    'projects': 'projects',
+    'works': 'works'
+})
+
+
 @router.get('/api/contracts/{id}', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.ContractProfile},
     400: {'model': schema.BadRequestError},
@@ -131,162 +229,48 @@ def api_contracts_create(
     404: {'model': schema.NotFoundError}
 })
 def api_contracts_get_one(
+    request: Request,
     id: int,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Contract.id,
-        Contract.name,
-        Contract.start_date,
-        Contract.finish_date,
-        User.id,
-        User.name,
-        Group.id,
-        Group.name
-    )
-    query = query.join(
-        User,
-        User.id == Contract.chief_id,
-        isouter=True
-    )
-    query = query.join(
-        Group,
-        Group.id == Contract.group_id,
-        isouter=True
-    )
-    query = query.where(Contract.id == id)
-
-    with db.Session() as session:
-        contract_data = session.execute(query).first()
-
-    if contract_data is None:
-        return JSONResponse(
-            {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
-        )
-
-    contract_id, contract_name = contract_data[0:2]
-    contract_start_date, contract_finish_date = contract_data[2:4]
-    chief_id, chief_name, group_id, group_name = contract_data[4:8]
-
-    query = select(
-        Project.id,
-        Project.name
-    )
-    query = query.join(
-        AssociationContractProject,
-        AssociationContractProject.project_id == Project.id,
-        isouter=False
-    )
-    query = query.join(
-        Contract,
-        Contract.id == AssociationContractProject.contract_id,
-        isouter=False
-    )
-    query = query.where(Contract.id == contract_id)
-
-    with db.Session() as session:
-        projects_data = session.execute(query).all()
+    selection = CONTRACT_PROFILE_FIELDS.select(fields)
+    if expand is not None:
+        return expanded_profile(session, 'contracts', selection, id, expand)
 
-    query = select(
-        Work.id,
-        Work.name,
-        Work.cost,
-    )
-    query = query.join(
-        Contract,
-        Contract.id == Work.contract_id,
-        isouter=True
+    return cached_profile(
+        request, session, selection, id, render_contract_profile
     )
-    query = query.join(
-        Project,
-        Project.id == Work.project_id,
-        isouter=True
-    )
-    query = query.where(Contract.id == contract_id)
 
-    with db.Session() as session:
-        works_data = session.execute(query).all()
 
-    query = select(
-        User.id
-    )
-    query = query.join(
-        AssociationUserGroup,
-        AssociationUserGroup.user_id == User.id,
-        isouter=False
-    )
-    query = query.join(
-        Group,
-        Group.id == AssociationUserGroup.group_id,
-        isouter=False
-    )
-    query = query.join(
-        Project,
-        Project.group_id == Group.id,
-        isouter=False
-    )
-    query = query.join(
-        AssociationContractProject,
-        AssociationContractProject.project_id == Project.id,
-        isouter=False
-    )
-    query = query.join(
-        Contract,
-        Contract.id == AssociationContractProject.contract_id,
-        isouter=False
+@router.get('/api/contracts:batch', response_model=dict[int, Optional[schema.ContractProfile]], responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_contracts_get_batch(
+    request: Request,
+    ids: str,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    selection = CONTRACT_PROFILE_FIELDS.select(fields)
+    ids = parse_ids(ids)
+    if expand is not None:
+        profiles = expand_profiles(session, 'contracts', selection, ids, expand)
+        return JSONResponse(profiles, status.HTTP_200_OK)
+
+    etag = make_etag(session, request, batch_keys(selection, ids))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    profiles = render_contract_profiles(session, selection, ids)
+    return JSONResponse(
+        profiles, status.HTTP_200_OK, headers={'ETag': etag}
     )
-    query = query.where(Contract.id == contract_id)
-
-    with db.Session() as session:
-        users_data = session.execute(query).all()
-
-    projects = []
-    for row in projects_data:
-        item = {
-            'id': row[0],
-            'name': row[1]
-        }
-        projects.append(item)
-
-    works = []
-    for row in works_data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'cost': row[2]
-        }
-        works.append(item)
-
-    if contract_start_date is not None:
-        contract_start_date = str(contract_start_date)
-    if contract_finish_date is not None:
-        contract_finish_date = str(contract_finish_date)
-
-    users_number = max(len(users_data), 1)
-    works_total_cost = sum(x['cost'] for x in works)
-    effectivity = works_total_cost / users_number
-
-    response = {
-        'id': contract_id,
-        'name': contract_name,
-        'start_date': contract_start_date,
-        'finish_date': contract_finish_date,
-        'effectivity': effectivity,
-        'works_total_cost': works_total_cost,
-        'users_number': users_number,
-        'chief': {
-            'id': chief_id,
-            'name': chief_name
-        },
-        'group': {
-            'id': group_id,
-            'name': group_name
-        },
-        'projects': projects,
-        'works': works
-    }
-
-    return JSONResponse(response, status.HTTP_200_OK)
 
 
 @router.put('/api/contracts/{id}/chief', status_code=status.HTTP_200_OK, responses={
@@ -299,15 +283,14 @@ def api_contracts_get_one(
 def api_contracts_update_chief(
     id: int,
     request: schema.UserID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     contract = session.query(Contract).get(id)
     chief = session.query(User).get(request.id)
 
@@ -324,7 +307,6 @@ def api_contracts_update_chief(
         unassignment.is_assigned = False
 
         session.add(unassignment)
-        session.commit()
 
     if chief is None:
         contract.chief_id = None
@@ -354,15 +336,14 @@ def api_contracts_update_chief(
 def api_contracts_update_group(
     id: int,
     request: schema.GroupID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     contract = session.query(Contract).get(id)
     group = session.query(Group).get(request.id)
 
@@ -390,15 +371,14 @@ def api_contracts_update_group(
 def api_contracts_update_projects(
     id: int,
     request: schema.ProjectID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     contract = session.query(Contract).get(id)
     project = session.query(Project).get(request.id)
 
@@ -53,6 +53,9 @@ class Contract(BaseModel):
     finish_date: Optional[date] = None
     chief: Chief
     group: Group
+    effectivity: float
+    works_total_cost: float
+    users_number: int
 
 
 class CreateContractRequest(BaseModel):
@@ -2,17 +2,105 @@
 
 import config
 
+import contextlib
+
 import sqlalchemy
 import sqlalchemy.orm as orm
 
+from fastapi import Request
+
 from . import models
+from .filters import name_search
+from .plans import PlanChecker
+from .pool import InstrumentedQueuePool, LeakDetector
 
 
 class Database:
-    def __init__(self, url, echo):
-        engine = sqlalchemy.create_engine(url=url, echo=echo)
+    def __init__(self, url, echo, pool_size, max_overflow, pool_timeout,
+                 pool_recycle, pool_pre_ping, pool_warmup, leak_threshold,
+                 plan_check_rows):
+        engine = sqlalchemy.create_engine(
+            url=url,
+            echo=echo,
+            poolclass=InstrumentedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping
+        )
+        self.engine = engine
         self.Session = orm.sessionmaker(bind=engine)
+        self.leaks = LeakDetector(leak_threshold)
+        self.leaks.attach(engine)
+        self.plans = PlanChecker(plan_check_rows)
+        self.plans.attach(engine)
+        name_search.attach(engine)
         models.Base.metadata.create_all(engine)
+        self.warm_up(pool_warmup)
+
+    def warm_up(self, connections):
+        # Open connections in advance, so first requests do not pay for it
+        opened = []
+        try:
+            for _ in range(min(connections, self.engine.pool.size())):
+                opened.append(self.engine.connect())
+        finally:
+            for connection in opened:
+                connection.close()
+
+    @contextlib.contextmanager
+    def session(self, endpoint=None, read_only=False):
+        # The session and its connection are released on every exit path;
+        # the endpoint is reported by the leak detector
+        with self.Session(info={'endpoint': endpoint}) as session:
+            self.begin(session, read_only)
+            yield session
+
+    def begin(self, session, read_only=False):
+        # One transaction per request: reads see a single consistent snapshot
+        if read_only and self.engine.dialect.name == 'postgresql':
+            session.execute(sqlalchemy.text(
+                'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY'
+            ))
+
+    def pool_stats(self):
+        pool = self.engine.pool
+        stats = pool.stats.snapshot(pool)
+        stats.update({
+            'leak_threshold': self.leaks.threshold,
+            'leaks_detected': self.leaks.detected,
+            'leaks_reclaimed': self.leaks.reclaimed
+        })
+        return stats
+
+
+db = Database(
+    url=config.DB_URL,
+    echo=config.DB_ECHO,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_POOL_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    pool_warmup=config.DB_POOL_WARMUP,
+    leak_threshold=config.DB_LEAK_THRESHOLD,
+    plan_check_rows=config.DB_PLAN_CHECK_ROWS
+)
+
+
+@sqlalchemy.event.listens_for(orm.Session, 'after_begin')
+def _attribute_connection(session, transaction, connection):
+    endpoint = session.info.get('endpoint')
+    if endpoint is not None:
+        connection.info['endpoint'] = endpoint
 
 
-db = Database(url=config.DB_URL, echo=config.DB_ECHO)
+def get_session(request: Request):
+    # Request-scoped session. Safe methods run in a read-only snapshot
+    # transaction, the others in one read-write transaction which the
+    # handler commits; anything not committed is rolled back on close.
+    endpoint = '%s %s' % (request.method, request.url.path)
+    read_only = request.method in ('GET', 'HEAD')
+    with db.session(endpoint, read_only) as session:
+        yield session
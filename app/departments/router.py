@@ -3,11 +3,22 @@
 from typing import Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from app.responses import JSONResponse
 from sqlalchemy import select
-
-from app.db import db
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.filters import name_search
+from app.fields import FieldSet, Relation
+from app.pagination import Page
+from app.streaming import accepts_ndjson, stream_ndjson
+from app.versions import make_etag, etag_matches, not_modified
+from app.versions import batch_keys, selection_keys
+from app.cache import cached_profile
+from app.profiles import Collection, fetch_profile
+from app.profiles import parse_ids, render_profiles
+from app.expand import expansions, expand_profiles, expanded_profile
 from app.models import User, Department, Equipment
 from app.models import AssignmentEquipmentDepartment
 
@@ -17,42 +28,61 @@ from app.departments import schema
 router = APIRouter(tags=['departments'])
 
 
+DEPARTMENT_FIELDS = FieldSet(Department, Department.id, {
+    'id': Department.id,
+    'name': Department.name,
+    'chief': Relation(
+        User,
+        User.id == Department.chief_id,
+        {'id': User.id, 'name': User.name},
+        local={'id': Department.chief_id}
+    )
+})
+
+
+DEPARTMENT_PROFILE_FIELDS = FieldSet(
+    Department, Department.id, DEPARTMENT_FIELDS.fields,
+    extra={
+        'users': (User.department_id,),
+        'equipment': (Equipment.department_id,)
+    }
+)
+
+
 @router.get('/api/departments', response_model=list[schema.Department])
 def api_departments_get_all(
+    request: Request,
     id: Optional[int] = None,
     name: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    page: Page = Depends(Page),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Department.id,
-        Department.name,
-        User.id,
-        User.name
-    )
-    query = query.join(
-        User,
-        User.id == Department.chief_id,
-        isouter=True
-    )
+    selection = DEPARTMENT_FIELDS.select(fields)
+    etag = make_etag(session, request, selection_keys(selection))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = selection.query
     if name is not None and len(name) != 0:
-        query = query.filter(Department.name.ilike(f'%{name}%'))
+        query = query.filter(name_search.filter(Department.name, name))
+
+    if accepts_ndjson(request):
+        return stream_ndjson(
+            request, page.order(query, Department.id), selection.make_item,
+            headers={'ETag': etag}
+        )
 
-    with db.Session() as session:
-        data = session.execute(query).all()
+    data = page.fetch(session, query, Department.id)
 
     items = []
     for row in data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'chief': {
-                'id': row[2],
-                'name': row[3],
-            }
-        }
-        items.append(item)
+        items.append(selection.make_item(row))
 
-    return items
+    return JSONResponse(
+        items, status.HTTP_200_OK, headers={**page.headers, 'ETag': etag}
+    )
 
 
 @router.post('/api/departments', status_code=status.HTTP_201_CREATED, responses={
@@ -63,17 +93,17 @@ def api_departments_get_all(
 })
 def api_departments_create(
     request: schema.CreateDepartmentRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    with db.Session() as session:
-        department = session.execute(
-            select(Department).filter_by(name=request.name)
-        ).scalar_one_or_none()
+    department = session.execute(
+        select(Department).filter_by(name=request.name)
+    ).scalar_one_or_none()
 
     if department is not None:
         return JSONResponse(
@@ -83,15 +113,48 @@ def api_departments_create(
     department = Department()
     department.name = request.name
 
-    with db.Session() as session:
-        session.add(department)
-        session.commit()
+    session.add(department)
+    session.flush()
 
-        department_id = department.id
+    department_id = department.id
+    session.commit()
 
     return JSONResponse({'id': department_id}, status.HTTP_201_CREATED)
 
 
+DEPARTMENT_PROFILE_PARTS = {
+    'users': Collection(
+        FieldSet(User, User.id, {'id': User.id, 'name': User.name}),
+        User.department_id
+    ),
+    'equipment': Collection(
+        FieldSet(Equipment, Equipment.id, {
+            'id': Equipment.id,
+            'name': Equipment.name
+        }),
+        Equipment.department_id
+    )
+}
+
+
+def render_department_profile(session, selection, id):
+    result = fetch_profile(session, selection, id, DEPARTMENT_PROFILE_PARTS)
+    if result is None:
+        return None
+    return selection.make_profile(*result)
+
+
+def render_department_profiles(session, selection, ids):
+    return render_profiles(session, selection, ids, DEPARTMENT_PROFILE_PARTS)
+
+
+expansions.register('departments', DEPARTMENT_PROFILE_FIELDS, render_department_profiles, {
+    'chief': 'users',
+    'users': 'users',
+    'equipment': 'equipment'
+})
+
+
 @router.get('/api/departments/{id}', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.DepartmentProfile},
     400: {'model': schema.BadRequestError},
@@ -100,81 +163,49 @@ def api_departments_create(
     404: {'model': schema.NotFoundError}
 })
 def api_departments_get_one(
+    request: Request,
     id: int,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Department.id,
-        Department.name,
-        User.id,
-        User.name
-    )
-    query = query.join(
-        User,
-        User.id == Department.chief_id,
-        isouter=True
-    )
-    query = query.where(Department.id == id)
-
-    with db.Session() as session:
-        department_data = session.execute(query).first()
-
-    if department_data is None:
-        return JSONResponse(
-            {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
-        )
-
-    department_id, department_name, chief_id, chief_name = department_data
+    selection = DEPARTMENT_PROFILE_FIELDS.select(fields)
+    if expand is not None:
+        return expanded_profile(session, 'departments', selection, id, expand)
 
-    query = select(
-        User.id,
-        User.name
-    ).where(
-        User.department_id == department_id
+    return cached_profile(
+        request, session, selection, id, render_department_profile
     )
 
-    with db.Session() as session:
-        users_data = session.execute(query).all()
 
-    query = select(
-        Equipment.id,
-        Equipment.name
-    ).where(
-        Equipment.department_id == department_id
+@router.get('/api/departments:batch', response_model=dict[int, Optional[schema.DepartmentProfile]], responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_departments_get_batch(
+    request: Request,
+    ids: str,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    selection = DEPARTMENT_PROFILE_FIELDS.select(fields)
+    ids = parse_ids(ids)
+    if expand is not None:
+        profiles = expand_profiles(session, 'departments', selection, ids, expand)
+        return JSONResponse(profiles, status.HTTP_200_OK)
+
+    etag = make_etag(session, request, batch_keys(selection, ids))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    profiles = render_department_profiles(session, selection, ids)
+    return JSONResponse(
+        profiles, status.HTTP_200_OK, headers={'ETag': etag}
     )
 
-    with db.Session() as session:
-        equipment_data = session.execute(query).all()
-
-    users = []
-    for row in users_data:
-        item = {
-            'id': row[0],
-            'name': row[1]
-        }
-        users.append(item)
-
-    equipment = []
-    for row in equipment_data:
-        item = {
-            'id': row[0],
-            'name': row[1]
-        }
-        equipment.append(item)
-
-    response = {
-        'id': department_id,
-        'name': department_name,
-        'chief': {
-            'id': chief_id,
-            'name': chief_name
-        },
-        'users': users,
-        'equipment': equipment
-    }
-
-    return JSONResponse(response, status.HTTP_200_OK)
-
 
 @router.put('/api/departments/{id}/chief', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.OkResponse},
@@ -186,15 +217,14 @@ def api_departments_get_one(
 def api_departments_update_chief(
     id: int,
     request: schema.UserID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     department = session.query(Department).get(id)
     chief = session.query(User).get(request.id)
 
@@ -222,15 +252,14 @@ def api_departments_update_chief(
 def api_departments_update_equipment(
     id: int,
     request: schema.EquipmentID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     department = session.query(Department).get(id)
     equipment = session.query(Equipment).get(request.id)
 
@@ -247,7 +276,6 @@ def api_departments_update_equipment(
         unassignment.is_assigned = False
 
         session.add(unassignment)
-        session.commit()
 
     equipment.department_id = department.id
 
@@ -272,15 +300,14 @@ def api_departments_update_equipment(
 def api_departments_update_users(
     id: int,
     request: schema.UserID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     department = session.query(Department).get(id)
     user = session.query(User).get(request.id)
 
@@ -1,13 +1,26 @@
 # -*- coding: utf-8 -*-
 
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
+from functools import partial
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from app.responses import JSONResponse
 from sqlalchemy import select
-
-from app.db import db
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.filters import name_search
+from app.fields import FieldSet, Relation
+from app.pagination import Page
+from app.streaming import accepts_ndjson, stream_ndjson
+from app.versions import make_etag, etag_matches, not_modified
+from app.versions import batch_keys, selection_keys
+from app.cache import cached_profile
+from app.profiles import Collection, fetch_profile
+from app.profiles import parse_ids, render_profiles
+from app.expand import expansions, expand_profiles, expanded_profile
+from app.history import assigned_on, assigned_pairs
 from app.models import User, Equipment, Department, Group
 from app.models import AssignmentEquipmentDepartment
 from app.models import AssignmentEquipmentGroup
@@ -18,53 +31,92 @@ from app.equipment import schema
 router = APIRouter(tags=['equipment'])
 
 
-@router.get('/api/equipment', response_model=list[schema.Equipment])
-def api_equipment_get_all(
-    id: Optional[int] = None,
-    name: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
-):
-    query = select(
-        Equipment.id,
-        Equipment.name,
-        Department.id,
-        Department.name,
-        Group.id,
-        Group.name
-    )
-    query = query.join(
+EQUIPMENT_FIELDS = FieldSet(Equipment, Equipment.id, {
+    'id': Equipment.id,
+    'name': Equipment.name,
+    'department': Relation(
         Department,
         Department.id == Equipment.department_id,
-        isouter=True
-    )
-    query = query.join(
+        {'id': Department.id, 'name': Department.name},
+        local={'id': Equipment.department_id}
+    ),
+    'group': Relation(
         Group,
         Group.id == Equipment.group_id,
-        isouter=True
+        {'id': Group.id, 'name': Group.name},
+        local={'id': Equipment.group_id}
     )
+})
+
+
+EQUIPMENT_PROFILE_FIELDS = FieldSet(
+    Equipment, Equipment.id, EQUIPMENT_FIELDS.fields,
+    extra={
+        'departments_assignments': (
+            AssignmentEquipmentDepartment.equipment_id, Department
+        ),
+        'groups_assignments': (AssignmentEquipmentGroup.equipment_id, Group)
+    }
+)
+
+
+@router.get('/api/equipment', response_model=list[schema.Equipment])
+def api_equipment_get_all(
+    request: Request,
+    id: Optional[int] = None,
+    name: Optional[str] = None,
+    department_id: Optional[int] = None,
+    group_id: Optional[int] = None,
+    as_of: Optional[date] = None,
+    fields: Optional[str] = None,
+    page: Page = Depends(Page),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    selection = EQUIPMENT_FIELDS.select(fields)
+    keys = selection_keys(selection)
+    if department_id is not None:
+        keys.append(AssignmentEquipmentDepartment.__tablename__)
+    if group_id is not None:
+        keys.append(AssignmentEquipmentGroup.__tablename__)
+    etag = make_etag(session, request, keys)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = selection.query
     if name is not None and len(name) != 0:
-        query = query.filter(Equipment.name.ilike(f'%{name}%'))
+        query = query.filter(name_search.filter(Equipment.name, name))
+    # Equipment assigned to the department or the group now or on the date
+    if department_id is not None:
+        pairs = assigned_pairs(
+            session, AssignmentEquipmentDepartment, as_of
+        ).subquery()
+        query = query.filter(Equipment.id.in_(
+            select(pairs.c.equipment_id).where(
+                pairs.c.department_id == department_id
+            )
+        ))
+    if group_id is not None:
+        pairs = assigned_pairs(session, AssignmentEquipmentGroup, as_of).subquery()
+        query = query.filter(Equipment.id.in_(
+            select(pairs.c.equipment_id).where(pairs.c.group_id == group_id)
+        ))
+
+    if accepts_ndjson(request):
+        return stream_ndjson(
+            request, page.order(query, Equipment.id), selection.make_item,
+            headers={'ETag': etag}
+        )
 
-    with db.Session() as session:
-        data = session.execute(query).all()
+    data = page.fetch(session, query, Equipment.id)
 
     items = []
     for row in data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'department': {
-                'id': row[2],
-                'name': row[3],
-            },
-            'group': {
-                'id': row[4],
-                'name': row[5],
-            }
-        }
-        items.append(item)
-
-    return items
+        items.append(selection.make_item(row))
+
+    return JSONResponse(
+        items, status.HTTP_200_OK, headers={**page.headers, 'ETag': etag}
+    )
 
 
 @router.post('/api/equipment', status_code=status.HTTP_201_CREATED, responses={
@@ -75,17 +127,17 @@ def api_equipment_get_all(
 })
 def api_equipment_create(
     request: schema.CreateEquipmentRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    with db.Session() as session:
-        equipment = session.execute(
-            select(Equipment).filter_by(name=request.name)
-        ).scalar_one_or_none()
+    equipment = session.execute(
+        select(Equipment).filter_by(name=request.name)
+    ).scalar_one_or_none()
 
     if equipment is not None:
         return JSONResponse(
@@ -95,15 +147,80 @@ def api_equipment_create(
     equipment = Equipment()
     equipment.name = request.name
 
-    with db.Session() as session:
-        session.add(equipment)
-        session.commit()
+    session.add(equipment)
+    session.flush()
 
-        equipment_id = equipment.id
+    equipment_id = equipment.id
+    session.commit()
 
     return JSONResponse({'id': equipment_id}, status.HTTP_201_CREATED)
 
 
+EQUIPMENT_PROFILE_PARTS = {
+    'departments_assignments': Collection(
+        FieldSet(AssignmentEquipmentDepartment, AssignmentEquipmentDepartment.id, {
+            'id': AssignmentEquipmentDepartment.id,
+            'assignment_date': AssignmentEquipmentDepartment.assignment_date,
+            'is_assigned': AssignmentEquipmentDepartment.is_assigned,
+            'department': Relation(
+                Department,
+                Department.id == AssignmentEquipmentDepartment.department_id,
+                {'id': Department.id, 'name': Department.name}
+            )
+        }),
+        AssignmentEquipmentDepartment.equipment_id,
+        order_by=(AssignmentEquipmentDepartment.id.desc(),)
+    ),
+    'groups_assignments': Collection(
+        FieldSet(AssignmentEquipmentGroup, AssignmentEquipmentGroup.id, {
+            'id': AssignmentEquipmentGroup.id,
+            'assignment_date': AssignmentEquipmentGroup.assignment_date,
+            'is_assigned': AssignmentEquipmentGroup.is_assigned,
+            'group': Relation(
+                Group,
+                Group.id == AssignmentEquipmentGroup.group_id,
+                {'id': Group.id, 'name': Group.name}
+            )
+        }),
+        AssignmentEquipmentGroup.equipment_id,
+        order_by=(AssignmentEquipmentGroup.id.desc(),)
+    )
+}
+
+
+def equipment_profile_parts(session, as_of):
+    # Assignments in effect on the date instead of the whole log
+    if as_of is None:
+        return EQUIPMENT_PROFILE_PARTS
+    return {
+        'departments_assignments': EQUIPMENT_PROFILE_PARTS['departments_assignments'].filter(
+            assigned_on(session, AssignmentEquipmentDepartment, as_of)
+        ),
+        'groups_assignments': EQUIPMENT_PROFILE_PARTS['groups_assignments'].filter(
+            assigned_on(session, AssignmentEquipmentGroup, as_of)
+        )
+    }
+
+
+def render_equipment_profile(session, selection, id, as_of=None):
+    parts = equipment_profile_parts(session, as_of)
+    result = fetch_profile(session, selection, id, parts)
+    if result is None:
+        return None
+    return selection.make_profile(*result)
+
+
+def render_equipment_profiles(session, selection, ids, as_of=None):
+    parts = equipment_profile_parts(session, as_of)
+    return render_profiles(session, selection, ids, parts)
+
+
+expansions.register('equipment', EQUIPMENT_PROFILE_FIELDS, render_equipment_profiles, {
+    'department': 'departments',
+    'group': 'groups'
+})
+
+
 @router.get('/api/equipment/{id}', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.EquipmentProfile},
     400: {'model': schema.BadRequestError},
@@ -112,132 +229,58 @@ def api_equipment_create(
     404: {'model': schema.NotFoundError}
 })
 def api_equipment_get_one(
+    request: Request,
     id: int,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    as_of: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Equipment.id,
-        Equipment.name,
-        Department.id,
-        Department.name,
-        Group.id,
-        Group.name
-    )
-    query = query.join(
-        Department,
-        Department.id == Equipment.department_id,
-        isouter=True
-    )
-    query = query.join(
-        Group,
-        Group.id == Equipment.group_id,
-        isouter=True
+    selection = EQUIPMENT_PROFILE_FIELDS.select(fields)
+    if expand is not None:
+        return expanded_profile(
+            session, 'equipment', selection, id, expand,
+            partial(render_equipment_profiles, as_of=as_of)
+        )
+
+    return cached_profile(
+        request, session, selection, id,
+        partial(render_equipment_profile, as_of=as_of)
     )
-    query = query.where(Equipment.id == id)
 
-    with db.Session() as session:
-        equipment_data = session.execute(query).first()
 
-    if equipment_data is None:
-        return JSONResponse(
-            {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
+@router.get('/api/equipment:batch', response_model=dict[int, Optional[schema.EquipmentProfile]], responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_equipment_get_batch(
+    request: Request,
+    ids: str,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    as_of: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    selection = EQUIPMENT_PROFILE_FIELDS.select(fields)
+    ids = parse_ids(ids)
+    if expand is not None:
+        profiles = expand_profiles(
+            session, 'equipment', selection, ids, expand,
+            partial(render_equipment_profiles, as_of=as_of)
         )
+        return JSONResponse(profiles, status.HTTP_200_OK)
 
-    equipment_id, equipment_name = equipment_data[0:2]
-    department_id, department_name = equipment_data[2:4]
-    group_id, group_name = equipment_data[4:6]
+    etag = make_etag(session, request, batch_keys(selection, ids))
+    if etag_matches(request, etag):
+        return not_modified(etag)
 
-    query = select(
-        AssignmentEquipmentDepartment.id,
-        AssignmentEquipmentDepartment.assignment_date,
-        AssignmentEquipmentDepartment.is_assigned,
-        Department.id,
-        Department.name
-    )
-    query = query.join(
-        Department,
-        Department.id == AssignmentEquipmentDepartment.department_id,
-        isouter=True
-    )
-    query = query.where(
-        AssignmentEquipmentDepartment.equipment_id == equipment_id
+    profiles = render_equipment_profiles(session, selection, ids, as_of)
+    return JSONResponse(
+        profiles, status.HTTP_200_OK, headers={'ETag': etag}
     )
 
-    with db.Session() as session:
-        departments_assignments_data = session.execute(query).all()
-
-    query = select(
-        AssignmentEquipmentGroup.id,
-        AssignmentEquipmentGroup.assignment_date,
-        AssignmentEquipmentGroup.is_assigned,
-        Group.id,
-        Group.name
-    )
-    query = query.join(
-        Group,
-        Group.id == AssignmentEquipmentGroup.group_id,
-        isouter=True
-    )
-    query = query.where(
-        AssignmentEquipmentGroup.equipment_id == equipment_id
-    )
-
-    with db.Session() as session:
-        groups_assignments_data = session.execute(query).all()
-
-    departments_assignments = []
-    for row in departments_assignments_data:
-        assignment_date = row[1]
-        if assignment_date is not None:
-            assignment_date = str(assignment_date)
-
-        item = {
-            'id': row[0],
-            'assignment_date': assignment_date,
-            'is_assigned': row[2],
-            'department': {
-                'id': row[3],
-                'name': row[4]
-            }
-        }
-        departments_assignments.append(item)
-
-    groups_assignments = []
-    for row in groups_assignments_data:
-        assignment_date = row[1]
-        if assignment_date is not None:
-            assignment_date = str(assignment_date)
-
-        item = {
-            'id': row[0],
-            'assignment_date': assignment_date,
-            'is_assigned': row[2],
-            'group': {
-                'id': row[3],
-                'name': row[4]
-            }
-        }
-        groups_assignments.append(item)
-
-    departments_assignments.sort(key=lambda x: x['id'], reverse=True)
-    groups_assignments.sort(key=lambda x: x['id'], reverse=True)
-
-    response = {
-        'id': equipment_id,
-        'name': equipment_name,
-        'department': {
-            'id': department_id,
-            'name': department_name
-        },
-        'group': {
-            'id': group_id,
-            'name': group_name
-        },
-        'departments_assignments': departments_assignments,
-        'groups_assignments': groups_assignments
-    }
-    return JSONResponse(response, status.HTTP_200_OK)
-
 
 @router.put('/api/equipment/{id}/department', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.OkResponse},
@@ -249,15 +292,14 @@ def api_equipment_get_one(
 def api_equipment_update_department(
     id: int,
     request: schema.DepartmentID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     equipment = session.query(Equipment).get(id)
     department = session.query(Department).get(request.id)
 
@@ -274,7 +316,6 @@ def api_equipment_update_department(
         unassignment.is_assigned = False
 
         session.add(unassignment)
-        session.commit()
 
     if department is None:
         equipment.department_id = None
@@ -304,15 +345,14 @@ def api_equipment_update_department(
 def api_equipment_update_group(
     id: int,
     request: schema.GroupID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     equipment = session.query(Equipment).get(id)
     group = session.query(Group).get(request.id)
 
@@ -329,7 +369,6 @@ def api_equipment_update_group(
         unassignment.is_assigned = False
 
         session.add(unassignment)
-        session.commit()
 
     if group is None:
         equipment.group_id = None
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+from fastapi import status
+
+from app.responses import JSONResponse
+
+
+class InvalidExpandError(Exception):
+    pass
+
+
+class Expansions:
+    # Related entities embedded into profiles in place of their
+    # {'id': ..., 'name': ...} stubs. Every level of the expand tree is
+    # resolved with one batch of profiles per relation, whatever the
+    # number of items.
+    def __init__(self, max_depth, max_items):
+        self.max_depth = max_depth
+        self.max_items = max_items
+        self.entities = {}
+
+    def register(self, entity, fieldset, render, relations):
+        # render(session, selection, ids) returns profiles by id;
+        # relations map profile fields to the entities they refer to
+        self.entities[entity] = (fieldset, render, relations)
+
+    def parse(self, entity, value):
+        # 'projects.works,chief' -> {'projects': {'works': {}}, 'chief': {}}
+        tree = {}
+        for path in value.split(','):
+            names = [x.strip() for x in path.split('.')]
+            if not all(names):
+                raise InvalidExpandError('invalid expand')
+            if len(names) > self.max_depth:
+                raise InvalidExpandError('expand is too deep')
+            node = tree
+            target = entity
+            for name in names:
+                relations = self.entities[target][2]
+                if name not in relations:
+                    raise InvalidExpandError('invalid expand')
+                target = relations[name]
+                node = node.setdefault(name, {})
+        return tree
+
+    def render(self, session, entity, selection, ids):
+        return self.entities[entity][1](session, selection, ids)
+
+    def apply(self, session, entity, items, tree):
+        self.__expand(session, entity, items, tree, [0])
+
+    def __expand(self, session, entity, items, tree, counter):
+        relations = self.entities[entity][2]
+        for name, subtree in tree.items():
+            target = relations[name]
+
+            ids = []
+            for item in items:
+                for stub in self.__stubs(item.get(name)):
+                    ids.append(stub['id'])
+            ids = list(dict.fromkeys(ids))
+            if not ids:
+                continue
+
+            counter[0] += len(ids)
+            if counter[0] > self.max_items:
+                raise InvalidExpandError('too many items to expand')
+
+            fieldset = self.entities[target][0]
+            profiles = self.render(session, target, fieldset.select(), ids)
+            for item in items:
+                value = item.get(name)
+                if isinstance(value, list):
+                    item[name] = [profiles.get(x['id']) or x for x in value]
+                elif value is not None and value.get('id') is not None:
+                    item[name] = profiles.get(value['id']) or value
+
+            if subtree:
+                expanded = [x for x in profiles.values() if x is not None]
+                self.__expand(session, target, expanded, subtree, counter)
+
+    @staticmethod
+    def __stubs(value):
+        if isinstance(value, list):
+            return [x for x in value if x.get('id') is not None]
+        if isinstance(value, dict) and value.get('id') is not None:
+            return [value]
+        return []
+
+
+expansions = Expansions(
+    max_depth=config.EXPAND_MAX_DEPTH,
+    max_items=config.EXPAND_MAX_ITEMS
+)
+
+
+def expand_profiles(session, entity, selection, ids, expand, render=None):
+    # render(session, selection, ids) replaces the registered one for the
+    # requested profiles, e.g. to render them as of a date
+    tree = expansions.parse(entity, expand)
+    if render is None:
+        profiles = expansions.render(session, entity, selection, ids)
+    else:
+        profiles = render(session, selection, ids)
+    items = [x for x in profiles.values() if x is not None]
+    expansions.apply(session, entity, items, tree)
+    return profiles
+
+
+def expanded_profile(session, entity, selection, id, expand, render=None):
+    # Expanded profiles depend on versions of all embedded entities,
+    # so they are neither cached nor tagged
+    profiles = expand_profiles(session, entity, selection, [id], expand, render)
+    profile = profiles[id]
+    if profile is None:
+        return JSONResponse(
+            {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
+        )
+    return JSONResponse(profile, status.HTTP_200_OK)
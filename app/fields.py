@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+from sqlalchemy import select
+
+
+class InvalidFieldsError(Exception):
+    pass
+
+
+class Relation:
+    # Nested object read through an outer join. Fields listed in local are
+    # columns of the base table (e.g. a foreign key as the related id), so
+    # requesting only them does not need the join.
+    def __init__(self, target, onclause, fields, local=None):
+        self.target = target
+        self.onclause = onclause
+        self.fields = fields
+        self.local = local or {}
+
+
+class FieldSet:
+    # Declarative description of the fields an endpoint can return. Fields
+    # are columns of the base table or relations; extra fields stand for
+    # values the handler computes itself (collections, aggregates) and map
+    # to what they are read from: whole models, or foreign key columns
+    # for the rows which refer to the base one. Derived fields are columns
+    # of the base table kept up to date from other tables and map to
+    # these tables the same way.
+    def __init__(self, base, key, fields, extra=None, derived=None):
+        self.base = base
+        self.key = key
+        self.fields = fields
+        self.extra = extra or {}
+        self.derived = derived or {}
+
+    def select(self, fields=None):
+        return Selection(self, parse_fields(fields))
+
+
+def parse_fields(fields):
+    # 'id,name,chief.name' -> {'id': None, 'name': None, 'chief': {'name'}},
+    # None stands for the whole field
+    if fields is None or not fields.strip():
+        return None
+    result = {}
+    for name in fields.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        name, _, subname = name.partition('.')
+        if not subname:
+            result[name] = None
+        elif name not in result:
+            result[name] = {subname}
+        elif result[name] is not None:
+            result[name].add(subname)
+    return result
+
+
+class Selection:
+    def __init__(self, fieldset, requested):
+        self.fieldset = fieldset
+        self.requested = requested
+
+        names = fieldset.fields if requested is None else requested
+        for name, subnames in (requested or {}).items():
+            field = fieldset.fields.get(name)
+            if field is None and name not in fieldset.extra:
+                raise InvalidFieldsError('invalid fields')
+            if subnames is not None:
+                if not isinstance(field, Relation):
+                    raise InvalidFieldsError('invalid fields')
+                if not subnames <= field.fields.keys():
+                    raise InvalidFieldsError('invalid fields')
+
+        # The key is always selected: it is needed to find the row
+        columns = [fieldset.key]
+        joins = []
+        self.plan = []
+        for name, field in fieldset.fields.items():
+            if name not in names:
+                continue
+            if not isinstance(field, Relation):
+                self.plan.append((name, len(columns)))
+                columns.append(field)
+                continue
+
+            subnames = (requested or {}).get(name) or field.fields.keys()
+            subplan = []
+            for subname in field.fields:
+                if subname not in subnames:
+                    continue
+                column = field.local.get(subname)
+                if column is None:
+                    column = field.fields[subname]
+                    if field not in joins:
+                        joins.append(field)
+                subplan.append((subname, len(columns)))
+                columns.append(column)
+            self.plan.append((name, subplan))
+
+        query = select(*columns).select_from(fieldset.base)
+        for relation in joins:
+            query = query.join(
+                relation.target, relation.onclause, isouter=True
+            )
+        self.query = query
+        self.columns = columns
+        self.joins = joins
+
+    def wants(self, name):
+        return self.requested is None or name in self.requested
+
+    @property
+    def dependencies(self):
+        # What the response is read from besides the base row
+        dependencies = [x.target for x in self.joins]
+        for name, sources in self.fieldset.extra.items():
+            if self.wants(name):
+                dependencies.extend(sources)
+        for name, sources in self.fieldset.derived.items():
+            if self.wants(name):
+                dependencies.extend(sources)
+        return dependencies
+
+    def make_item(self, row):
+        item = {}
+        for name, position in self.plan:
+            if isinstance(position, list):
+                item[name] = {
+                    subname: row[x] for subname, x in position
+                }
+            else:
+                item[name] = row[position]
+        return item
+
+    def make_profile(self, row, values):
+        # Item of the row with the extra fields computed by the handler
+        item = self.make_item(row)
+        for name in self.fieldset.extra:
+            if self.wants(name):
+                item[name] = values[name]
+        return item
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+from sqlalchemy import event
+from sqlalchemy import literal
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+from sqlalchemy.types import Boolean
+
+
+class word_similar(ColumnElement):
+    # column %> value: some extent of the column is similar to the value,
+    # served by the gin_trgm_ops index of the column
+    inherit_cache = True
+    type = Boolean()
+    _traverse_internals = [
+        ('column', InternalTraversal.dp_clauseelement),
+        ('value', InternalTraversal.dp_clauseelement)
+    ]
+
+    def __init__(self, column, value):
+        self.column = column
+        self.value = literal(value)
+
+
+@compiles(word_similar)
+def _compile_word_similar(element, compiler, **kw):
+    # Drivers with the format paramstyle need the percent sign doubled,
+    # and the pg8000 dialect does not do it for custom operators
+    operator = '%%>' if compiler.dialect.paramstyle in ('format', 'pyformat') else '%>'
+    return '%s %s %s' % (
+        compiler.process(element.column, **kw),
+        operator,
+        compiler.process(element.value, **kw)
+    )
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class NameSearch:
+    # Substring search on name columns. Patterns of at least three
+    # characters are looked up in the trigram indexes; shorter ones have no
+    # trigrams to look up, so they only match the beginning of names.
+    def __init__(self, min_length, similarity):
+        self.min_length = min_length
+        self.similarity = similarity
+        self.fuzzy = False
+
+    def attach(self, engine):
+        if engine.dialect.name != 'postgresql' or self.similarity <= 0:
+            return
+        self.fuzzy = True
+        similarity = float(self.similarity)
+
+        @event.listens_for(engine, 'connect')
+        def _set_threshold(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(
+                f'SET pg_trgm.word_similarity_threshold = {similarity}'
+            )
+            cursor.close()
+            # Otherwise the setting is lost with the first rollback
+            dbapi_connection.commit()
+
+    def filter(self, column, value):
+        if len(value) < self.min_length:
+            return column.ilike(escape_like(value) + '%', escape='\\')
+        if self.fuzzy:
+            return word_similar(column, value)
+        return column.ilike('%' + escape_like(value) + '%', escape='\\')
+
+
+name_search = NameSearch(
+    min_length=config.SEARCH_MIN_LENGTH,
+    similarity=config.SEARCH_SIMILARITY
+)
@@ -3,11 +3,22 @@
 from typing import Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from app.responses import JSONResponse
 from sqlalchemy import select
-
-from app.db import db
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.filters import name_search
+from app.fields import FieldSet
+from app.pagination import Page
+from app.streaming import accepts_ndjson, stream_ndjson
+from app.versions import make_etag, etag_matches, not_modified
+from app.versions import batch_keys, selection_keys
+from app.cache import cached_profile
+from app.profiles import Collection, fetch_profile
+from app.profiles import parse_ids, render_profiles
+from app.expand import expansions, expand_profiles, expanded_profile
 from app.models import User, Group, Work, Contract, Project, Equipment
 from app.models import AssociationUserGroup
 
@@ -17,31 +28,58 @@ from app.groups import schema
 router = APIRouter(tags=['groups'])
 
 
+GROUP_FIELDS = FieldSet(Group, Group.id, {
+    'id': Group.id,
+    'name': Group.name
+})
+
+
+GROUP_PROFILE_FIELDS = FieldSet(
+    Group, Group.id, GROUP_FIELDS.fields,
+    extra={
+        'users': (AssociationUserGroup.group_id, User),
+        'works': (Work.group_id,),
+        'contracts': (Contract.group_id,),
+        'projects': (Project.group_id,),
+        'equipment': (Equipment.group_id,)
+    }
+)
+
+
 @router.get('/api/groups', response_model=list[schema.Group])
 def api_groups_get_all(
+    request: Request,
     id: Optional[int] = None,
     name: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    page: Page = Depends(Page),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Group.id,
-        Group.name,
-    )
+    selection = GROUP_FIELDS.select(fields)
+    etag = make_etag(session, request, selection_keys(selection))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = selection.query
     if name is not None and len(name) != 0:
-        query = query.filter(Group.name.ilike(f'%{name}%'))
+        query = query.filter(name_search.filter(Group.name, name))
+
+    if accepts_ndjson(request):
+        return stream_ndjson(
+            request, page.order(query, Group.id), selection.make_item,
+            headers={'ETag': etag}
+        )
 
-    with db.Session() as session:
-        data = session.execute(query).all()
+    data = page.fetch(session, query, Group.id)
 
     items = []
     for row in data:
-        item = {
-            'id': row[0],
-            'name': row[1]
-        }
-        items.append(item)
+        items.append(selection.make_item(row))
 
-    return items
+    return JSONResponse(
+        items, status.HTTP_200_OK, headers={**page.headers, 'ETag': etag}
+    )
 
 
 @router.post('/api/groups', status_code=status.HTTP_201_CREATED, responses={
@@ -52,17 +90,17 @@ def api_groups_get_all(
 })
 def api_groups_create(
     request: schema.CreateGroupRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    with db.Session() as session:
-        group = session.execute(
-            select(Group).filter_by(name=request.name)
-        ).scalar_one_or_none()
+    group = session.execute(
+        select(Group).filter_by(name=request.name)
+    ).scalar_one_or_none()
 
     if group is not None:
         return JSONResponse(
@@ -72,15 +110,75 @@ def api_groups_create(
     group = Group()
     group.name = request.name
 
-    with db.Session() as session:
-        session.add(group)
-        session.commit()
+    session.add(group)
+    session.flush()
 
-        group_id = group.id
+    group_id = group.id
+    session.commit()
 
     return JSONResponse({'id': group_id}, status.HTTP_201_CREATED)
 
 
+GROUP_PROFILE_PARTS = {
+    'users': Collection(
+        FieldSet(User, User.id, {'id': User.id, 'name': User.name}),
+        AssociationUserGroup.group_id,
+        joins=(
+            (AssociationUserGroup, AssociationUserGroup.user_id == User.id),
+        )
+    ),
+    'works': Collection(
+        FieldSet(Work, Work.id, {
+            'id': Work.id,
+            'name': Work.name,
+            'cost': Work.cost
+        }),
+        Work.group_id
+    ),
+    'contracts': Collection(
+        FieldSet(Contract, Contract.id, {
+            'id': Contract.id,
+            'name': Contract.name
+        }),
+        Contract.group_id
+    ),
+    'projects': Collection(
+        FieldSet(Project, Project.id, {
+            'id': Project.id,
+            'name': Project.name
+        }),
+        Project.group_id
+    ),
+    'equipment': Collection(
+        FieldSet(Equipment, Equipment.id, {
+            'id': Equipment.id,
+            'name': Equipment.name
+        }),
+        Equipment.group_id
+    )
+}
+
+
+def render_group_profile(session, selection, id):
+    result = fetch_profile(session, selection, id, GROUP_PROFILE_PARTS)
+    if result is None:
+        return None
+    return selection.make_profile(*result)
+
+
+def render_group_profiles(session, selection, ids):
+    return render_profiles(session, selection, ids, GROUP_PROFILE_PARTS)
+
+
+expansions.register('groups', GROUP_PROFILE_FIELDS, render_group_profiles, {
+    'users': 'users',
+    'works': 'works',
+    'contracts': 'contracts',
+    'projects': 'projects',
+    'equipment': 'equipment'
+})
+
+
 @router.get('/api/groups/{id}', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.GroupProfile},
     400: {'model': schema.BadRequestError},
@@ -89,127 +187,48 @@ def api_groups_create(
     404: {'model': schema.NotFoundError}
 })
 def api_groups_get_one(
+    request: Request,
     id: int,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Group.id,
-        Group.name,
-    )
-    query = query.where(Group.id == id)
-
-    with db.Session() as session:
-        group_data = session.execute(query).first()
+    selection = GROUP_PROFILE_FIELDS.select(fields)
+    if expand is not None:
+        return expanded_profile(session, 'groups', selection, id, expand)
 
-    if group_data is None:
-        return JSONResponse(
-            {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
-        )
-
-    group_id, group_name = group_data[0:2]
-
-    query = select(
-        User.id,
-        User.name
-    )
-    query = query.join(
-        AssociationUserGroup,
-        AssociationUserGroup.user_id == User.id,
-        isouter=True
+    return cached_profile(
+        request, session, selection, id, render_group_profile
     )
-    query = query.where(AssociationUserGroup.group_id == group_id)
 
-    with db.Session() as session:
-        users_data = session.execute(query).all()
 
-    query = select(
-        Work.id,
-        Work.name,
-        Work.cost,
-    )
-    query = query.where(Work.group_id == group_id)
-
-    with db.Session() as session:
-        works_data = session.execute(query).all()
-
-    query = select(
-        Contract.id,
-        Contract.name,
-    )
-    query = query.where(Contract.group_id == group_id)
-
-    with db.Session() as session:
-        contracts_data = session.execute(query).all()
-
-    query = select(
-        Project.id,
-        Project.name,
-    )
-    query = query.where(Project.group_id == group_id)
-
-    with db.Session() as session:
-        projects_data = session.execute(query).all()
-
-    query = select(
-        Equipment.id,
-        Equipment.name,
+@router.get('/api/groups:batch', response_model=dict[int, Optional[schema.GroupProfile]], responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_groups_get_batch(
+    request: Request,
+    ids: str,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    selection = GROUP_PROFILE_FIELDS.select(fields)
+    ids = parse_ids(ids)
+    if expand is not None:
+        profiles = expand_profiles(session, 'groups', selection, ids, expand)
+        return JSONResponse(profiles, status.HTTP_200_OK)
+
+    etag = make_etag(session, request, batch_keys(selection, ids))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    profiles = render_group_profiles(session, selection, ids)
+    return JSONResponse(
+        profiles, status.HTTP_200_OK, headers={'ETag': etag}
     )
-    query = query.where(Equipment.group_id == group_id)
-
-    with db.Session() as session:
-        equipment_data = session.execute(query).all()
-
-    users = []
-    for row in users_data:
-        item = {
-            'id': row[0],
-            'name': row[1]
-        }
-        users.append(item)
-
-    works = []
-    for row in works_data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'cost': row[2]
-        }
-        works.append(item)
-
-    contracts = []
-    for row in contracts_data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-        }
-        contracts.append(item)
-
-    projects = []
-    for row in projects_data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-        }
-        projects.append(item)
-
-    equipment = []
-    for row in equipment_data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-        }
-        equipment.append(item)
-
-    response = {
-        'id': group_id,
-        'name': group_name,
-        'users': users,
-        'works': works,
-        'contracts': contracts,
-        'projects': projects,
-        'equipment': equipment
-    }
-    return JSONResponse(response, status.HTTP_200_OK)
 
 
 @router.put('/api/groups/{id}/users', status_code=status.HTTP_200_OK, responses={
@@ -222,15 +241,14 @@ def api_groups_get_one(
 def api_groups_update_users(
     id: int,
     request: schema.UserID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     group = session.query(Group).get(id)
     user = session.query(User).get(request.id)
 
@@ -267,15 +285,14 @@ def api_groups_update_users(
 def api_groups_update_works(
     id: int,
     request: schema.WorkID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     group = session.query(Group).get(id)
     work = session.query(Work).get(request.id)
 
@@ -300,15 +317,14 @@ def api_groups_update_works(
 def api_groups_update_contracts(
     id: int,
     request: schema.ContractID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     group = session.query(Group).get(id)
     contract = session.query(Contract).get(request.id)
 
@@ -333,15 +349,14 @@ def api_groups_update_contracts(
 def api_groups_update_projects(
     id: int,
     request: schema.ProjectID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     group = session.query(Group).get(id)
     project = session.query(Project).get(request.id)
 
@@ -366,15 +381,14 @@ def api_groups_update_projects(
 def api_groups_update_equipment(
     id: int,
     request: schema.EquipmentID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     group = session.query(Group).get(id)
     equipment = session.query(Equipment).get(request.id)
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import multiprocessing
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+from werkzeug.security import check_password_hash
+from werkzeug.security import generate_password_hash
+
+
+class HasherBusyError(Exception):
+    pass
+
+
+def normalize_method(method):
+    # Method string as werkzeug writes it into hashes, with the defaults
+    # of omitted parameters filled in
+    name, *args = method.split(':')
+    try:
+        if name == 'scrypt':
+            n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+            return f'scrypt:{n}:{r}:{p}'
+        if name == 'pbkdf2':
+            hash_name = args[0] if args else 'sha256'
+            iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+            return f'pbkdf2:{hash_name}:{iterations}'
+    except ValueError:
+        pass
+    return method
+
+
+class PasswordHasher:
+    def __init__(self, method, salt_length, workers, queue, timeout):
+        self.method = method
+        self.normalized_method = normalize_method(method)
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        # Jobs that are running or waiting for a worker; the rest is rejected
+        self.__slots = threading.BoundedSemaphore(max(workers, 1) + queue)
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    def hash(self, password):
+        return self.__run(
+            generate_password_hash, password, self.method, self.salt_length
+        )
+
+    def verify(self, password_hash, password):
+        return self.__run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # Werkzeug hashes look like 'method$salt$hash'
+        method, _, rest = password_hash.partition('$')
+        salt, _, _ = rest.partition('$')
+        return (
+            normalize_method(method) != self.normalized_method
+            or len(salt) != self.salt_length
+        )
+
+    def start(self):
+        # Started on application startup, when the daemon threads are
+        # already running: a forked worker could inherit a lock held by one
+        # of them and hang on it. Workers are forked from a forkserver
+        # process which has no threads.
+        if self.workers <= 0:
+            return
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('forkserver')
+                )
+            executor = self.__executor
+        # The forkserver and a worker are started now, not by the first login
+        executor.submit(check_password_hash, '', '').result()
+
+    def stop(self):
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    def __run(self, function, *args):
+        if not self.__slots.acquire(blocking=False):
+            raise HasherBusyError()
+        executor = self.__executor
+        if executor is None:
+            # Without workers or before startup, e.g. the superuser is set
+            # up on import
+            try:
+                return function(*args)
+            finally:
+                self.__slots.release()
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            self.__slots.release()
+            raise
+        # The slot is held until the worker is really done with the job
+        future.add_done_callback(lambda _: self.__slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HasherBusyError()
+
+
+hasher = PasswordHasher(
+    method=config.AUTH_PASSWORD_METHOD,
+    salt_length=config.AUTH_PASSWORD_SALT_LENGTH,
+    workers=config.AUTH_HASHING_WORKERS,
+    queue=config.AUTH_HASHING_QUEUE,
+    timeout=config.AUTH_HASHING_TIMEOUT
+)
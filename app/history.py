@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+from sqlalchemy import and_, or_
+from sqlalchemy import case
+from sqlalchemy import column
+from sqlalchemy import delete
+from sqlalchemy import exists
+from sqlalchemy import func
+from sqlalchemy import literal_column
+from sqlalchemy import select
+from sqlalchemy import table
+from sqlalchemy import text
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import DATERANGE
+from sqlalchemy.orm import aliased
+
+from app.models import AssignmentUserProject, CurrentAssignmentUserProject
+from app.models import AssignmentUserContract, CurrentAssignmentUserContract
+from app.models import AssignmentEquipmentDepartment
+from app.models import CurrentAssignmentEquipmentDepartment
+from app.models import AssignmentEquipmentGroup
+from app.models import CurrentAssignmentEquipmentGroup
+
+# Assignment logs, the columns of their pairs and their current state
+# tables, kept by triggers on PostgreSQL
+ASSIGNMENTS = {
+    AssignmentUserProject: (
+        (AssignmentUserProject.user_id, AssignmentUserProject.project_id),
+        CurrentAssignmentUserProject
+    ),
+    AssignmentUserContract: (
+        (AssignmentUserContract.user_id, AssignmentUserContract.contract_id),
+        CurrentAssignmentUserContract
+    ),
+    AssignmentEquipmentDepartment: (
+        (
+            AssignmentEquipmentDepartment.equipment_id,
+            AssignmentEquipmentDepartment.department_id
+        ),
+        CurrentAssignmentEquipmentDepartment
+    ),
+    AssignmentEquipmentGroup: (
+        (AssignmentEquipmentGroup.equipment_id, AssignmentEquipmentGroup.group_id),
+        CurrentAssignmentEquipmentGroup
+    )
+}
+
+
+def is_postgresql(session):
+    return session.get_bind().dialect.name == 'postgresql'
+
+
+def valid_during(model):
+    # Maintained by triggers and not a part of the models, like the search
+    # vectors: the column is PostgreSQL only
+    return literal_column(f'{model.__tablename__}.valid_during', DATERANGE)
+
+
+def assigned_on(session, model, as_of=None):
+    # Rows of the assignment log which are in effect on the date, or now:
+    # on PostgreSQL a range lookup in the GiST indexes on the pair columns
+    # and valid_during. Elsewhere an assignment is in effect when no later
+    # event of the same pair happened by the date.
+    if is_postgresql(session):
+        if as_of is None:
+            return func.upper_inf(valid_during(model))
+        return valid_during(model).contains(as_of)
+
+    pair, _ = ASSIGNMENTS[model]
+    later = aliased(model)
+    conditions = [model.is_assigned.is_(True)]
+    later_conditions = [
+        *[getattr(later, x.key) == x for x in pair],
+        later.id > model.id
+    ]
+    if as_of is not None:
+        conditions.append(model.assignment_date <= as_of)
+        later_conditions.append(later.assignment_date <= as_of)
+    return and_(*conditions, ~exists().where(*later_conditions))
+
+
+def assigned_pairs(session, model, as_of=None):
+    # Query of the pairs assigned on the date, or now: current assignments
+    # are read from the state table on PostgreSQL
+    pair, current = ASSIGNMENTS[model]
+    if as_of is None and is_postgresql(session):
+        # Plain column condition, matched by the partial indexes
+        return select(*[getattr(current, x.key) for x in pair]).where(
+            current.is_assigned
+        )
+    return select(*pair).where(assigned_on(session, model, as_of))
+
+
+def compact(session, model):
+    # Deletes the events which repeat the state of the previous event of
+    # the same pair, and unassignments of pairs never assigned before;
+    # the state after every event stays the same. Validity intervals of
+    # the assignments followed by deleted events are extended over them.
+    pair, _ = ASSIGNMENTS[model]
+    if is_postgresql(session):
+        # Events inserted meanwhile would close intervals of deleted rows
+        session.execute(text(
+            'LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE' % model.__tablename__
+        ))
+
+    is_assigned = func.coalesce(model.is_assigned, False)
+    events = select(
+        model.id,
+        is_assigned.label('is_assigned'),
+        func.lag(is_assigned).over(
+            partition_by=pair, order_by=model.id
+        ).label('previous')
+    ).subquery()
+    redundant = select(events.c.id).where(or_(
+        events.c.is_assigned == events.c.previous,
+        and_(events.c.previous.is_(None), events.c.is_assigned.is_(False))
+    ))
+    deleted = session.execute(
+        delete(model).where(model.id.in_(redundant)),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+    if deleted and is_postgresql(session):
+        events = select(
+            model.id,
+            model.is_assigned,
+            model.assignment_date,
+            func.lead(model.assignment_date).over(
+                partition_by=pair, order_by=model.id
+            ).label('next_date')
+        ).subquery()
+        interval = func.daterange(events.c.assignment_date, case((
+            events.c.next_date.is_not(None),
+            func.greatest(events.c.assignment_date, events.c.next_date)
+        )))
+        intervals = table(
+            model.__tablename__, column('id'), column('valid_during')
+        )
+        session.execute(
+            update(intervals).where(
+                intervals.c.id == events.c.id,
+                events.c.is_assigned.is_(True),
+                intervals.c.valid_during.is_distinct_from(interval)
+            ).values(valid_during=interval)
+        )
+    return deleted
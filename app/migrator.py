@@ -3,9 +3,141 @@
 import config
 
 from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.sql import text
 
+import hashlib
+import logging
 import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Any constant works, it only has to be the same for all the workers
+ADVISORY_LOCK_KEY = 0x696e7465727374
+ADVISORY_LOCK_POLL_SECONDS = 1
+
+# SQLSTATE of 'lock_not_available', raised when lock_timeout expires
+LOCK_NOT_AVAILABLE = '55P03'
+
+TIMEOUT_PATTERN = re.compile(r'^\d+\s*(us|ms|s|min|h|d)?$')
+OPTIONS_PATTERN = re.compile(r'^\s*--\s*migrate:(.*)$', re.MULTILINE)
+
+# Lock taken by a statement and where the name of the locked table is,
+# from the most to the least specific rule
+NAME = r'([\w."]+)'
+LOCK_LEVELS = [
+    (r'CREATE (UNIQUE )?INDEX CONCURRENTLY', 'SHARE UPDATE EXCLUSIVE', r' ON (ONLY )?' + NAME),
+    (r'CREATE (UNIQUE )?INDEX', 'SHARE', r' ON (ONLY )?' + NAME),
+    (r'DROP INDEX CONCURRENTLY', 'SHARE UPDATE EXCLUSIVE', r'CONCURRENTLY (IF EXISTS )?' + NAME),
+    (r'REINDEX .*CONCURRENTLY', 'SHARE UPDATE EXCLUSIVE', r'CONCURRENTLY ' + NAME),
+    (r'ALTER TABLE .*VALIDATE CONSTRAINT', 'SHARE UPDATE EXCLUSIVE', r'TABLE (IF EXISTS )?(ONLY )?' + NAME),
+    (r'ALTER TABLE (IF EXISTS )?(ONLY )?[\w."]+ ADD CONSTRAINT [\w"]+ FOREIGN KEY',
+     'SHARE ROW EXCLUSIVE', r'TABLE (IF EXISTS )?(ONLY )?' + NAME),
+    (r'(CREATE (OR REPLACE )?|DROP )TRIGGER', 'SHARE ROW EXCLUSIVE', r' ON (ONLY )?' + NAME),
+    (r'(ALTER|DROP|TRUNCATE)( MATERIALIZED)? (TABLE|VIEW|INDEX)', 'ACCESS EXCLUSIVE',
+     r'(TABLE|VIEW|INDEX) (IF EXISTS )?(ONLY )?' + NAME),
+    (r'(REINDEX|CLUSTER|VACUUM FULL)\b', 'ACCESS EXCLUSIVE', r'(TABLE|INDEX|FULL) ' + NAME),
+    (r'CREATE (UNLOGGED )?TABLE .*REFERENCES', 'SHARE ROW EXCLUSIVE', r'REFERENCES ' + NAME),
+    (r'REFRESH MATERIALIZED VIEW CONCURRENTLY', 'EXCLUSIVE', r'CONCURRENTLY ' + NAME),
+    (r'REFRESH MATERIALIZED VIEW', 'ACCESS EXCLUSIVE', r'VIEW ' + NAME),
+    (r'CREATE (OR REPLACE )?(MATERIALIZED )?VIEW', 'ACCESS SHARE', r' FROM ' + NAME),
+    (r'INSERT INTO', 'ROW EXCLUSIVE', r'INTO ' + NAME),
+    (r'UPDATE', 'ROW EXCLUSIVE', r'UPDATE (ONLY )?' + NAME),
+    (r'DELETE FROM', 'ROW EXCLUSIVE', r'FROM (ONLY )?' + NAME),
+    (r'(SELECT|WITH)\b', 'ACCESS SHARE', r' FROM ' + NAME),
+    (r'(CREATE|COMMENT|SET|RESET)\b', 'NONE', None),
+]
+
+
+class MigrationError(Exception):
+    pass
+
+
+def split_statements(query):
+    # Splits on top level semicolons, keeping quoted strings,
+    # comments and $tag$ function bodies intact
+    statements = []
+    start, i, length = 0, 0, len(query)
+    while i < length:
+        char = query[i]
+        if char in ('\'', '"'):
+            i = query.find(char, i + 1)
+            i = length if i == -1 else i + 1
+        elif query.startswith('--', i):
+            i = query.find('\n', i)
+            i = length if i == -1 else i + 1
+        elif query.startswith('/*', i):
+            i = query.find('*/', i + 2)
+            i = length if i == -1 else i + 2
+        elif char == '$':
+            match = re.match(r'\$\w*\$', query[i:])
+            if match is None:
+                i += 1
+                continue
+            i = query.find(match.group(), i + len(match.group()))
+            i = length if i == -1 else i + len(match.group())
+        elif char == ';':
+            statements.append(query[start:i])
+            start = i = i + 1
+        else:
+            i += 1
+    statements.append(query[start:])
+
+    result = []
+    for statement in statements:
+        code = re.sub(r'--[^\n]*', '', statement).strip()
+        if code:
+            result.append(statement.strip())
+    return result
+
+
+def estimate_lock(statement):
+    code = re.sub(r'--[^\n]*', '', statement)
+    code = ' '.join(code.upper().split())
+    for pattern, level, table_pattern in LOCK_LEVELS:
+        if re.match(pattern, code):
+            match = table_pattern and re.search(table_pattern, code)
+            return level, match.groups()[-1].lower() if match else None
+    return 'UNKNOWN', None
+
+
+class Migration:
+    def __init__(self, version, checksum, query):
+        self.version = version
+        self.checksum = checksum
+        self.query = query
+        self.options = {}
+        for line in OPTIONS_PATTERN.findall(query):
+            for option in re.split(r'[\s,]+', line.strip()):
+                if option:
+                    key, _, value = option.partition('=')
+                    self.options[key] = value or True
+
+        for key in ('lock_timeout', 'statement_timeout'):
+            value = self.options.get(key)
+            if value is not None and not TIMEOUT_PATTERN.match(str(value)):
+                raise MigrationError(f'migration {version}: bad {key} {value}')
+
+    @property
+    def transactional(self):
+        return 'no-transaction' not in self.options
+
+    @property
+    def retries(self):
+        return int(self.options.get('retries', 0))
+
+    @property
+    def timeouts(self):
+        return {
+            key: self.options.get(key)
+            for key in ('lock_timeout', 'statement_timeout')
+        }
+
+    def statements(self):
+        return split_statements(self.query)
 
 
 class Migrator:
@@ -16,21 +148,161 @@ class Migrator:
 
     def up(self):
         engine = create_engine(url=self.url, echo=self.echo)
-        with engine.connect() as connection:
-            self.__up(connection)
-            connection.commit()
+        try:
+            with engine.connect() as lock:
+                lock = lock.execution_options(isolation_level='AUTOCOMMIT')
+                self.__lock(lock)
+                try:
+                    with engine.connect() as connection:
+                        self.__up(engine, connection)
+                finally:
+                    self.__unlock(lock)
+        finally:
+            engine.dispose()
+
+    def plan(self):
+        # Pending migrations with the statements and the locks they take
+        engine = create_engine(url=self.url, echo=self.echo)
+        try:
+            with engine.connect() as connection:
+                applied = self.__applied(connection)
+        finally:
+            engine.dispose()
+
+        return [
+            (migration, [(x, *estimate_lock(x)) for x in migration.statements()])
+            for migration in self.pending(applied)
+        ]
 
-    def __up(self, connection):
-        for filename in os.listdir(self.migrations):
+    def pending(self, applied):
+        items = []
+        for filename in sorted(os.listdir(self.migrations)):
             if not filename.endswith('.up.sql'):
                 continue
+            version = filename[:-len('.up.sql')]
             with open(os.path.join(self.migrations, filename)) as file:
-                query = text(file.read())
-            try:
-                connection.execute(query)
-            except Exception as error:
-                print(error.with_traceback(None))
+                query = file.read()
+            checksum = hashlib.sha256(query.encode('utf-8')).hexdigest()
+            if version in applied:
+                if applied[version] != checksum:
+                    raise MigrationError(
+                        f'migration {filename} was changed after it was applied'
+                    )
+                continue
+            items.append(Migration(version, checksum, query))
+        return items
+
+    def __up(self, engine, connection):
+        self.__create_ledger(connection)
+        applied = self.__applied(connection)
+
+        for migration in self.pending(applied):
+            attempt = 0
+            while True:
+                logger.info('Applying migration %s', migration.version)
+                try:
+                    if migration.transactional:
+                        self.__apply(connection, migration)
+                    else:
+                        self.__apply_non_transactional(engine, connection, migration)
+                    break
+                except DBAPIError as error:
+                    connection.rollback()
+                    if not _is_lock_timeout(error) or attempt >= migration.retries:
+                        raise MigrationError(
+                            f'migration {migration.version} failed'
+                        ) from error
+                    attempt += 1
+                    delay = min(2 ** attempt, 60)
+                    logger.warning(
+                        'Migration %s timed out waiting for a lock, '
+                        'retry %d of %d in %ds',
+                        migration.version, attempt, migration.retries, delay
+                    )
+                    time.sleep(delay)
+
+    def __apply(self, connection, migration):
+        if connection.dialect.name == 'postgresql':
+            for key, value in migration.timeouts.items():
+                if value is not None:
+                    connection.exec_driver_sql(f"SET LOCAL {key} = '{value}'")
+        connection.exec_driver_sql(migration.query)
+        self.__record(connection, migration)
+        connection.commit()
+
+    def __apply_non_transactional(self, engine, connection, migration):
+        # Statements like CREATE INDEX CONCURRENTLY can not run inside a
+        # transaction block, so every statement is committed on its own.
+        # They must be safe to run again, a retry starts from the first one.
+        with engine.connect() as autocommit:
+            autocommit = autocommit.execution_options(isolation_level='AUTOCOMMIT')
+            if autocommit.dialect.name == 'postgresql':
+                for key, value in migration.timeouts.items():
+                    value = 'DEFAULT' if value is None else f"'{value}'"
+                    autocommit.exec_driver_sql(f'SET {key} = {value}')
+            for statement in migration.statements():
+                autocommit.exec_driver_sql(statement)
+        self.__record(connection, migration)
+        connection.commit()
+
+    def __record(self, connection, migration):
+        connection.execute(
+            text(
+                'INSERT INTO schema_migrations (version, checksum) '
+                'VALUES (:version, :checksum)'
+            ),
+            {'version': migration.version, 'checksum': migration.checksum}
+        )
+
+    def __applied(self, connection):
+        if not inspect(connection).has_table('schema_migrations'):
+            return {}
+        applied = dict(connection.execute(
+            text('SELECT version, checksum FROM schema_migrations')
+        ).all())
+        connection.commit()
+        return applied
+
+    def __create_ledger(self, connection):
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            '    version VARCHAR(255) NOT NULL,'
+            '    checksum VARCHAR(64) NOT NULL,'
+            '    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,'
+            '    CONSTRAINT schema_migration_pk PRIMARY KEY (version)'
+            ')'
+        ))
+        connection.commit()
+
+    def __lock(self, connection):
+        # Session-level lock, so only one worker migrates and the others
+        # wait for it and then find nothing left to apply. The lock is held
+        # by an autocommit connection of its own and polled for: a worker
+        # blocked in pg_advisory_lock would hold a snapshot, which CREATE
+        # INDEX CONCURRENTLY of the migrating worker waits for.
+        if connection.dialect.name != 'postgresql':
+            return
+        while not connection.execute(
+            text('SELECT pg_try_advisory_lock(:key)'), {'key': ADVISORY_LOCK_KEY}
+        ).scalar():
+            time.sleep(ADVISORY_LOCK_POLL_SECONDS)
+
+    def __unlock(self, connection):
+        if connection.dialect.name != 'postgresql':
+            return
+        connection.execute(
+            text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK_KEY}
+        )
+
+
+def _is_lock_timeout(error):
+    orig = getattr(error, 'orig', None)
+    code = getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)
+    if code is None and orig is not None and orig.args:
+        # pg8000 passes the server response fields as a dict, 'C' is SQLSTATE
+        fields = orig.args[0]
+        code = fields.get('C') if isinstance(fields, dict) else None
+    return code == LOCK_NOT_AVAILABLE
 
 
 migrator = Migrator(config.DB_URL, config.DB_ECHO, config.DB_MIGRATIONS)
-migrator.up()
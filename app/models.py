@@ -2,20 +2,26 @@
 
 from sqlalchemy import Column
 from sqlalchemy import Integer
+from sqlalchemy import BigInteger
 from sqlalchemy import String
 from sqlalchemy import Boolean
 from sqlalchemy import Date
+from sqlalchemy import DateTime
 from sqlalchemy import Double
+from sqlalchemy import Computed
+from sqlalchemy import text
 
 from sqlalchemy import PrimaryKeyConstraint
 from sqlalchemy import ForeignKeyConstraint
 from sqlalchemy import UniqueConstraint
-
-from werkzeug.security import check_password_hash
-from werkzeug.security import generate_password_hash
+from sqlalchemy import Index
 
 from sqlalchemy.ext.declarative import declarative_base
 
+from datetime import datetime
+
+from app.hashing import hasher
+
 Base = declarative_base()
 
 
@@ -27,6 +33,8 @@ class User(Base):
     password_hash = Column(String(512), nullable=False)
     is_superuser = Column(Boolean, nullable=False, default=False)
     is_admin = Column(Boolean, nullable=False, default=False)
+    # Bumped whenever tokens issued for the user must stop being accepted
+    security_version = Column(Integer, nullable=False, default=0)
 
     name = Column(String(255), nullable=True)
     birthdate = Column(Date, nullable=True)
@@ -42,14 +50,72 @@ class User(Base):
             ondelete='SET NULL',
             onupdate='CASCADE',
             name='user_department_department_fk'
-        )
+        ),
+        Index('user_department_idx', 'department_id'),
+        Index(
+            'user_name_trgm_idx',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
     )
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return hasher.needs_rehash(self.password_hash)
+
+
+class TokenRevocation(Base):
+    __tablename__ = 'token_revocations'
+
+    id = Column(Integer, autoincrement=True)
+    user_id = Column(Integer, nullable=False)
+    security_version = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('id', name='token_revocation_pk'),
+        Index('token_revocation_created_idx', 'created_at'),
+    )
+
+
+class EntityVersion(Base):
+    __tablename__ = 'entity_versions'
+
+    key = Column(String, nullable=False)
+    version = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('key', name='entity_version_pk'),
+    )
+
+
+class EntityVersionDelta(Base):
+    __tablename__ = 'entity_version_deltas'
+
+    id = Column(BigInteger, autoincrement=True)
+    key = Column(String, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('id', name='entity_version_delta_pk'),
+        Index('entity_version_delta_key_idx', 'key'),
+    )
+
+
+class AnalyticsRefresh(Base):
+    __tablename__ = 'analytics_refreshes'
+
+    name = Column(String, nullable=False)
+    refreshed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('name', name='analytics_refresh_pk'),
+    )
 
 
 class Designer(Base):
@@ -145,7 +211,13 @@ class Department(Base):
         ),
         PrimaryKeyConstraint('id', name='department_pk'),
         UniqueConstraint('chief_id', name='department_chief_unique'),
-        UniqueConstraint('name', name='department_name_unique')
+        UniqueConstraint('name', name='department_name_unique'),
+        Index(
+            'department_name_trgm_idx',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
     )
 
 
@@ -160,6 +232,16 @@ class Contract(Base):
     start_date = Column(Date, nullable=True)
     finish_date = Column(Date, nullable=True)
 
+    # Maintained by triggers from works, contract projects and members of
+    # their groups
+    works_total_cost = Column(Double, nullable=False, server_default='0')
+    users_number = Column(Integer, nullable=False, server_default='0')
+    effectivity = Column(Double, Computed(
+        'works_total_cost / '
+        'CASE WHEN users_number > 1 THEN users_number ELSE 1 END',
+        persisted=True
+    ))
+
     __table_args__ = (
         PrimaryKeyConstraint('id', name='contract_pk'),
         ForeignKeyConstraint(
@@ -176,6 +258,14 @@ class Contract(Base):
             onupdate='CASCADE',
             name='contract_group_fk'
         ),
+        Index('contract_group_idx', 'group_id'),
+        Index('contract_effectivity_idx', 'effectivity', 'id'),
+        Index(
+            'contract_name_trgm_idx',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
     )
 
 
@@ -206,6 +296,13 @@ class Project(Base):
             onupdate='CASCADE',
             name='project_group_fk'
         ),
+        Index('project_group_idx', 'group_id'),
+        Index(
+            'project_name_trgm_idx',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
     )
 
 
@@ -233,6 +330,14 @@ class Equipment(Base):
             onupdate='CASCADE',
             name='equipment_group_fk'
         ),
+        Index('equipment_department_idx', 'department_id'),
+        Index('equipment_group_idx', 'group_id'),
+        Index(
+            'equipment_name_trgm_idx',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
     )
 
 
@@ -271,6 +376,15 @@ class Work(Base):
             onupdate='CASCADE',
             name='work_group_fk'
         ),
+        Index('work_contract_idx', 'contract_id'),
+        Index('work_project_idx', 'project_id'),
+        Index('work_group_idx', 'group_id'),
+        Index(
+            'work_name_trgm_idx',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
     )
 
 
@@ -282,6 +396,12 @@ class Group(Base):
 
     __table_args__ = (
         PrimaryKeyConstraint('id', name='group_pk'),
+        Index(
+            'group_name_trgm_idx',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
     )
 
 
@@ -308,6 +428,8 @@ class AssociationContractProject(Base):
             onupdate='CASCADE',
             name='association_contract_project_project_fk'
         ),
+        Index('association_contract_project_contract_idx', 'contract_id'),
+        Index('association_contract_project_project_idx', 'project_id'),
     )
 
 
@@ -334,6 +456,8 @@ class AssociationUserGroup(Base):
             onupdate='CASCADE',
             name='association_user_group_group_fk'
         ),
+        Index('association_user_group_user_idx', 'user_id'),
+        Index('association_user_group_group_idx', 'group_id'),
     )
 
 
@@ -363,6 +487,8 @@ class AssignmentUserProject(Base):
             onupdate='CASCADE',
             name='assignment_user_project_project_fk'
         ),
+        Index('assignment_user_project_user_idx', 'user_id', id.desc()),
+        Index('assignment_user_project_project_idx', 'project_id'),
     )
 
 
@@ -392,6 +518,8 @@ class AssignmentUserContract(Base):
             onupdate='CASCADE',
             name='assignment_user_contract_contract_fk'
         ),
+        Index('assignment_user_contract_user_idx', 'user_id', id.desc()),
+        Index('assignment_user_contract_contract_idx', 'contract_id'),
     )
 
 
@@ -421,6 +549,8 @@ class AssignmentEquipmentDepartment(Base):
             onupdate='CASCADE',
             name='assignment_equipment_department_department_fk'
         ),
+        Index('assignment_equipment_department_equipment_idx', 'equipment_id', id.desc()),
+        Index('assignment_equipment_department_department_idx', 'department_id'),
     )
 
 
@@ -450,4 +580,146 @@ class AssignmentEquipmentGroup(Base):
             onupdate='CASCADE',
             name='assignment_equipment_group_group_fk'
         ),
+        Index('assignment_equipment_group_equipment_idx', 'equipment_id', id.desc()),
+        Index('assignment_equipment_group_group_idx', 'group_id'),
+    )
+
+
+class CurrentAssignmentUserProject(Base):
+    # Last state of every pair of the assignments_user_project log, kept by triggers
+    __tablename__ = 'current_assignments_user_project'
+
+    user_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False)
+
+    assignment_date = Column(Date, nullable=True)
+    is_assigned = Column(Boolean, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            'user_id', 'project_id', name='current_assignment_user_project_pk'
+        ),
+        ForeignKeyConstraint(
+            ['user_id'],
+            ['users.id'],
+            ondelete='CASCADE',
+            onupdate='CASCADE',
+            name='current_assignment_user_project_user_fk'
+        ),
+        ForeignKeyConstraint(
+            ['project_id'],
+            ['projects.id'],
+            ondelete='CASCADE',
+            onupdate='CASCADE',
+            name='current_assignment_user_project_project_fk'
+        ),
+        Index(
+            'current_assignment_user_project_project_idx', 'project_id', 'user_id',
+            postgresql_where=text('is_assigned')
+        ),
+    )
+
+
+class CurrentAssignmentUserContract(Base):
+    # Last state of every pair of the assignments_user_contract log, kept by triggers
+    __tablename__ = 'current_assignments_user_contract'
+
+    user_id = Column(Integer, nullable=False)
+    contract_id = Column(Integer, nullable=False)
+
+    assignment_date = Column(Date, nullable=True)
+    is_assigned = Column(Boolean, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            'user_id', 'contract_id', name='current_assignment_user_contract_pk'
+        ),
+        ForeignKeyConstraint(
+            ['user_id'],
+            ['users.id'],
+            ondelete='CASCADE',
+            onupdate='CASCADE',
+            name='current_assignment_user_contract_user_fk'
+        ),
+        ForeignKeyConstraint(
+            ['contract_id'],
+            ['contracts.id'],
+            ondelete='CASCADE',
+            onupdate='CASCADE',
+            name='current_assignment_user_contract_contract_fk'
+        ),
+        Index(
+            'current_assignment_user_contract_contract_idx', 'contract_id', 'user_id',
+            postgresql_where=text('is_assigned')
+        ),
+    )
+
+
+class CurrentAssignmentEquipmentDepartment(Base):
+    # Last state of every pair of the assignments_equipment_department log, kept by triggers
+    __tablename__ = 'current_assignments_equipment_department'
+
+    equipment_id = Column(Integer, nullable=False)
+    department_id = Column(Integer, nullable=False)
+
+    assignment_date = Column(Date, nullable=True)
+    is_assigned = Column(Boolean, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            'equipment_id', 'department_id', name='current_assignment_equipment_department_pk'
+        ),
+        ForeignKeyConstraint(
+            ['equipment_id'],
+            ['equipment.id'],
+            ondelete='CASCADE',
+            onupdate='CASCADE',
+            name='current_assignment_equipment_department_equipment_fk'
+        ),
+        ForeignKeyConstraint(
+            ['department_id'],
+            ['departments.id'],
+            ondelete='CASCADE',
+            onupdate='CASCADE',
+            name='current_assignment_equipment_department_department_fk'
+        ),
+        Index(
+            'current_assignment_equipment_department_department_idx', 'department_id', 'equipment_id',
+            postgresql_where=text('is_assigned')
+        ),
+    )
+
+
+class CurrentAssignmentEquipmentGroup(Base):
+    # Last state of every pair of the assignments_equipment_group log, kept by triggers
+    __tablename__ = 'current_assignments_equipment_group'
+
+    equipment_id = Column(Integer, nullable=False)
+    group_id = Column(Integer, nullable=False)
+
+    assignment_date = Column(Date, nullable=True)
+    is_assigned = Column(Boolean, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            'equipment_id', 'group_id', name='current_assignment_equipment_group_pk'
+        ),
+        ForeignKeyConstraint(
+            ['equipment_id'],
+            ['equipment.id'],
+            ondelete='CASCADE',
+            onupdate='CASCADE',
+            name='current_assignment_equipment_group_equipment_fk'
+        ),
+        ForeignKeyConstraint(
+            ['group_id'],
+            ['groups.id'],
+            ondelete='CASCADE',
+            onupdate='CASCADE',
+            name='current_assignment_equipment_group_group_fk'
+        ),
+        Index(
+            'current_assignment_equipment_group_group_idx', 'group_id', 'equipment_id',
+            postgresql_where=text('is_assigned')
+        ),
     )
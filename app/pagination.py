@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import base64
+import binascii
+import json
+
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy import tuple_
+
+
+class InvalidPageError(Exception):
+    pass
+
+
+def encode_cursor(values):
+    data = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, ValueError):
+        raise InvalidPageError('invalid cursor')
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidPageError('invalid cursor')
+    # Cursors come from clients: values of other types than the keys
+    # would fail in the database
+    for key, value in zip(keys, values):
+        if not cursor_value_fits(key, value):
+            raise InvalidPageError('invalid cursor')
+    return values
+
+
+def cursor_value_fits(key, value):
+    if value is None:
+        return getattr(key, 'nullable', True)
+    if isinstance(value, bool):
+        return False
+    try:
+        python_type = key.type.python_type
+    except NotImplementedError:
+        return isinstance(value, (int, float, str))
+    if python_type is float:
+        return isinstance(value, (int, float))
+    if python_type in (int, str):
+        return isinstance(value, python_type)
+    return False
+
+
+class Page:
+    # Keyset pagination: rows are ordered by indexed key columns and the
+    # opaque cursor holds the keys of the last returned row, so every page
+    # is an index range scan no matter how deep it is
+
+    def __init__(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        count: bool = False
+    ):
+        if limit is None:
+            limit = config.PAGE_DEFAULT_LIMIT
+        if limit < 1 or limit > config.PAGE_MAX_LIMIT:
+            raise InvalidPageError('invalid limit')
+        self.limit = limit
+        self.after = after
+        self.count = count
+        self.next_cursor = None
+        self.total = None
+        self.estimated = False
+
+    def fetch(self, session, query, *keys, descending=False):
+        if self.count:
+            self.total, self.estimated = count_rows(session, query, keys[0].table)
+
+        query = self.order(query, *keys, descending=descending)
+        query = query.limit(self.limit + 1)
+
+        data = session.execute(query).all()
+        if len(data) > self.limit:
+            data = data[:self.limit]
+            self.next_cursor = encode_cursor(data[-1][-len(keys):])
+        return data
+
+    def order(self, query, *keys, descending=False):
+        # Key columns are appended to the selected ones,
+        # so positions of the selected columns do not change.
+        # All the keys go in one direction: a descending page is
+        # a backward scan of the same index.
+        query = query.add_columns(*keys)
+        if self.after is not None:
+            values = decode_cursor(self.after, keys)
+            if len(keys) == 1:
+                left, right = keys[0], values[0]
+            else:
+                left, right = tuple_(*keys), tuple_(*values)
+            query = query.where(left < right if descending else left > right)
+        if descending:
+            return query.order_by(*[x.desc() for x in keys])
+        return query.order_by(*keys)
+
+    @property
+    def headers(self):
+        headers = {}
+        if self.next_cursor is not None:
+            headers['X-Next-Cursor'] = self.next_cursor
+        if self.total is not None:
+            headers['X-Total-Count'] = str(self.total)
+            if self.estimated:
+                headers['X-Total-Count-Estimated'] = 'true'
+        return headers
+
+
+def parse_sort(value, keys):
+    # 'name' or '-name' of one of the keysets -> (key columns, descending)
+    descending = value.startswith('-')
+    columns = keys.get(value[1:] if descending else value)
+    if columns is None:
+        raise InvalidPageError('invalid sort')
+    return columns, descending
+
+
+def count_rows(session, query, table):
+    # Exact counts read every matching row. When the planner expects more
+    # rows than PAGE_EXACT_COUNT_MAX its estimate is returned instead.
+    if session.get_bind().dialect.name == 'postgresql':
+        if query.whereclause is None:
+            estimate = session.execute(
+                text('SELECT reltuples FROM pg_class WHERE oid = CAST(:name AS regclass)'),
+                {'name': table.name}
+            ).scalar()
+        else:
+            estimate = estimate_rows(session, query)
+        # Tables which were never analyzed have no estimate
+        if estimate is not None and estimate > config.PAGE_EXACT_COUNT_MAX:
+            return int(estimate), True
+
+    query = select(func.count()).select_from(query.subquery())
+    return session.execute(query).scalar(), False
+
+
+def estimate_rows(session, query):
+    connection = session.connection()
+    compiled = query.compile(
+        dialect=connection.dialect,
+        compile_kwargs={'render_postcompile': True}
+    )
+    parameters = tuple(compiled.params[x] for x in compiled.positiontup or ())
+    plan = connection.exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + compiled.string, parameters
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import threading
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+class PlanChecker:
+    # Explains every SELECT before it runs and reports sequential scans
+    # expected to read more rows than the threshold. It doubles the number
+    # of round trips, so it is meant for checks against a seeded database.
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.checked = 0
+        self.__regressions = {}
+        self.__lock = threading.Lock()
+
+    def attach(self, engine):
+        if engine.dialect.name != 'postgresql':
+            return
+        event.listen(engine, 'before_cursor_execute', self.__on_execute)
+
+    def regressions(self):
+        with self.__lock:
+            return [
+                {
+                    'relation': relation,
+                    'rows': rows,
+                    'endpoint': endpoint,
+                    'statement': statement
+                }
+                for (relation, statement), (rows, endpoint)
+                in self.__regressions.items()
+            ]
+
+    def reset(self):
+        with self.__lock:
+            self.checked = 0
+            self.__regressions.clear()
+
+    def __on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.threshold <= 0 or executemany:
+            return
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return
+
+        explain = conn.connection.dbapi_connection.cursor()
+        try:
+            explain.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+            plan = explain.fetchone()[0]
+        finally:
+            explain.close()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        endpoint = conn.info.get('endpoint', 'unknown endpoint')
+        scans = list(_seq_scans(plan[0]['Plan']))
+        with self.__lock:
+            self.checked += 1
+            for relation, rows in scans:
+                if rows <= self.threshold:
+                    continue
+                key = (relation, ' '.join(statement.split()))
+                if key not in self.__regressions:
+                    logger.warning(
+                        'Sequential scan of %s (%d rows) in %s:\n%s',
+                        relation, rows, endpoint, statement
+                    )
+                self.__regressions[key] = (rows, endpoint)
+
+
+def _seq_scans(node):
+    if node['Node Type'] == 'Seq Scan':
+        yield node['Relation Name'], node['Plan Rows']
+    for child in node.get('Plans', ()):
+        yield from _seq_scans(child)
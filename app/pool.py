@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames of the stack kept for every checkout
+LEAK_STACK_LIMIT = 30
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.checkout_time_total = 0.0
+        self.checkout_time_max = 0.0
+        self.__lock = threading.Lock()
+
+    def record_checkout(self, seconds, timed_out=False):
+        with self.__lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.checkout_time_total += seconds
+            self.checkout_time_max = max(self.checkout_time_max, seconds)
+
+    def snapshot(self, pool):
+        with self.__lock:
+            checkouts = self.checkouts
+            return {
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': max(pool.overflow(), 0),
+                'max_overflow': pool._max_overflow,
+                'checkouts': checkouts,
+                'timeouts': self.timeouts,
+                'checkout_time_avg_ms': (
+                    self.checkout_time_total / checkouts * 1000
+                    if checkouts else 0.0
+                ),
+                'checkout_time_max_ms': self.checkout_time_max * 1000
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool which measures how long callers wait for a connection
+
+    def __init__(self, creator, stats=None, **kwargs):
+        super().__init__(creator, **kwargs)
+        self.stats = stats if stats is not None else PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_checkout(time.perf_counter() - started, True)
+            raise
+        self.stats.record_checkout(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class LeakDetector:
+    # Reports connections checked out for longer than the threshold together
+    # with the endpoint and the stack which acquired them
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.detected = 0
+        self.reclaimed = 0
+        self.__held = {}
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    def attach(self, engine):
+        if self.threshold <= 0:
+            return
+        event.listen(engine, 'checkout', self.__on_checkout)
+        event.listen(engine, 'checkin', self.__on_checkin)
+        self.__thread = threading.Thread(
+            target=self.__watch, name='db-leak-detector', daemon=True
+        )
+        self.__thread.start()
+
+    def held(self):
+        with self.__lock:
+            return len(self.__held)
+
+    def check(self):
+        now = time.monotonic()
+        with self.__lock:
+            leaked = [
+                (record, item) for record, item in self.__held.items()
+                if not item[2] and now - item[0] > self.threshold
+            ]
+            for _, item in leaked:
+                item[2] = True
+            self.detected += len(leaked)
+
+        for record, item in leaked:
+            logger.warning(
+                'Connection held for %.1fs by %s, acquired at:\n%s',
+                now - item[0],
+                record.info.get('endpoint', 'unknown endpoint'),
+                ''.join(traceback.format_list([
+                    x for x in item[1] if '/sqlalchemy/' not in x.filename
+                ]))
+            )
+
+    def __on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        # File names and lines only: a frame would keep the locals of the
+        # callers alive, the leaked session among them, and it would never
+        # be collected and returned to the pool. Source lines are read for
+        # leaks only.
+        stack = traceback.StackSummary.extract(
+            traceback.walk_stack(sys._getframe(1)),
+            limit=LEAK_STACK_LIMIT,
+            lookup_lines=False
+        )
+        stack.reverse()
+        with self.__lock:
+            self.__held[connection_record] = [time.monotonic(), stack, False]
+
+    def __on_checkin(self, dbapi_connection, connection_record):
+        endpoint = connection_record.info.pop('endpoint', None)
+        with self.__lock:
+            item = self.__held.pop(connection_record, None)
+            if item is None or not item[2]:
+                return
+            self.reclaimed += 1
+        logger.warning(
+            'Leaked connection of %s returned to the pool after %.1fs',
+            endpoint or 'unknown endpoint', time.monotonic() - item[0]
+        )
+
+    def __watch(self):
+        interval = max(self.threshold / 2, 1)
+        while True:
+            time.sleep(interval)
+            self.check()
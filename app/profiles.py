@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+from sqlalchemy import func
+from sqlalchemy import literal_column
+from sqlalchemy import true
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from app.fields import Selection
+
+
+class InvalidIdsError(Exception):
+    pass
+
+
+EMPTY_ARRAY = literal_column("'[]'::json", type_=postgresql.JSON)
+
+
+def json_key(name):
+    return literal_column(f"'{name}'")
+
+
+def json_object(selection):
+    # json_build_object with the same shape as selection.make_item
+    arguments = []
+    for name, position in selection.plan:
+        if isinstance(position, list):
+            value = func.json_build_object(*[
+                x for subname, column in position
+                for x in (json_key(subname), selection.columns[column])
+            ])
+        else:
+            value = selection.columns[position]
+        arguments.extend((json_key(name), value))
+    return func.json_build_object(*arguments)
+
+
+class Collection:
+    # Rows referring to the profile row through the key column, rendered
+    # as a list of fieldset items. Joins are (target, onclause) pairs
+    # of tables the rows are found through.
+    def __init__(self, fieldset, key, joins=(), order_by=None, where=()):
+        self.fieldset = fieldset
+        self.key = key
+        self.joins = joins
+        self.order_by = order_by or (fieldset.key,)
+        self.where = where
+
+    def filter(self, *conditions):
+        return Collection(
+            self.fieldset, self.key, self.joins, self.order_by,
+            (*self.where, *conditions)
+        )
+
+    def query(self):
+        selection = self.fieldset.select()
+        query = selection.query
+        for target, onclause in self.joins:
+            query = query.join(target, onclause)
+        return selection, query.where(*self.where)
+
+    def fetch(self, session, id):
+        selection, query = self.query()
+        query = query.where(self.key == id).order_by(*self.order_by)
+        data = session.execute(query).all()
+        return [selection.make_item(row) for row in data]
+
+    def fetch_many(self, session, ids):
+        # The key column goes last, so positions of the item columns
+        # do not change
+        selection, query = self.query()
+        query = query.add_columns(self.key).where(self.key.in_(ids))
+        data = session.execute(query.order_by(*self.order_by)).all()
+        items = {x: [] for x in ids}
+        for row in data:
+            items[row[-1]].append(selection.make_item(row))
+        return items
+
+    def lateral(self, key):
+        selection, query = self.query()
+        items = func.json_agg(
+            aggregate_order_by(json_object(selection), *self.order_by)
+        )
+        value = func.coalesce(items, EMPTY_ARRAY, type_=postgresql.JSON)
+        query = query.with_only_columns(value.label('value'))
+        return query.where(self.key == key)
+
+
+def fetch_profile(session, selection, id, parts, names=None):
+    # Returns the profile row and values of the parts by name, or None
+    # if there is no such row. On PostgreSQL every part is a lateral
+    # subquery, so the whole profile is read by one statement; elsewhere
+    # parts are read one by one.
+    if names is None:
+        names = [x for x in parts if selection.wants(x)]
+
+    fieldset = selection.fieldset
+    query = selection.query.where(fieldset.key == id)
+
+    if session.get_bind().dialect.name != 'postgresql':
+        row = session.execute(query).first()
+        if row is None:
+            return None
+        return row, {x: parts[x].fetch(session, id) for x in names}
+
+    for name in names:
+        # Only the profile row is correlated: tables of the part may be
+        # joined by the profile query too
+        subquery = parts[name].lateral(fieldset.key)
+        subquery = subquery.correlate(fieldset.base).lateral(f'{name}_part')
+        query = query.join_from(fieldset.base, subquery, true(), isouter=True)
+        query = query.add_columns(subquery.c.value)
+
+    row = session.execute(query).first()
+    if row is None:
+        return None
+    values = row[len(row) - len(names):]
+    return row, dict(zip(names, values))
+
+
+def fetch_profiles(session, selection, ids, parts, names=None):
+    # Profiles of many rows: one query for the rows and one for every part
+    # whatever the number of ids. Returns (row, values) by id of the found
+    # rows.
+    if names is None:
+        names = [x for x in parts if selection.wants(x)]
+
+    fieldset = selection.fieldset
+    query = selection.query.where(fieldset.key.in_(ids))
+    # The key is selected first
+    profiles = {row[0]: (row, {}) for row in session.execute(query)}
+    if not profiles:
+        return profiles
+
+    for name in names:
+        values = parts[name].fetch_many(session, list(profiles))
+        for id, value in values.items():
+            profiles[id][1][name] = value
+    return profiles
+
+
+def render_profiles(session, selection, ids, parts, names=None, make=None):
+    # Profiles by id in the order of ids, None for ids without a row.
+    # make(selection, row, values) builds a profile.
+    make = make or Selection.make_profile
+    profiles = fetch_profiles(session, selection, ids, parts, names)
+    return {
+        x: make(selection, *profiles[x]) if x in profiles else None
+        for x in ids
+    }
+
+
+def parse_ids(value):
+    # '1,2,3' -> [1, 2, 3] without duplicates
+    try:
+        ids = [int(x) for x in value.split(',') if x.strip()]
+    except ValueError:
+        raise InvalidIdsError('invalid ids')
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > config.BATCH_MAX_IDS:
+        raise InvalidIdsError('invalid ids')
+    return ids
@@ -3,11 +3,22 @@
 from typing import Optional
 from datetime import date, datetime
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from app.responses import JSONResponse
 from sqlalchemy import select
-
-from app.db import db
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.filters import name_search
+from app.fields import FieldSet, Relation
+from app.pagination import Page
+from app.streaming import accepts_ndjson, stream_ndjson
+from app.versions import make_etag, etag_matches, not_modified
+from app.versions import batch_keys, selection_keys
+from app.cache import cached_profile
+from app.profiles import Collection, fetch_profile
+from app.profiles import parse_ids, render_profiles
+from app.expand import expansions, expand_profiles, expanded_profile
 from app.models import User, Group, Project, Contract, Work
 from app.models import AssociationContractProject
 from app.models import AssignmentUserProject
@@ -18,63 +29,75 @@ from app.projects import schema
 router = APIRouter(tags=['projects'])
 
 
+PROJECT_FIELDS = FieldSet(Project, Project.id, {
+    'id': Project.id,
+    'name': Project.name,
+    'start_date': Project.start_date,
+    'finish_date': Project.finish_date,
+    'chief': Relation(
+        User,
+        User.id == Project.chief_id,
+        {'id': User.id, 'name': User.name},
+        local={'id': Project.chief_id}
+    ),
+    'group': Relation(
+        Group,
+        Group.id == Project.group_id,
+        {'id': Group.id, 'name': Group.name},
+        local={'id': Project.group_id}
+    )
+})
+
+
+PROJECT_PROFILE_FIELDS = FieldSet(
+    Project, Project.id, PROJECT_FIELDS.fields,
+    extra={
+        'contracts': (AssociationContractProject.project_id, Contract),
+        'works': (Work.project_id,)
+    }
+)
+
+
 @router.get('/api/projects', response_model=list[schema.Project])
 def api_projects_get_all(
+    request: Request,
     id: Optional[int] = None,
     name: Optional[str] = None,
     start_date: Optional[date] = None,
     finish_date: Optional[date] = None,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    page: Page = Depends(Page),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Project.id,
-        Project.name,
-        Project.start_date,
-        Project.finish_date,
-        User.id,
-        User.name,
-        Group.id,
-        Group.name
-    )
-    query = query.join(
-        User,
-        User.id == Project.chief_id,
-        isouter=True
-    )
-    query = query.join(
-        Group,
-        Group.id == Project.group_id,
-        isouter=True
-    )
+    selection = PROJECT_FIELDS.select(fields)
+    etag = make_etag(session, request, selection_keys(selection))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = selection.query
     if name is not None and len(name) != 0:
-        query = query.filter(Project.name.ilike(f'%{name}%'))
+        query = query.filter(name_search.filter(Project.name, name))
     if start_date is not None:
         query = query.filter(Project.start_date >= start_date)
     if finish_date is not None:
         query = query.filter(Project.finish_date <= finish_date)
 
-    with db.Session() as session:
-        data = session.execute(query).all()
+    if accepts_ndjson(request):
+        return stream_ndjson(
+            request, page.order(query, Project.id), selection.make_item,
+            headers={'ETag': etag}
+        )
+
+    data = page.fetch(session, query, Project.id)
 
     items = []
     for row in data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'start_date': row[2],
-            'finish_date': row[3],
-            'chief': {
-                'id': row[4],
-                'name': row[5]
-            },
-            'group': {
-                'id': row[6],
-                'name': row[7]
-            }
-        }
-        items.append(item)
-
-    return items
+        items.append(selection.make_item(row))
+
+    return JSONResponse(
+        items, status.HTTP_200_OK, headers={**page.headers, 'ETag': etag}
+    )
 
 
 @router.post('/api/projects', status_code=status.HTTP_201_CREATED, responses={
@@ -85,17 +108,17 @@ def api_projects_get_all(
 })
 def api_projects_create(
     request: schema.CreateProjectRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    with db.Session() as session:
-        project = session.execute(
-            select(Project).filter_by(name=request.name)
-        ).scalar_one_or_none()
+    project = session.execute(
+        select(Project).filter_by(name=request.name)
+    ).scalar_one_or_none()
 
     if project is not None:
         return JSONResponse(
@@ -113,15 +136,59 @@ def api_projects_create(
     project.start_date = request.start_date
     project.finish_date = request.finish_date
 
-    with db.Session() as session:
-        session.add(project)
-        session.commit()
+    session.add(project)
+    session.flush()
 
-        project_id = project.id
+    project_id = project.id
+    session.commit()
 
     return JSONResponse({'id': project_id}, status.HTTP_201_CREATED)
 
 
+PROJECT_PROFILE_PARTS = {
+    'contracts': Collection(
+        FieldSet(Contract, Contract.id, {
+            'id': Contract.id,
+            'name': Contract.name
+        }),
+        AssociationContractProject.project_id,
+        joins=(
+            (
+                AssociationContractProject,
+                AssociationContractProject.contract_id == Contract.id
+            ),
+        )
+    ),
+    'works': Collection(
+        FieldSet(Work, Work.id, {
+            'id': Work.id,
+            'name': Work.name,
+            'cost': Work.cost
+        }),
+        Work.project_id
+    )
+}
+
+
+def render_project_profile(session, selection, id):
+    result = fetch_profile(session, selection, id, PROJECT_PROFILE_PARTS)
+    if result is None:
+        return None
+    return selection.make_profile(*result)
+
+
+def render_project_profiles(session, selection, ids):
+    return render_profiles(session, selection, ids, PROJECT_PROFILE_PARTS)
+
+
+expansions.register('projects', PROJECT_PROFILE_FIELDS, render_project_profiles, {
+    'chief': 'users',
+    'group': 'groups',
+    'contracts': 'contracts',
+    'works': 'works'
+})
+
+
 @router.get('/api/projects/{id}', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.ProjectProfile},
     400: {'model': schema.BadRequestError},
@@ -130,122 +197,48 @@ def api_projects_create(
     404: {'model': schema.NotFoundError}
 })
 def api_projects_get_one(
+    request: Request,
     id: int,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Project.id,
-        Project.name,
-        Project.start_date,
-        Project.finish_date,
-        User.id,
-        User.name,
-        Group.id,
-        Group.name
-    )
-    query = query.join(
-        User,
-        User.id == Project.chief_id,
-        isouter=True
-    )
-    query = query.join(
-        Group,
-        Group.id == Project.group_id,
-        isouter=True
-    )
-    query = query.where(Project.id == id)
+    selection = PROJECT_PROFILE_FIELDS.select(fields)
+    if expand is not None:
+        return expanded_profile(session, 'projects', selection, id, expand)
 
-    with db.Session() as session:
-        project_data = session.execute(query).first()
-
-    if project_data is None:
-        return JSONResponse(
-            {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
-        )
-
-    project_id, project_name = project_data[0:2]
-    project_start_date, project_finish_date = project_data[2:4]
-    chief_id, chief_name, group_id, group_name = project_data[4:8]
-
-    query = select(
-        Contract.id,
-        Contract.name
-    )
-    query = query.join(
-        AssociationContractProject,
-        AssociationContractProject.contract_id == Contract.id,
-        isouter=False
-    )
-    query = query.join(
-        Project,
-        Project.id == AssociationContractProject.project_id,
-        isouter=False
+    return cached_profile(
+        request, session, selection, id, render_project_profile
     )
-    query = query.where(Project.id == project_id)
 
-    with db.Session() as session:
-        contracts_data = session.execute(query).all()
 
-    query = select(
-        Work.id,
-        Work.name,
-        Work.cost,
-    )
-    query = query.join(
-        Project,
-        Project.id == Work.project_id,
-        isouter=True
-    )
-    query = query.join(
-        Contract,
-        Contract.id == Work.contract_id,
-        isouter=True
+@router.get('/api/projects:batch', response_model=dict[int, Optional[schema.ProjectProfile]], responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_projects_get_batch(
+    request: Request,
+    ids: str,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    selection = PROJECT_PROFILE_FIELDS.select(fields)
+    ids = parse_ids(ids)
+    if expand is not None:
+        profiles = expand_profiles(session, 'projects', selection, ids, expand)
+        return JSONResponse(profiles, status.HTTP_200_OK)
+
+    etag = make_etag(session, request, batch_keys(selection, ids))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    profiles = render_project_profiles(session, selection, ids)
+    return JSONResponse(
+        profiles, status.HTTP_200_OK, headers={'ETag': etag}
     )
-    query = query.where(Project.id == project_id)
-
-    with db.Session() as session:
-        works_data = session.execute(query).all()
-
-    contracts = []
-    for row in contracts_data:
-        item = {
-            'id': row[0],
-            'name': row[1]
-        }
-        contracts.append(item)
-
-    works = []
-    for row in works_data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'cost': row[2]
-        }
-        works.append(item)
-
-    if project_start_date is not None:
-        project_start_date = str(project_start_date)
-    if project_finish_date is not None:
-        project_finish_date = str(project_finish_date)
-
-    response = {
-        'id': project_id,
-        'name': project_name,
-        'start_date': project_start_date,
-        'finish_date': project_finish_date,
-        'chief': {
-            'id': chief_id,
-            'name': chief_name
-        },
-        'group': {
-            'id': group_id,
-            'name': group_name
-        },
-        'contracts': contracts,
-        'works': works
-    }
-
-    return JSONResponse(response, status.HTTP_200_OK)
 
 
 @router.put('/api/projects/{id}/chief', status_code=status.HTTP_200_OK, responses={
@@ -258,15 +251,14 @@ def api_projects_get_one(
 def api_projects_update_chief(
     id: int,
     request: schema.UserID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     project = session.query(Project).get(id)
     chief = session.query(User).get(request.id)
 
@@ -283,7 +275,6 @@ def api_projects_update_chief(
         unassignment.is_assigned = False
 
         session.add(unassignment)
-        session.commit()
 
     if chief is None:
         project.chief_id = None
@@ -313,15 +304,14 @@ def api_projects_update_chief(
 def api_projects_update_group(
     id: int,
     request: schema.GroupID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     project = session.query(Project).get(id)
     group = session.query(Group).get(request.id)
 
@@ -349,15 +339,14 @@ def api_projects_update_group(
 def api_projects_update_contracts(
     id: int,
     request: schema.ContractID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     project = session.query(Project).get(id)
     contract = session.query(Contract).get(request.id)
 
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+import orjson
+
+from fastapi.responses import JSONResponse as BaseJSONResponse
+
+
+class JSONResponse(BaseJSONResponse):
+    # orjson writes dates, datetimes and UUIDs itself, so payloads built
+    # by the handlers are rendered as they are without conversions
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_line(content):
+    return orjson.dumps(
+        content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+    )
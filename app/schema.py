@@ -30,3 +30,7 @@ class ForbiddenError(MsgResponse):
 
 class NotFoundError(MsgResponse):
     pass
+
+
+class ServiceUnavailableError(MsgResponse):
+    pass
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import re
+
+from fastapi import APIRouter, Depends, status
+from app.responses import JSONResponse
+from sqlalchemy import column
+from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import literal_column
+from sqlalchemy import select
+from sqlalchemy import table
+from sqlalchemy import union_all
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.filters import name_search
+from app.models import User
+
+from app.auth import get_current_user
+from app.search import schema
+
+router = APIRouter(tags=['search'])
+
+# Hit type and table; search_vector columns are maintained by triggers
+# and are not a part of the models
+ENTITIES = [
+    ('user', 'users'),
+    ('department', 'departments'),
+    ('contract', 'contracts'),
+    ('project', 'projects'),
+    ('work', 'works'),
+    ('group', 'groups'),
+    ('equipment', 'equipment'),
+]
+
+TS_CONFIG = literal_column("'pg_catalog.simple'::regconfig")
+
+
+def to_prefix_query(q):
+    # Every word must match the beginning of some word of the name
+    return ' & '.join(f'{x}:*' for x in re.findall(r'\w+', q))
+
+
+def make_branch(session, entity, name, q, limit):
+    target = table(name, column('id'), column('name'), column('search_vector'))
+    if session.get_bind().dialect.name == 'postgresql':
+        query = func.to_tsquery(TS_CONFIG, to_prefix_query(q))
+        rank = func.ts_rank(target.c.search_vector, query)
+        condition = target.c.search_vector.op('@@')(query)
+    else:
+        rank = literal(0.0)
+        condition = name_search.filter(target.c.name, q)
+
+    branch = select(
+        literal(entity).label('type'),
+        target.c.id.label('id'),
+        target.c.name.label('name'),
+        rank.label('rank')
+    )
+    branch = branch.where(condition)
+    branch = branch.order_by(rank.desc(), target.c.id)
+    branch = branch.limit(limit)
+    return select(branch.subquery())
+
+
+@router.get('/api/search', response_model=list[schema.SearchHit], responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_search(
+    q: str = '',
+    limit: int = config.SEARCH_DEFAULT_LIMIT,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    if limit < 1 or limit > config.SEARCH_MAX_LIMIT:
+        return JSONResponse(
+            {'msg': 'invalid limit'}, status.HTTP_400_BAD_REQUEST
+        )
+    if not re.search(r'\w', q):
+        return JSONResponse([], status.HTTP_200_OK)
+
+    # Every table returns its own best hits using its index, so no more
+    # than limit rows per table are ranked together
+    hits = union_all(*[
+        make_branch(session, entity, name, q, limit)
+        for entity, name in ENTITIES
+    ]).subquery()
+
+    query = select(hits.c.type, hits.c.id, hits.c.name, hits.c.rank)
+    query = query.order_by(hits.c.rank.desc(), hits.c.type, hits.c.id)
+    query = query.limit(limit)
+
+    data = session.execute(query).all()
+
+    items = []
+    for row in data:
+        item = {
+            'type': row[0],
+            'id': row[1],
+            'name': row[2],
+            'rank': float(row[3])
+        }
+        items.append(item)
+
+    return JSONResponse(items, status.HTTP_200_OK)
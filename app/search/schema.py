@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+from typing import Optional
+
+from pydantic import BaseModel
+
+from app.schema import BadRequestError
+from app.schema import UnauthorizedError
+
+
+class SearchHit(BaseModel):
+    type: str
+    id: int
+    name: Optional[str] = None
+    rank: float
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app.db import db
+from app.responses import dumps_line
+
+NDJSON = 'application/x-ndjson'
+
+
+def accepts_ndjson(request: Request):
+    return NDJSON in request.headers.get('accept', '')
+
+
+def stream_ndjson(request: Request, query, make_item, headers=None):
+    # One JSON document per line, written while rows are read from a server
+    # side cursor. The request session is closed before the body is sent,
+    # so the stream reads through its own session.
+    endpoint = '%s %s' % (request.method, request.url.path)
+    query = query.execution_options(
+        stream_results=True, yield_per=config.STREAM_BATCH_SIZE
+    )
+
+    def generate():
+        with db.session(endpoint, read_only=True) as session:
+            for rows in session.execute(query).partitions():
+                yield b''.join(dumps_line(make_item(row)) for row in rows)
+
+    return StreamingResponse(generate(), media_type=NDJSON, headers=headers)
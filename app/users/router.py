@@ -2,12 +2,25 @@
 
 from typing import Optional
 from datetime import date, datetime
+from functools import partial
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from app.responses import JSONResponse
 from sqlalchemy import select
-
-from app.db import db
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.filters import name_search
+from app.fields import FieldSet, Relation
+from app.pagination import Page
+from app.streaming import accepts_ndjson, stream_ndjson
+from app.versions import make_etag, etag_matches, not_modified
+from app.versions import batch_keys, selection_keys
+from app.cache import cached_profile
+from app.profiles import Collection, fetch_profile
+from app.profiles import parse_ids, render_profiles
+from app.expand import expansions, expand_profiles, expanded_profile
+from app.history import assigned_on, assigned_pairs
 from app.models import User, Department, Group, Contract, Project
 from app.models import AssociationUserGroup
 from app.models import AssignmentUserProject
@@ -19,30 +32,68 @@ from app.users import schema
 router = APIRouter(tags=['users'])
 
 
-@router.get('/api/users', response_model=list[schema.User])
+USER_FIELDS = FieldSet(User, User.id, {
+    'id': User.id,
+    'name': User.name,
+    'department': Relation(
+        Department,
+        Department.id == User.department_id,
+        {'id': Department.id, 'name': Department.name},
+        local={'id': User.department_id}
+    )
+})
+
+
+USER_PROFILE_FIELDS = FieldSet(User, User.id, {
+    'id': User.id,
+    'name': User.name,
+    'birthdate': User.birthdate,
+    'is_admin': User.is_admin,
+    'department': Relation(
+        Department,
+        Department.id == User.department_id,
+        {'id': Department.id, 'name': Department.name},
+        local={'id': User.department_id}
+    )
+}, extra={
+    'groups': (AssociationUserGroup.user_id, Group),
+    'projects_assignments': (AssignmentUserProject.user_id, Project),
+    'contracts_assignments': (AssignmentUserContract.user_id, Contract)
+})
+
+
+@router.get('/api/users', response_model=list[schema.User],
+            response_model_exclude_unset=True)
 def api_users_get_all(
+    request: Request,
     id: Optional[int] = None,
     name: Optional[str] = None,
     birthdate_from: Optional[date] = None,
     birthdate_to: Optional[date] = None,
     department_id: Optional[int] = None,
-    current_user: User = Depends(get_current_user)
+    project_id: Optional[int] = None,
+    contract_id: Optional[int] = None,
+    as_of: Optional[date] = None,
+    fields: Optional[str] = None,
+    page: Page = Depends(Page),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        User.id,
-        User.name,
-        Department.id,
-        Department.name
-    )
-    query = query.join(
-        Department,
-        Department.id == User.department_id,
-        isouter=True
-    )
+    selection = USER_FIELDS.select(fields)
+    keys = selection_keys(selection)
+    if project_id is not None:
+        keys.append(AssignmentUserProject.__tablename__)
+    if contract_id is not None:
+        keys.append(AssignmentUserContract.__tablename__)
+    etag = make_etag(session, request, keys)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = selection.query
     if id is not None:
         query = query.filter(User.id == id)
     if name is not None and len(name) != 0:
-        query = query.filter(User.name.ilike(f'%{name}%'))
+        query = query.filter(name_search.filter(User.name, name))
     if birthdate_to is not None:
         query = query.filter(User.birthdate <= birthdate_to)
     if birthdate_from is not None:
@@ -50,22 +101,33 @@ def api_users_get_all(
     if department_id is not None:
         query = query.filter(User.department_id == department_id)
 
-    with db.Session() as session:
-        data = session.execute(query).all()
+    # Users assigned to the project or the contract now or on the date
+    if project_id is not None:
+        pairs = assigned_pairs(session, AssignmentUserProject, as_of).subquery()
+        query = query.filter(User.id.in_(
+            select(pairs.c.user_id).where(pairs.c.project_id == project_id)
+        ))
+    if contract_id is not None:
+        pairs = assigned_pairs(session, AssignmentUserContract, as_of).subquery()
+        query = query.filter(User.id.in_(
+            select(pairs.c.user_id).where(pairs.c.contract_id == contract_id)
+        ))
+
+    if accepts_ndjson(request):
+        return stream_ndjson(
+            request, page.order(query, User.id), selection.make_item,
+            headers={'ETag': etag}
+        )
+
+    data = page.fetch(session, query, User.id)
 
     items = []
     for row in data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'department': {
-                'id': row[2],
-                'name': row[3],
-            }
-        }
-        items.append(item)
+        items.append(selection.make_item(row))
 
-    return JSONResponse(items, status.HTTP_200_OK)
+    return JSONResponse(
+        items, status.HTTP_200_OK, headers={**page.headers, 'ETag': etag}
+    )
 
 
 @router.post('/api/users', status_code=status.HTTP_201_CREATED, responses={
@@ -73,20 +135,21 @@ def api_users_get_all(
     400: {'model': schema.BadRequestError},
     401: {'model': schema.UnauthorizedError},
     403: {'model': schema.ForbiddenError},
+    503: {'model': schema.ServiceUnavailableError},
 })
 def api_users_create(
     request: schema.CreateUserRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    with db.Session() as session:
-        user = session.execute(
-            select(User).filter_by(email=request.email)
-        ).scalar_one_or_none()
+    user = session.execute(
+        select(User).filter_by(email=request.email)
+    ).scalar_one_or_none()
 
     if user is not None:
         return JSONResponse(
@@ -101,15 +164,88 @@ def api_users_create(
     user.name = request.name
     user.birthdate = request.birthdate
 
-    with db.Session() as session:
-        session.add(user)
-        session.commit()
+    session.add(user)
+    session.flush()
 
-        user_id = user.id
+    user_id = user.id
+    session.commit()
 
     return JSONResponse({'id': user_id}, status.HTTP_201_CREATED)
 
 
+USER_PROFILE_PARTS = {
+    'groups': Collection(
+        FieldSet(Group, Group.id, {'id': Group.id, 'name': Group.name}),
+        AssociationUserGroup.user_id,
+        joins=(
+            (AssociationUserGroup, AssociationUserGroup.group_id == Group.id),
+        )
+    ),
+    'projects_assignments': Collection(
+        FieldSet(AssignmentUserProject, AssignmentUserProject.id, {
+            'id': AssignmentUserProject.id,
+            'assignment_date': AssignmentUserProject.assignment_date,
+            'is_assigned': AssignmentUserProject.is_assigned,
+            'project': Relation(
+                Project,
+                Project.id == AssignmentUserProject.project_id,
+                {'id': Project.id, 'name': Project.name}
+            )
+        }),
+        AssignmentUserProject.user_id,
+        order_by=(AssignmentUserProject.id.desc(),)
+    ),
+    'contracts_assignments': Collection(
+        FieldSet(AssignmentUserContract, AssignmentUserContract.id, {
+            'id': AssignmentUserContract.id,
+            'assignment_date': AssignmentUserContract.assignment_date,
+            'is_assigned': AssignmentUserContract.is_assigned,
+            'contract': Relation(
+                Contract,
+                Contract.id == AssignmentUserContract.contract_id,
+                {'id': Contract.id, 'name': Contract.name}
+            )
+        }),
+        AssignmentUserContract.user_id,
+        order_by=(AssignmentUserContract.id.desc(),)
+    )
+}
+
+
+def user_profile_parts(session, as_of):
+    # Assignments in effect on the date instead of the whole log
+    if as_of is None:
+        return USER_PROFILE_PARTS
+    return {
+        **USER_PROFILE_PARTS,
+        'projects_assignments': USER_PROFILE_PARTS['projects_assignments'].filter(
+            assigned_on(session, AssignmentUserProject, as_of)
+        ),
+        'contracts_assignments': USER_PROFILE_PARTS['contracts_assignments'].filter(
+            assigned_on(session, AssignmentUserContract, as_of)
+        )
+    }
+
+
+def render_user_profile(session, selection, id, as_of=None):
+    parts = user_profile_parts(session, as_of)
+    result = fetch_profile(session, selection, id, parts)
+    if result is None:
+        return None
+    return selection.make_profile(*result)
+
+
+def render_user_profiles(session, selection, ids, as_of=None):
+    parts = user_profile_parts(session, as_of)
+    return render_profiles(session, selection, ids, parts)
+
+
+expansions.register('users', USER_PROFILE_FIELDS, render_user_profiles, {
+    'department': 'departments',
+    'groups': 'groups'
+})
+
+
 @router.get('/api/users/{id}', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.UserProfile},
     400: {'model': schema.BadRequestError},
@@ -118,145 +254,57 @@ def api_users_create(
     404: {'model': schema.NotFoundError}
 })
 def api_users_get_one(
+    request: Request,
     id: int,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    as_of: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        User.id,
-        User.name,
-        User.birthdate,
-        User.is_admin,
-        Department.id,
-        Department.name
-    )
-    query = query.join(
-        Department,
-        Department.id == User.department_id,
-        isouter=True
-    )
-    query = query.where(User.id == id)
-
-    with db.Session() as session:
-        user_data = session.execute(query).first()
-
-    if user_data is None:
-        return JSONResponse(
-            {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
+    selection = USER_PROFILE_FIELDS.select(fields)
+    if expand is not None:
+        return expanded_profile(
+            session, 'users', selection, id, expand,
+            partial(render_user_profiles, as_of=as_of)
         )
 
-    user_id, user_name, user_birthdate, user_is_admin = user_data[0:4]
-    department_id, department_name = user_data[4:6]
-
-    query = select(
-        Group.id,
-        Group.name
-    )
-    query = query.join(
-        AssociationUserGroup,
-        AssociationUserGroup.group_id == Group.id,
-        isouter=True
+    return cached_profile(
+        request, session, selection, id,
+        partial(render_user_profile, as_of=as_of)
     )
-    query = query.where(AssociationUserGroup.user_id == user_id)
 
-    with db.Session() as session:
-        groups_data = session.execute(query).all()
 
-    query = select(
-        AssignmentUserProject.id,
-        AssignmentUserProject.assignment_date,
-        AssignmentUserProject.is_assigned,
-        Project.id,
-        Project.name
-    )
-    query = query.join(
-        Project,
-        Project.id == AssignmentUserProject.project_id,
-        isouter=True
-    )
-    query = query.where(AssignmentUserProject.user_id == user_id)
+@router.get('/api/users:batch', response_model=dict[int, Optional[schema.UserProfile]], responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_users_get_batch(
+    request: Request,
+    ids: str,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    as_of: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    selection = USER_PROFILE_FIELDS.select(fields)
+    ids = parse_ids(ids)
+    if expand is not None:
+        profiles = expand_profiles(
+            session, 'users', selection, ids, expand,
+            partial(render_user_profiles, as_of=as_of)
+        )
+        return JSONResponse(profiles, status.HTTP_200_OK)
 
-    with db.Session() as session:
-        projects_assignments_data = session.execute(query).all()
+    etag = make_etag(session, request, batch_keys(selection, ids))
+    if etag_matches(request, etag):
+        return not_modified(etag)
 
-    query = select(
-        AssignmentUserContract.id,
-        AssignmentUserContract.assignment_date,
-        AssignmentUserContract.is_assigned,
-        Contract.id,
-        Contract.name
+    profiles = render_user_profiles(session, selection, ids, as_of)
+    return JSONResponse(
+        profiles, status.HTTP_200_OK, headers={'ETag': etag}
     )
-    query = query.join(
-        Contract,
-        Contract.id == AssignmentUserContract.contract_id,
-        isouter=True
-    )
-    query = query.where(AssignmentUserContract.user_id == user_id)
-
-    with db.Session() as session:
-        contracts_assignments_data = session.execute(query).all()
-
-    groups = []
-    for row in groups_data:
-        item = {
-            'id': row[0],
-            'name': row[1]
-        }
-        groups.append(item)
-
-    projects_assignments = []
-    for row in projects_assignments_data:
-        assignment_date = row[1]
-        if assignment_date is not None:
-            assignment_date = str(assignment_date)
-
-        item = {
-            'id': row[0],
-            'assignment_date': assignment_date,
-            'is_assigned': row[2],
-            'project': {
-                'id': row[3],
-                'name': row[4]
-            }
-        }
-        projects_assignments.append(item)
-
-    contracts_assignments = []
-    for row in contracts_assignments_data:
-        assignment_date = row[1]
-        if assignment_date is not None:
-            assignment_date = str(assignment_date)
-
-        item = {
-            'id': row[0],
-            'assignment_date': assignment_date,
-            'is_assigned': row[2],
-            'contract': {
-                'id': row[3],
-                'name': row[4]
-            }
-        }
-        contracts_assignments.append(item)
-
-    if user_birthdate is not None:
-        user_birthdate = str(user_birthdate)
-
-    contracts_assignments.sort(key=lambda x: x['id'], reverse=True)
-    projects_assignments.sort(key=lambda x: x['id'], reverse=True)
-
-    response = {
-        'id': user_id,
-        'name': user_name,
-        'birthdate': user_birthdate,
-        'is_admin': user_is_admin,
-        'department': {
-            'id': department_id,
-            'name': department_name
-        },
-        'groups': groups,
-        'projects_assignments': projects_assignments,
-        'contracts_assignments': contracts_assignments
-    }
-    return JSONResponse(response, status.HTTP_200_OK)
 
 
 @router.put('/api/users/{id}/department', status_code=status.HTTP_200_OK, responses={
@@ -269,15 +317,14 @@ def api_users_get_one(
 def api_users_update_department(
     id: int,
     request: schema.DepartmentID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     user = session.query(User).get(id)
     department = session.query(Department).get(request.id)
 
@@ -305,15 +352,14 @@ def api_users_update_department(
 def api_users_update_department(
     id: int,
     request: schema.GroupID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     user = session.query(User).get(id)
     group = session.query(Group).get(request.id)
 
@@ -335,7 +381,6 @@ def api_users_update_department(
     association.user_id = user.id
     association.group_id = group.id
     session.add(association)
-    session.commit()
 
     projects = session.query(Project).filter(
         Project.group_id == group.id
@@ -354,7 +399,6 @@ def api_users_update_department(
         assignments.append(assignment)
 
     session.add_all(assignments)
-    session.commit()
 
     assignments = []
     for project in projects:
@@ -380,15 +424,14 @@ def api_users_update_department(
 def api_users_delete_group(
     user_id: int,
     group_id: int,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     user = session.query(User).get(user_id)
     group = session.query(Group).get(group_id)
 
@@ -407,7 +450,6 @@ def api_users_delete_group(
         )
 
     session.delete(association)
-    session.commit()
 
     projects = session.query(Project).filter(
         Project.group_id == group.id
@@ -426,7 +468,6 @@ def api_users_delete_group(
         assignments.append(assignment)
 
     session.add_all(assignments)
-    session.commit()
 
     assignments = []
     for project in projects:
@@ -11,6 +11,7 @@ from app.schema import ForbiddenError
 from app.schema import NotFoundError
 from app.schema import CreatedResponse
 from app.schema import OkResponse
+from app.schema import ServiceUnavailableError
 
 
 class DepartmentID(BaseModel):
@@ -11,21 +11,20 @@ from app.models import User
 
 def fill_database_by_initial_values():
 
-    with db.Session() as session:
+    with db.session('fill_database_by_initial_values') as session:
         superuser = session.execute(
             select(User).filter_by(email=config.SUPERUSER_EMAIL)
         ).scalar_one_or_none()
 
-    if superuser is None:
-        superuser = User()
+        if superuser is None:
+            superuser = User()
 
-    superuser.email = config.SUPERUSER_EMAIL
-    superuser.set_password(config.SUPERUSER_PASSWORD)
-    superuser.name = config.SUPERUSER_NAME
-    superuser.is_superuser = True
-    superuser.is_admin = True
-    superuser.birthdate = date.fromisoformat(config.SUPERUSER_BIRTHDATE)
+        superuser.email = config.SUPERUSER_EMAIL
+        superuser.set_password(config.SUPERUSER_PASSWORD)
+        superuser.name = config.SUPERUSER_NAME
+        superuser.is_superuser = True
+        superuser.is_admin = True
+        superuser.birthdate = date.fromisoformat(config.SUPERUSER_BIRTHDATE)
 
-    with db.Session() as session:
         session.add(superuser)
         session.commit()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+import config
+
+import hashlib
+import logging
+import threading
+
+from fastapi import Request, Response, status
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import inspect
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.orm import Session
+
+from app.db import db
+from app.models import EntityVersion, EntityVersionDelta
+
+logger = logging.getLogger(__name__)
+
+# Tables whose changes are not visible through the API
+UNVERSIONED = {
+    'entity_versions', 'entity_version_deltas', 'token_revocations',
+    'analytics_refreshes'
+}
+
+# Called with the keys of every commit after it, see changed_tables
+_commit_listeners = []
+
+
+def row_key(table, id):
+    return f'{table}:{id}'
+
+
+def any_row_key(table):
+    # Bumped by statements which change rows not known to the session
+    return f'{table}:*'
+
+
+def reference_key(table, column, value):
+    # Rows of the table which refer to the value through a foreign key
+    return f'{table}.{column}={value}'
+
+
+def is_row_key(key):
+    return ':' in key and not key.endswith(':*')
+
+
+def selection_keys(selection, id=None):
+    # Collection of the base table for lists, the row for profiles.
+    # Related models are versioned as whole collections, foreign key
+    # columns as the rows referring to the profile row.
+    table = selection.fieldset.base.__table__.name
+    if id is None:
+        keys = [table]
+    else:
+        keys = [row_key(table, id), any_row_key(table)]
+    for source in selection.dependencies:
+        if not isinstance(source, InstrumentedAttribute):
+            keys.append(source.__table__.name)
+        elif id is None:
+            keys.append(source.class_.__table__.name)
+        else:
+            source_table = source.class_.__table__.name
+            keys.append(reference_key(source_table, source.key, id))
+            keys.append(any_row_key(source_table))
+    return sorted(set(keys))
+
+
+def batch_keys(selection, ids):
+    return sorted({x for id in ids for x in selection_keys(selection, id)})
+
+
+def bump(session, keys):
+    # Counters are locked until commit: keys are sorted, so that concurrent
+    # transactions lock them in the same order. On PostgreSQL only rows
+    # have counters; collections, references and statements are changed
+    # by most writers of a table, so their changes are appended as deltas
+    # instead, which lock nothing, and folded into the counters later.
+    keys = sorted(keys)
+    if session.get_bind().dialect.name == 'postgresql':
+        rows = [x for x in keys if is_row_key(x)]
+        if rows:
+            query = postgresql.insert(EntityVersion).values(
+                [{'key': x, 'version': 1} for x in rows]
+            )
+            query = query.on_conflict_do_update(
+                index_elements=[EntityVersion.key],
+                set_={'version': EntityVersion.version + 1}
+            )
+            session.execute(query)
+        shared = [x for x in keys if not is_row_key(x)]
+        if shared:
+            session.execute(
+                insert(EntityVersionDelta), [{'key': x} for x in shared]
+            )
+        return
+
+    for key in keys:
+        result = session.execute(
+            update(EntityVersion).where(EntityVersion.key == key).values(
+                version=EntityVersion.version + 1
+            )
+        )
+        if result.rowcount == 0:
+            session.add(EntityVersion(key=key, version=1))
+    session.flush()
+
+
+def make_etag(session, request: Request, keys):
+    # The same versions and the same request produce the same body
+    versions = dict(session.execute(
+        select(EntityVersion.key, EntityVersion.version).where(
+            EntityVersion.key.in_(keys)
+        )
+    ).all())
+    shared = [x for x in keys if not is_row_key(x)]
+    if shared:
+        deltas = session.execute(
+            select(EntityVersionDelta.key, func.count()).where(
+                EntityVersionDelta.key.in_(shared)
+            ).group_by(EntityVersionDelta.key)
+        ).all()
+        for key, count in deltas:
+            versions[key] = versions.get(key, 0) + count
+    digest = hashlib.sha1()
+    digest.update(request.url.path.encode('utf-8'))
+    digest.update(b'?' + request.url.query.encode('utf-8'))
+    digest.update(b'#' + request.headers.get('accept', '').encode('utf-8'))
+    for key in sorted(keys):
+        digest.update(f'#{key}={versions.get(key, 0)}'.encode('utf-8'))
+    return '"%s"' % digest.hexdigest()
+
+
+def etag_matches(request: Request, value):
+    header = request.headers.get('if-none-match')
+    if header is None:
+        return False
+    tags = [x.strip().removeprefix('W/') for x in header.split(',')]
+    return value in tags or '*' in tags
+
+
+def not_modified(value):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={
+        'ETag': value
+    })
+
+
+def on_commit(listener):
+    _commit_listeners.append(listener)
+    return listener
+
+
+def changed_tables(keys):
+    # Keys without a row or a reference part are table names
+    return {x for x in keys if ':' not in x and '=' not in x}
+
+
+def changed_rows(keys, table):
+    # Ids of the changed rows of the table, None if a statement changed
+    # rows not known to the session
+    if any_row_key(table) in keys:
+        return None
+    prefix = row_key(table, '')
+    return {int(x[len(prefix):]) for x in keys if x.startswith(prefix)}
+
+
+def _add_keys(session, keys):
+    if keys:
+        session.info.setdefault('version_keys', set()).update(keys)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    keys = set()
+    for target in (*session.new, *session.dirty, *session.deleted):
+        table = target.__table__.name
+        if table in UNVERSIONED:
+            continue
+        if target in session.dirty and not session.is_modified(target):
+            continue
+        state = inspect(target)
+        keys.add(table)
+        for value in state.mapper.primary_key_from_instance(target):
+            keys.add(row_key(table, value))
+        # Both the rows referred to now and before the change
+        for attr in state.mapper.column_attrs:
+            if not attr.columns[0].foreign_keys:
+                continue
+            for value in state.attrs[attr.key].history.sum():
+                if value is not None:
+                    keys.add(reference_key(table, attr.key, value))
+    _add_keys(session, keys)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_executed(orm_execute_state):
+    if not (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        return
+    table = orm_execute_state.statement.table.name
+    if table in UNVERSIONED:
+        return
+    _add_keys(orm_execute_state.session, {table, any_row_key(table)})
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(session):
+    # Pending changes are flushed first, so that their keys are collected
+    session.flush()
+    keys = session.info.pop('version_keys', None)
+    if keys:
+        bump(session, keys)
+        session.info['committed_keys'] = keys
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_committed(session):
+    keys = session.info.pop('committed_keys', None)
+    if keys:
+        for listener in _commit_listeners:
+            listener(keys)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_versions(session, previous_transaction):
+    session.info.pop('version_keys', None)
+    session.info.pop('committed_keys', None)
+
+
+class VersionFolder:
+    # Folds the version deltas into the counters in the background, so
+    # that ETags count a few recent deltas per key. Deltas are deleted and
+    # added to the counters in one statement: readers see either of them,
+    # workers folding at the same time never count a delta twice.
+    FOLD = text(
+        'WITH folded AS ('
+        '    DELETE FROM entity_version_deltas RETURNING key'
+        ') '
+        'INSERT INTO entity_versions (key, version) '
+        'SELECT key, count(*) FROM folded GROUP BY key ORDER BY key '
+        'ON CONFLICT (key) DO UPDATE '
+        'SET version = entity_versions.version + excluded.version'
+    )
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.folds = 0
+        self.__thread = None
+
+    def attach(self, engine):
+        if engine.dialect.name != 'postgresql' or self.interval <= 0:
+            return
+        self.__thread = threading.Thread(
+            target=self.__watch, name='version-folder', daemon=True
+        )
+        self.__thread.start()
+
+    def fold(self):
+        with db.session('fold versions') as session:
+            session.execute(self.FOLD)
+            session.commit()
+        self.folds += 1
+
+    def __watch(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.fold()
+            except Exception:
+                logger.exception('Folding of version deltas failed')
+
+
+folder = VersionFolder(interval=config.VERSIONS_FOLD_SECONDS)
+
+folder.attach(db.engine)
@@ -2,11 +2,20 @@
 
 from typing import Optional
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from app.responses import JSONResponse
 from sqlalchemy import select
-
-from app.db import db
+from sqlalchemy.orm import Session
+
+from app.db import get_session
+from app.filters import name_search
+from app.fields import FieldSet, Relation
+from app.pagination import Page
+from app.streaming import accepts_ndjson, stream_ndjson
+from app.versions import make_etag, etag_matches, not_modified
+from app.versions import batch_keys, selection_keys
+from app.profiles import parse_ids, render_profiles
+from app.expand import expansions, expand_profiles, expanded_profile
 from app.models import User, Work, Contract, Project, Group
 
 from app.auth import get_current_user
@@ -15,61 +24,76 @@ from app.works import schema
 router = APIRouter(tags=['works'])
 
 
+WORK_FIELDS = FieldSet(Work, Work.id, {
+    'id': Work.id,
+    'name': Work.name,
+    'cost': Work.cost,
+    'contract': Relation(
+        Contract,
+        Contract.id == Work.contract_id,
+        {'id': Contract.id, 'name': Contract.name},
+        local={'id': Work.contract_id}
+    ),
+    'project': Relation(
+        Project,
+        Project.id == Work.project_id,
+        {'id': Project.id, 'name': Project.name},
+        local={'id': Work.project_id}
+    )
+})
+
+
+WORK_PROFILE_FIELDS = FieldSet(Work, Work.id, {
+    **WORK_FIELDS.fields,
+    'group': Relation(
+        Group,
+        Group.id == Work.group_id,
+        {'id': Group.id, 'name': Group.name},
+        local={'id': Work.group_id}
+    )
+})
+
+
 @router.get('/api/works', response_model=list[schema.Work])
 def api_works_get_all(
+    request: Request,
     id: Optional[int] = None,
     name: Optional[str] = None,
     min_cost: Optional[float] = None,
     max_cost: Optional[float] = None,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    page: Page = Depends(Page),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Work.id,
-        Work.name,
-        Work.cost,
-        Contract.id,
-        Contract.name,
-        Project.id,
-        Project.name
-    )
-    query = query.join(
-        Contract,
-        Contract.id == Work.contract_id,
-        isouter=True
-    )
-    query = query.join(
-        Project,
-        Project.id == Work.project_id,
-        isouter=True
-    )
+    selection = WORK_FIELDS.select(fields)
+    etag = make_etag(session, request, selection_keys(selection))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = selection.query
     if name is not None and len(name) != 0:
-        query = query.filter(Work.name.ilike(f'%{name}%'))
+        query = query.filter(name_search.filter(Work.name, name))
     if min_cost is not None:
         query = query.filter(Work.cost >= min_cost)
     if max_cost is not None:
         query = query.filter(Work.cost <= max_cost)
 
-    with db.Session() as session:
-        data = session.execute(query).all()
+    if accepts_ndjson(request):
+        return stream_ndjson(
+            request, page.order(query, Work.id), selection.make_item,
+            headers={'ETag': etag}
+        )
+
+    data = page.fetch(session, query, Work.id)
 
     items = []
     for row in data:
-        item = {
-            'id': row[0],
-            'name': row[1],
-            'cost': row[2],
-            'contract': {
-                'id': row[3],
-                'name': row[4],
-            },
-            'project': {
-                'id': row[5],
-                'name': row[6],
-            }
-        }
-        items.append(item)
-
-    return items
+        items.append(selection.make_item(row))
+
+    return JSONResponse(
+        items, status.HTTP_200_OK, headers={**page.headers, 'ETag': etag}
+    )
 
 
 @router.post('/api/works', status_code=status.HTTP_201_CREATED, responses={
@@ -80,17 +104,17 @@ def api_works_get_all(
 })
 def api_works_create(
     request: schema.CreateWorkRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    with db.Session() as session:
-        work = session.execute(
-            select(Work).filter_by(name=request.name)
-        ).scalar_one_or_none()
+    work = session.execute(
+        select(Work).filter_by(name=request.name)
+    ).scalar_one_or_none()
 
     if work is not None:
         return JSONResponse(
@@ -101,15 +125,26 @@ def api_works_create(
     work.name = request.name
     work.cost = request.cost
 
-    with db.Session() as session:
-        session.add(work)
-        session.commit()
+    session.add(work)
+    session.flush()
 
-        work_id = work.id
+    work_id = work.id
+    session.commit()
 
     return JSONResponse({'id': work_id}, status.HTTP_201_CREATED)
 
 
+def render_work_profiles(session, selection, ids):
+    return render_profiles(session, selection, ids, {})
+
+
+expansions.register('works', WORK_PROFILE_FIELDS, render_work_profiles, {
+    'contract': 'contracts',
+    'project': 'projects',
+    'group': 'groups'
+})
+
+
 @router.get('/api/works/{id}', status_code=status.HTTP_200_OK, responses={
     200: {'model': schema.WorkProfile},
     400: {'model': schema.BadRequestError},
@@ -118,68 +153,64 @@ def api_works_create(
     404: {'model': schema.NotFoundError}
 })
 def api_works_get_one(
+    request: Request,
     id: int,
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
-    query = select(
-        Work.id,
-        Work.name,
-        Work.cost,
-        Contract.id,
-        Contract.name,
-        Project.id,
-        Project.name,
-        Group.id,
-        Group.name
-    )
-    query = query.join(
-        Contract,
-        Contract.id == Work.contract_id,
-        isouter=True
-    )
-    query = query.join(
-        Project,
-        Project.id == Work.project_id,
-        isouter=True
-    )
-    query = query.join(
-        Group,
-        Group.id == Work.group_id,
-        isouter=True
-    )
-    query = query.where(Work.id == id)
+    selection = WORK_PROFILE_FIELDS.select(fields)
+    if expand is not None:
+        return expanded_profile(session, 'works', selection, id, expand)
 
-    with db.Session() as session:
-        work_data = session.execute(query).first()
+    etag = make_etag(session, request, selection_keys(selection, id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = selection.query.where(Work.id == id)
+
+    work_data = session.execute(query).first()
 
     if work_data is None:
         return JSONResponse(
             {'msg': 'item not found'}, status.HTTP_404_NOT_FOUND
         )
 
-    work_id, work_name, work_cost = work_data[0:3]
-    contract_id, contract_name = work_data[3:5]
-    project_id, project_name = work_data[5:7]
-    group_id, group_name = work_data[7:9]
-
-    response = {
-        'id': work_id,
-        'name': work_name,
-        'cost': work_cost,
-        'contract': {
-            'id': contract_id,
-            'name': contract_name
-        },
-        'project': {
-            'id': project_id,
-            'name': project_name
-        },
-        'group': {
-            'id': group_id,
-            'name': group_name
-        },
-    }
-    return JSONResponse(response, status.HTTP_200_OK)
+    work_id = work_data[0]
+
+    response = selection.make_item(work_data)
+    return JSONResponse(
+        response, status.HTTP_200_OK, headers={'ETag': etag}
+    )
+
+
+@router.get('/api/works:batch', response_model=dict[int, Optional[schema.WorkProfile]], responses={
+    400: {'model': schema.BadRequestError},
+    401: {'model': schema.UnauthorizedError},
+})
+def api_works_get_batch(
+    request: Request,
+    ids: str,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    selection = WORK_PROFILE_FIELDS.select(fields)
+    ids = parse_ids(ids)
+    if expand is not None:
+        profiles = expand_profiles(session, 'works', selection, ids, expand)
+        return JSONResponse(profiles, status.HTTP_200_OK)
+
+    etag = make_etag(session, request, batch_keys(selection, ids))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    profiles = render_work_profiles(session, selection, ids)
+    return JSONResponse(
+        profiles, status.HTTP_200_OK, headers={'ETag': etag}
+    )
 
 
 @router.put('/api/works/{id}/contract', status_code=status.HTTP_200_OK, responses={
@@ -192,15 +223,14 @@ def api_works_get_one(
 def api_works_update_contract(
     id: int,
     request: schema.ContractID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     work = session.query(Work).get(id)
     contract = session.query(Contract).get(request.id)
 
@@ -230,15 +260,14 @@ def api_works_update_contract(
 def api_works_update_project(
     id: int,
     request: schema.ProjectID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     work = session.query(Work).get(id)
     project = session.query(Project).get(request.id)
 
@@ -268,15 +297,14 @@ def api_works_update_project(
 def api_works_update_group(
     id: int,
     request: schema.GroupID,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
 ):
     if not current_user.is_admin and not current_user.is_superuser:
         return JSONResponse(
             {'msg': 'access denied'}, status.HTTP_403_FORBIDDEN
         )
 
-    session = db.Session()
-
     work = session.query(Work).get(id)
     group = session.query(Group).get(request.id)
 
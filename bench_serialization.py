@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import types
+
+from datetime import date, timedelta
+
+from fastapi.responses import JSONResponse as StdJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+# Importing the app package applies migrations and connects to the
+# database; the schemas and the response class need none of it, so the
+# package is registered without running its __init__
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+PACKAGES = (('app', APP_PATH), ('app.contracts', os.path.join(APP_PATH, 'contracts')))
+for name, path in PACKAGES:
+    package = types.ModuleType(name)
+    package.__path__ = [path]
+    sys.modules.setdefault(name, package)
+
+from app.contracts import schema
+from app.responses import JSONResponse
+
+
+def make_items(count):
+    start = date(2024, 1, 1)
+    items = []
+    for x in range(count):
+        item = {
+            'id': x + 1,
+            'name': f'Contract №{x + 1}',
+            'start_date': start + timedelta(days=x % 365),
+            'finish_date': start + timedelta(days=x % 365 + 30),
+            'chief': {'id': x % 100 + 1, 'name': f'Chief {x % 100 + 1}'},
+            'group': {'id': x % 10 + 1, 'name': f'Group {x % 10 + 1}'},
+            'effectivity': x * 10.0 / (x % 5 + 1),
+            'works_total_cost': x * 10.0,
+            'users_number': x % 5 + 1
+        }
+        items.append(item)
+    return items
+
+
+def old_path(field, items):
+    # Validation against response_model, jsonable_encoder and stdlib json,
+    # which is what a handler returning plain data goes through
+    content = asyncio.run(serialize_response(
+        field=field, response_content=items, is_coroutine=False
+    ))
+    return StdJSONResponse(content).body
+
+
+def new_path(field, items):
+    return JSONResponse(items).body
+
+
+def measure(function, field, items, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(field, items)
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare response serialization paths on a contracts list'
+    )
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    field = create_response_field('response', list[schema.Contract])
+    items = make_items(args.items)
+
+    if old_path(field, items) != new_path(field, items):
+        raise SystemExit('paths render different bodies')
+
+    old = measure(old_path, field, items, args.repeat)
+    new = measure(new_path, field, items, args.repeat)
+    print(f'items: {args.items}, best of {args.repeat}')
+    print(f'pydantic + json:  {old * 1000:9.2f} ms')
+    print(f'orjson:           {new * 1000:9.2f} ms')
+    print(f'speedup:          {old / new:9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
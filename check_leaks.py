@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import gc
+import sys
+import time
+
+from sqlalchemy import text
+
+from app.db import db
+from app.pool import LeakDetector
+
+
+def leak(sessions):
+    # The session is never closed, only the list refers to it
+    session = db.Session()
+    session.execute(text('SELECT 1'))
+    sessions.append(session)
+
+
+def check(threshold):
+    # A leaked session which is garbage collected returns its connection,
+    # the detector must not keep it alive
+    detector = LeakDetector(threshold)
+    detector.attach(db.engine)
+    checked_out = db.engine.pool.checkedout()
+
+    sessions = []
+    leak(sessions)
+    time.sleep(threshold * 2)
+    detector.check()
+    sessions.clear()
+    gc.collect()
+
+    print(f'leaks detected {detector.detected}, reclaimed {detector.reclaimed}')
+    print(f'connections checked out {db.engine.pool.checkedout()}, '
+          f'before {checked_out}')
+    return (
+        detector.detected != 1
+        or detector.reclaimed != 1
+        or db.engine.pool.checkedout() != checked_out
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Leak a session and fail when the leak detector keeps '
+                    'its connection from being returned to the pool'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='seconds a connection may stay checked out before it is reported'
+    )
+    args = parser.parse_args()
+
+    if check(args.threshold):
+        sys.exit(1)
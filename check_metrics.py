@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+import threading
+import time
+
+from sqlalchemy import delete, func, select
+
+from app.db import db
+from app.models import AssociationContractProject, AssociationUserGroup
+from app.models import Contract, Group, Project, User, Work
+
+
+def create_contract(session):
+    group = Group(name='check_metrics')
+    session.add(group)
+    session.flush()
+    project = Project(name='check_metrics', group_id=group.id)
+    contract = Contract(name='check_metrics')
+    session.add_all([project, contract])
+    session.flush()
+    session.add(AssociationContractProject(
+        contract_id=contract.id, project_id=project.id
+    ))
+    session.commit()
+    return contract.id, group.id
+
+
+def write(barrier, contract_id, group_id, round, writer, hold, errors):
+    # Both writers change the same contract at once, the first one keeps
+    # its transaction open for a while so that the second one waits
+    try:
+        with db.Session() as session:
+            user = User(
+                name='check_metrics',
+                password_hash='!',
+                email=f'check_metrics_{contract_id}_{round}_{writer}@localhost'
+            )
+            session.add(user)
+            session.flush()
+            barrier.wait()
+            session.add(Work(name='check_metrics', cost=1.0, contract_id=contract_id))
+            session.add(AssociationUserGroup(user_id=user.id, group_id=group_id))
+            session.flush()
+            time.sleep(hold)
+            session.commit()
+    except Exception as e:
+        errors.append(e)
+
+
+def check(rounds, hold):
+    with db.Session() as session:
+        contract_id, group_id = create_contract(session)
+    errors = []
+    try:
+        for round in range(rounds):
+            barrier = threading.Barrier(2)
+            threads = [
+                threading.Thread(target=write, args=(
+                    barrier, contract_id, group_id, round, writer, hold, errors
+                ))
+                for writer in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        with db.Session() as session:
+            contract = session.get(Contract, contract_id)
+            works_total_cost = session.scalar(
+                select(func.coalesce(func.sum(Work.cost), 0))
+                .where(Work.contract_id == contract_id)
+            )
+            users_number = session.scalar(
+                select(func.count(AssociationUserGroup.user_id.distinct()))
+                .where(AssociationUserGroup.group_id == group_id)
+            )
+            print(f'works_total_cost {contract.works_total_cost}, '
+                  f'expected {works_total_cost}')
+            print(f'users_number {contract.users_number}, '
+                  f'expected {users_number}')
+            failed = (
+                contract.works_total_cost != works_total_cost
+                or contract.users_number != users_number
+            )
+    finally:
+        with db.Session() as session:
+            users = select(AssociationUserGroup.user_id).where(
+                AssociationUserGroup.group_id == group_id
+            ).scalar_subquery()
+            session.execute(delete(User).where(User.id.in_(users)))
+            session.execute(delete(Work).where(Work.contract_id == contract_id))
+            session.execute(delete(Contract).where(Contract.id == contract_id))
+            session.execute(delete(Project).where(Project.group_id == group_id))
+            session.execute(delete(Group).where(Group.id == group_id))
+            session.commit()
+
+    for e in errors:
+        print(f'Writer failed: {e!r}')
+    return failed or bool(errors)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Change works and members of one contract from two '
+                    'sessions at once and fail when the contract metrics '
+                    'maintained by triggers do not match them'
+    )
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        default=10,
+        help='how many times both sessions write at once'
+    )
+    parser.add_argument(
+        '--hold',
+        type=float,
+        default=0.2,
+        help='seconds a session keeps its transaction open before commit'
+    )
+    args = parser.parse_args()
+
+    if db.engine.dialect.name != 'postgresql':
+        sys.exit('Contract metrics are maintained on PostgreSQL only')
+    if check(args.rounds, args.hold):
+        sys.exit(1)
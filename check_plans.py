@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import logging
+import sys
+
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+import config
+
+from main import app
+from app.db import db
+
+
+def get_routes():
+    # Lists go first, so that their first items can be used for the profiles
+    # and the batches
+    routes = [
+        route.path for route in app.routes
+        if isinstance(route, APIRoute)
+        and 'GET' in route.methods
+        and route.path.startswith('/api/')
+        and not route.path.startswith('/api/admin/')
+    ]
+    return sorted(routes, key=lambda x: ('{' in x or x.endswith(':batch'), x))
+
+
+def check(client, headers):
+    # Routes which could not be requested for lack of items are failures
+    # too: their queries were not checked
+    failures = []
+    skipped = []
+    ids = {}
+    for path in get_routes():
+        if '{id}' in path or path.endswith(':batch'):
+            prefix = path.replace('/{id}', '').replace(':batch', '')
+            if prefix not in ids:
+                print(f'SKIP {path}: no items in {prefix}')
+                skipped.append(path)
+                continue
+            if path.endswith(':batch'):
+                url = f'{path}?ids={ids[prefix]}'
+            else:
+                url = path.replace('{id}', str(ids[prefix]))
+        else:
+            url = path
+        response = client.get(url, headers=headers)
+        print(f'GET {url} {response.status_code}')
+        if response.status_code >= 500:
+            failures.append(url)
+            continue
+        data = response.json()
+        if isinstance(data, list) and data and isinstance(data[0], dict) and 'id' in data[0]:
+            ids[path] = data[0]['id']
+    return failures, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Request every GET endpoint and fail when a query plan '
+                    'reads a table with a sequential scan'
+    )
+    parser.add_argument(
+        '--rows',
+        type=int,
+        default=config.DB_PLAN_CHECK_ROWS or 1000,
+        help='estimated rows above which a sequential scan is reported'
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if db.engine.dialect.name != 'postgresql':
+        sys.exit('Query plans can be checked on PostgreSQL only')
+    db.plans.threshold = args.rows
+    db.plans.reset()
+
+    client = TestClient(app)
+    response = client.post('/api/auth/login', json={
+        'email': config.SUPERUSER_EMAIL,
+        'password': config.SUPERUSER_PASSWORD
+    })
+    token = response.json()['token']['access_token']
+    failures, skipped = check(client, {'Authorization': f'Bearer {token}'})
+
+    regressions = db.plans.regressions()
+    print(f'{db.plans.checked} queries explained')
+    for item in regressions:
+        print(f"Seq Scan on {item['relation']} ({item['rows']} rows) "
+              f"in {item['endpoint']}: {item['statement'][:120]}")
+    if skipped:
+        print(f'{len(skipped)} routes skipped, the database needs at least '
+              f'one item of every entity')
+    if failures or skipped or regressions:
+        sys.exit(1)
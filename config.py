@@ -13,10 +13,77 @@ DB_URL = env.get('DB_URL', '')
 DB_ECHO = (env.get('DB_ECHO', 'False') == 'True')
 DB_MIGRATIONS = os.path.join(PROJECT_DIR, env.get('DB_MIGRATIONS', ''))
 
+# Connection pool config
+DB_POOL_SIZE = int(env.get('DB_POOL_SIZE', 5))
+DB_POOL_MAX_OVERFLOW = int(env.get('DB_POOL_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(env.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(env.get('DB_POOL_RECYCLE', -1))
+DB_POOL_PRE_PING = (env.get('DB_POOL_PRE_PING', 'False') == 'True')
+DB_POOL_WARMUP = int(env.get('DB_POOL_WARMUP', 0))
+# Seconds a connection may stay checked out before it is reported, 0 disables
+DB_LEAK_THRESHOLD = float(env.get('DB_LEAK_THRESHOLD', 30))
+# Explain queries and report sequential scans above this many rows, 0 disables
+DB_PLAN_CHECK_ROWS = int(env.get('DB_PLAN_CHECK_ROWS', 0))
+
+# Name search config
+# Shorter names have no trigrams to look up, they match name beginnings only
+SEARCH_MIN_LENGTH = int(env.get('SEARCH_MIN_LENGTH', 3))
+# pg_trgm word similarity threshold for fuzzy name search, 0 disables it
+SEARCH_SIMILARITY = float(env.get('SEARCH_SIMILARITY', 0))
+SEARCH_DEFAULT_LIMIT = int(env.get('SEARCH_DEFAULT_LIMIT', 20))
+SEARCH_MAX_LIMIT = int(env.get('SEARCH_MAX_LIMIT', 100))
+
+# Pagination config
+PAGE_DEFAULT_LIMIT = int(env.get('PAGE_DEFAULT_LIMIT', 100))
+PAGE_MAX_LIMIT = int(env.get('PAGE_MAX_LIMIT', 1000))
+# Totals expected to be larger are estimated by the planner, not counted
+PAGE_EXACT_COUNT_MAX = int(env.get('PAGE_EXACT_COUNT_MAX', 10000))
+# Rows fetched from the server side cursor at a time by NDJSON lists
+STREAM_BATCH_SIZE = int(env.get('STREAM_BATCH_SIZE', 1000))
+
+# Most ids a batch profiles request may ask for
+BATCH_MAX_IDS = int(env.get('BATCH_MAX_IDS', 200))
+
+# Limits of related entities embedded by expand=
+EXPAND_MAX_DEPTH = int(env.get('EXPAND_MAX_DEPTH', 3))
+EXPAND_MAX_ITEMS = int(env.get('EXPAND_MAX_ITEMS', 500))
+
+# Profile response cache config, size 0 disables it
+PROFILE_CACHE_SIZE = int(env.get('PROFILE_CACHE_SIZE', 1000))
+PROFILE_CACHE_TTL = float(env.get('PROFILE_CACHE_TTL', 60))
+
+# Seconds between folds of collection version deltas into the counters
+VERSIONS_FOLD_SECONDS = float(env.get('VERSIONS_FOLD_SECONDS', 10))
+
+# Analytics views are refreshed after this many seconds without changes,
+# but not later than the max delay after the first change
+ANALYTICS_REFRESH_DELAY = float(env.get('ANALYTICS_REFRESH_DELAY', 5))
+ANALYTICS_REFRESH_MAX_DELAY = float(env.get('ANALYTICS_REFRESH_MAX_DELAY', 60))
+# Seconds the in-memory effectivity snapshot is updated incrementally
+# before it is rebuilt, so that changes made by other workers show up
+ANALYTICS_SNAPSHOT_MAX_AGE = float(env.get('ANALYTICS_SNAPSHOT_MAX_AGE', 300))
+ANALYTICS_TOP_MAX_LIMIT = int(env.get('ANALYTICS_TOP_MAX_LIMIT', 100))
+
 # JWT-auth config
 AUTH_SECRET_KEY = env.get('AUTH_SECRET_KEY', 'a secret key')
 AUTH_ALGORITHM = env.get('AUTH_ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(env.get('ACCESS_TOKEN_EXPIRE_MINUTES', 30))
+AUTH_PRINCIPAL_CACHE_SIZE = int(env.get('AUTH_PRINCIPAL_CACHE_SIZE', 10000))
+# Principals changed by other workers are reloaded within
+# AUTH_REVOCATIONS_REFRESH_SECONDS, the TTL only bounds the memory use
+AUTH_PRINCIPAL_CACHE_TTL = float(env.get('AUTH_PRINCIPAL_CACHE_TTL', 60))
+# Sign id and permissions into tokens instead of loading the user per request
+AUTH_STATELESS_TOKENS = (env.get('AUTH_STATELESS_TOKENS', 'False') == 'True')
+AUTH_REVOCATIONS_REFRESH_SECONDS = float(env.get('AUTH_REVOCATIONS_REFRESH_SECONDS', 5))
+# Longer than any transaction inserting revocations may take to commit
+AUTH_REVOCATIONS_MARGIN_SECONDS = float(env.get('AUTH_REVOCATIONS_MARGIN_SECONDS', 60))
+
+# Password hashing config
+AUTH_PASSWORD_METHOD = env.get('AUTH_PASSWORD_METHOD', 'scrypt:32768:8:1')
+AUTH_PASSWORD_SALT_LENGTH = int(env.get('AUTH_PASSWORD_SALT_LENGTH', 16))
+AUTH_HASHING_WORKERS = int(env.get('AUTH_HASHING_WORKERS', 2))
+AUTH_HASHING_QUEUE = int(env.get('AUTH_HASHING_QUEUE', 16))
+AUTH_HASHING_TIMEOUT = float(env.get('AUTH_HASHING_TIMEOUT', 10))
 
 # Superuser config
 SUPERUSER_EMAIL = env['SUPERUSER_EMAIL']
@@ -0,0 +1,2 @@
+ALTER TABLE IF EXISTS users
+    ADD COLUMN IF NOT EXISTS security_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS token_revocations (
+    id SERIAL NOT NULL,
+    user_id INTEGER NOT NULL,
+    security_version INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+    CONSTRAINT token_revocation_pk PRIMARY KEY (id)
+);
@@ -0,0 +1,21 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+DROP INDEX CONCURRENTLY IF EXISTS work_contract_idx;
+DROP INDEX CONCURRENTLY IF EXISTS work_project_idx;
+DROP INDEX CONCURRENTLY IF EXISTS work_group_idx;
+DROP INDEX CONCURRENTLY IF EXISTS contract_group_idx;
+DROP INDEX CONCURRENTLY IF EXISTS project_group_idx;
+DROP INDEX CONCURRENTLY IF EXISTS user_department_idx;
+DROP INDEX CONCURRENTLY IF EXISTS equipment_department_idx;
+DROP INDEX CONCURRENTLY IF EXISTS equipment_group_idx;
+DROP INDEX CONCURRENTLY IF EXISTS association_user_group_user_idx;
+DROP INDEX CONCURRENTLY IF EXISTS association_user_group_group_idx;
+DROP INDEX CONCURRENTLY IF EXISTS association_contract_project_contract_idx;
+DROP INDEX CONCURRENTLY IF EXISTS association_contract_project_project_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_project_user_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_project_project_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_contract_user_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_contract_contract_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_department_equipment_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_department_department_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_group_equipment_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_group_group_idx;
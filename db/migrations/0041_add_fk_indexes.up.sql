@@ -0,0 +1,83 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+-- An interrupted build leaves an invalid index behind, so it is
+-- dropped first and every statement can be run again
+
+DROP INDEX CONCURRENTLY IF EXISTS work_contract_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS work_contract_idx
+    ON works (contract_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS work_project_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS work_project_idx
+    ON works (project_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS work_group_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS work_group_idx
+    ON works (group_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS contract_group_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS contract_group_idx
+    ON contracts (group_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS project_group_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS project_group_idx
+    ON projects (group_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS user_department_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_department_idx
+    ON users (department_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS equipment_department_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS equipment_department_idx
+    ON equipment (department_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS equipment_group_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS equipment_group_idx
+    ON equipment (group_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS association_user_group_user_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS association_user_group_user_idx
+    ON associations_user_group (user_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS association_user_group_group_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS association_user_group_group_idx
+    ON associations_user_group (group_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS association_contract_project_contract_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS association_contract_project_contract_idx
+    ON associations_contract_project (contract_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS association_contract_project_project_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS association_contract_project_project_idx
+    ON associations_contract_project (project_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_project_user_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_user_project_user_idx
+    ON assignments_user_project (user_id, id DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_project_project_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_user_project_project_idx
+    ON assignments_user_project (project_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_contract_user_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_user_contract_user_idx
+    ON assignments_user_contract (user_id, id DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_contract_contract_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_user_contract_contract_idx
+    ON assignments_user_contract (contract_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_department_equipment_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_equipment_department_equipment_idx
+    ON assignments_equipment_department (equipment_id, id DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_department_department_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_equipment_department_department_idx
+    ON assignments_equipment_department (department_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_group_equipment_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_equipment_group_equipment_idx
+    ON assignments_equipment_group (equipment_id, id DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_group_group_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_equipment_group_group_idx
+    ON assignments_equipment_group (group_id);
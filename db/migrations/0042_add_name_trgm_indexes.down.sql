@@ -0,0 +1,8 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+DROP INDEX CONCURRENTLY IF EXISTS user_name_trgm_idx;
+DROP INDEX CONCURRENTLY IF EXISTS department_name_trgm_idx;
+DROP INDEX CONCURRENTLY IF EXISTS contract_name_trgm_idx;
+DROP INDEX CONCURRENTLY IF EXISTS project_name_trgm_idx;
+DROP INDEX CONCURRENTLY IF EXISTS equipment_name_trgm_idx;
+DROP INDEX CONCURRENTLY IF EXISTS work_name_trgm_idx;
+DROP INDEX CONCURRENTLY IF EXISTS group_name_trgm_idx;
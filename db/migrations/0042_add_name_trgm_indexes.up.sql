@@ -0,0 +1,31 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+-- Trigram indexes serve name ILIKE '%...%' filters and the %> operator
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DROP INDEX CONCURRENTLY IF EXISTS user_name_trgm_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_name_trgm_idx
+    ON users USING gin (name gin_trgm_ops);
+
+DROP INDEX CONCURRENTLY IF EXISTS department_name_trgm_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS department_name_trgm_idx
+    ON departments USING gin (name gin_trgm_ops);
+
+DROP INDEX CONCURRENTLY IF EXISTS contract_name_trgm_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS contract_name_trgm_idx
+    ON contracts USING gin (name gin_trgm_ops);
+
+DROP INDEX CONCURRENTLY IF EXISTS project_name_trgm_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS project_name_trgm_idx
+    ON projects USING gin (name gin_trgm_ops);
+
+DROP INDEX CONCURRENTLY IF EXISTS equipment_name_trgm_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS equipment_name_trgm_idx
+    ON equipment USING gin (name gin_trgm_ops);
+
+DROP INDEX CONCURRENTLY IF EXISTS work_name_trgm_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS work_name_trgm_idx
+    ON works USING gin (name gin_trgm_ops);
+
+DROP INDEX CONCURRENTLY IF EXISTS group_name_trgm_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS group_name_trgm_idx
+    ON groups USING gin (name gin_trgm_ops);
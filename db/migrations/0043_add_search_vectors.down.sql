@@ -0,0 +1,27 @@
+DROP TRIGGER IF EXISTS user_search_vector_trigger ON users;
+ALTER TABLE IF EXISTS users
+    DROP COLUMN IF EXISTS search_vector;
+
+DROP TRIGGER IF EXISTS department_search_vector_trigger ON departments;
+ALTER TABLE IF EXISTS departments
+    DROP COLUMN IF EXISTS search_vector;
+
+DROP TRIGGER IF EXISTS contract_search_vector_trigger ON contracts;
+ALTER TABLE IF EXISTS contracts
+    DROP COLUMN IF EXISTS search_vector;
+
+DROP TRIGGER IF EXISTS project_search_vector_trigger ON projects;
+ALTER TABLE IF EXISTS projects
+    DROP COLUMN IF EXISTS search_vector;
+
+DROP TRIGGER IF EXISTS equipment_search_vector_trigger ON equipment;
+ALTER TABLE IF EXISTS equipment
+    DROP COLUMN IF EXISTS search_vector;
+
+DROP TRIGGER IF EXISTS work_search_vector_trigger ON works;
+ALTER TABLE IF EXISTS works
+    DROP COLUMN IF EXISTS search_vector;
+
+DROP TRIGGER IF EXISTS group_search_vector_trigger ON groups;
+ALTER TABLE IF EXISTS groups
+    DROP COLUMN IF EXISTS search_vector;
@@ -0,0 +1,65 @@
+-- Search vectors of entity names, kept up to date by triggers.
+-- The simple configuration does not stem: names are not natural language
+
+ALTER TABLE IF EXISTS users
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR NULL;
+
+DROP TRIGGER IF EXISTS user_search_vector_trigger ON users;
+CREATE TRIGGER user_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name ON users
+    FOR EACH ROW
+    EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', name);
+
+ALTER TABLE IF EXISTS departments
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR NULL;
+
+DROP TRIGGER IF EXISTS department_search_vector_trigger ON departments;
+CREATE TRIGGER department_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name ON departments
+    FOR EACH ROW
+    EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', name);
+
+ALTER TABLE IF EXISTS contracts
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR NULL;
+
+DROP TRIGGER IF EXISTS contract_search_vector_trigger ON contracts;
+CREATE TRIGGER contract_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name ON contracts
+    FOR EACH ROW
+    EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', name);
+
+ALTER TABLE IF EXISTS projects
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR NULL;
+
+DROP TRIGGER IF EXISTS project_search_vector_trigger ON projects;
+CREATE TRIGGER project_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name ON projects
+    FOR EACH ROW
+    EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', name);
+
+ALTER TABLE IF EXISTS equipment
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR NULL;
+
+DROP TRIGGER IF EXISTS equipment_search_vector_trigger ON equipment;
+CREATE TRIGGER equipment_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name ON equipment
+    FOR EACH ROW
+    EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', name);
+
+ALTER TABLE IF EXISTS works
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR NULL;
+
+DROP TRIGGER IF EXISTS work_search_vector_trigger ON works;
+CREATE TRIGGER work_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name ON works
+    FOR EACH ROW
+    EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', name);
+
+ALTER TABLE IF EXISTS groups
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR NULL;
+
+DROP TRIGGER IF EXISTS group_search_vector_trigger ON groups;
+CREATE TRIGGER group_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name ON groups
+    FOR EACH ROW
+    EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', name);
@@ -0,0 +1,8 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+DROP INDEX CONCURRENTLY IF EXISTS user_search_vector_idx;
+DROP INDEX CONCURRENTLY IF EXISTS department_search_vector_idx;
+DROP INDEX CONCURRENTLY IF EXISTS contract_search_vector_idx;
+DROP INDEX CONCURRENTLY IF EXISTS project_search_vector_idx;
+DROP INDEX CONCURRENTLY IF EXISTS equipment_search_vector_idx;
+DROP INDEX CONCURRENTLY IF EXISTS work_search_vector_idx;
+DROP INDEX CONCURRENTLY IF EXISTS group_search_vector_idx;
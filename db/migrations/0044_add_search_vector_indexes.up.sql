@@ -0,0 +1,51 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+-- Rows written before the triggers existed are filled in here
+
+UPDATE users
+    SET search_vector = to_tsvector('pg_catalog.simple', coalesce(name, ''))
+    WHERE search_vector IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS user_search_vector_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_search_vector_idx
+    ON users USING gin (search_vector);
+
+UPDATE departments
+    SET search_vector = to_tsvector('pg_catalog.simple', coalesce(name, ''))
+    WHERE search_vector IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS department_search_vector_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS department_search_vector_idx
+    ON departments USING gin (search_vector);
+
+UPDATE contracts
+    SET search_vector = to_tsvector('pg_catalog.simple', coalesce(name, ''))
+    WHERE search_vector IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS contract_search_vector_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS contract_search_vector_idx
+    ON contracts USING gin (search_vector);
+
+UPDATE projects
+    SET search_vector = to_tsvector('pg_catalog.simple', coalesce(name, ''))
+    WHERE search_vector IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS project_search_vector_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS project_search_vector_idx
+    ON projects USING gin (search_vector);
+
+UPDATE equipment
+    SET search_vector = to_tsvector('pg_catalog.simple', coalesce(name, ''))
+    WHERE search_vector IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS equipment_search_vector_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS equipment_search_vector_idx
+    ON equipment USING gin (search_vector);
+
+UPDATE works
+    SET search_vector = to_tsvector('pg_catalog.simple', coalesce(name, ''))
+    WHERE search_vector IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS work_search_vector_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS work_search_vector_idx
+    ON works USING gin (search_vector);
+
+UPDATE groups
+    SET search_vector = to_tsvector('pg_catalog.simple', coalesce(name, ''))
+    WHERE search_vector IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS group_search_vector_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS group_search_vector_idx
+    ON groups USING gin (search_vector);
@@ -0,0 +1,8 @@
+-- Version counters of entities ('contracts:1'), collections ('contracts')
+-- and statements changing unknown rows ('contracts:*'), used for ETags
+
+CREATE TABLE IF NOT EXISTS entity_versions (
+    key VARCHAR NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    CONSTRAINT entity_version_pk PRIMARY KEY (key)
+);
@@ -0,0 +1,16 @@
+DROP TRIGGER IF EXISTS work_contract_metrics_trigger ON works;
+DROP TRIGGER IF EXISTS association_contract_project_metrics_trigger ON associations_contract_project;
+DROP TRIGGER IF EXISTS project_contract_metrics_trigger ON projects;
+DROP TRIGGER IF EXISTS association_user_group_metrics_trigger ON associations_user_group;
+
+DROP FUNCTION IF EXISTS work_contract_metrics_trigger();
+DROP FUNCTION IF EXISTS association_contract_project_metrics_trigger();
+DROP FUNCTION IF EXISTS project_contract_metrics_trigger();
+DROP FUNCTION IF EXISTS association_user_group_metrics_trigger();
+DROP FUNCTION IF EXISTS contract_works_total_cost_refresh(INTEGER[]);
+DROP FUNCTION IF EXISTS contract_users_number_refresh(INTEGER[]);
+
+ALTER TABLE IF EXISTS contracts
+    DROP COLUMN IF EXISTS effectivity,
+    DROP COLUMN IF EXISTS users_number,
+    DROP COLUMN IF EXISTS works_total_cost;
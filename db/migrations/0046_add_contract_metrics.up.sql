@@ -0,0 +1,149 @@
+-- migrate: lock_timeout=5s, retries=5
+-- Metrics of contracts kept up to date by triggers, so that contracts can
+-- be filtered and sorted by effectivity without reading works and members.
+-- works_total_cost is the sum of the costs of the contract works,
+-- users_number is the number of distinct members of the groups of the
+-- contract projects. Triggers recompute the metrics of the affected
+-- contracts only, through indexed lookups: sums of floats do not drift
+-- and distinct counts stay exact.
+
+ALTER TABLE IF EXISTS contracts
+    ADD COLUMN IF NOT EXISTS works_total_cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS users_number INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS effectivity DOUBLE PRECISION GENERATED ALWAYS AS (
+        works_total_cost / CASE WHEN users_number > 1 THEN users_number ELSE 1 END
+    ) STORED;
+
+CREATE OR REPLACE FUNCTION contract_works_total_cost_refresh(contract_ids INTEGER[])
+RETURNS VOID AS $$
+    UPDATE contracts
+    SET works_total_cost = metrics.works_total_cost
+    FROM (
+        SELECT changed.id, (
+            SELECT COALESCE(SUM(works.cost), 0)
+            FROM works
+            WHERE works.contract_id = changed.id
+        ) AS works_total_cost
+        FROM (SELECT DISTINCT unnest(contract_ids) AS id) AS changed
+    ) AS metrics
+    WHERE contracts.id = metrics.id
+        AND contracts.works_total_cost <> metrics.works_total_cost;
+$$ LANGUAGE SQL;
+
+CREATE OR REPLACE FUNCTION contract_users_number_refresh(contract_ids INTEGER[])
+RETURNS VOID AS $$
+    UPDATE contracts
+    SET users_number = metrics.users_number
+    FROM (
+        SELECT changed.id, (
+            SELECT COUNT(DISTINCT associations_user_group.user_id)
+            FROM associations_contract_project
+            JOIN projects
+                ON projects.id = associations_contract_project.project_id
+            JOIN associations_user_group
+                ON associations_user_group.group_id = projects.group_id
+            WHERE associations_contract_project.contract_id = changed.id
+        ) AS users_number
+        FROM (SELECT DISTINCT unnest(contract_ids) AS id) AS changed
+    ) AS metrics
+    WHERE contracts.id = metrics.id
+        AND contracts.users_number <> metrics.users_number;
+$$ LANGUAGE SQL;
+
+-- Works of the contract
+CREATE OR REPLACE FUNCTION work_contract_metrics_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    contract_ids INTEGER[] := '{}';
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        contract_ids := contract_ids || OLD.contract_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        contract_ids := contract_ids || NEW.contract_id;
+    END IF;
+    PERFORM contract_works_total_cost_refresh(contract_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS work_contract_metrics_trigger ON works;
+CREATE TRIGGER work_contract_metrics_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF cost, contract_id ON works
+    FOR EACH ROW
+    EXECUTE FUNCTION work_contract_metrics_trigger();
+
+-- Projects of the contract
+CREATE OR REPLACE FUNCTION association_contract_project_metrics_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    contract_ids INTEGER[] := '{}';
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        contract_ids := contract_ids || OLD.contract_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        contract_ids := contract_ids || NEW.contract_id;
+    END IF;
+    PERFORM contract_users_number_refresh(contract_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS association_contract_project_metrics_trigger ON associations_contract_project;
+CREATE TRIGGER association_contract_project_metrics_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF contract_id, project_id ON associations_contract_project
+    FOR EACH ROW
+    EXECUTE FUNCTION association_contract_project_metrics_trigger();
+
+-- Groups of the contract projects
+CREATE OR REPLACE FUNCTION project_contract_metrics_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM contract_users_number_refresh(ARRAY(
+        SELECT contract_id
+        FROM associations_contract_project
+        WHERE project_id = NEW.id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS project_contract_metrics_trigger ON projects;
+CREATE TRIGGER project_contract_metrics_trigger
+    AFTER UPDATE OF group_id ON projects
+    FOR EACH ROW
+    WHEN (OLD.group_id IS DISTINCT FROM NEW.group_id)
+    EXECUTE FUNCTION project_contract_metrics_trigger();
+
+-- Members of the groups
+CREATE OR REPLACE FUNCTION association_user_group_metrics_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    group_ids INTEGER[] := '{}';
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        group_ids := group_ids || OLD.group_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        group_ids := group_ids || NEW.group_id;
+    END IF;
+    PERFORM contract_users_number_refresh(ARRAY(
+        SELECT associations_contract_project.contract_id
+        FROM projects
+        JOIN associations_contract_project
+            ON associations_contract_project.project_id = projects.id
+        WHERE projects.group_id = ANY(group_ids)
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS association_user_group_metrics_trigger ON associations_user_group;
+CREATE TRIGGER association_user_group_metrics_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, group_id ON associations_user_group
+    FOR EACH ROW
+    EXECUTE FUNCTION association_user_group_metrics_trigger();
+
+SELECT contract_works_total_cost_refresh(ARRAY(SELECT id FROM contracts));
+SELECT contract_users_number_refresh(ARRAY(SELECT id FROM contracts));
@@ -0,0 +1,5 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+-- Serves contract lists sorted by effectivity, ties are broken by id
+DROP INDEX CONCURRENTLY IF EXISTS contract_effectivity_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS contract_effectivity_idx
+    ON contracts (effectivity, id);
@@ -0,0 +1,3 @@
+DROP TABLE IF EXISTS analytics_refreshes;
+DROP MATERIALIZED VIEW IF EXISTS analytics_headcounts;
+DROP MATERIALIZED VIEW IF EXISTS analytics_work_costs;
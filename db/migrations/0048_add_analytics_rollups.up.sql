@@ -0,0 +1,70 @@
+-- Rollups of work costs and headcounts by group, department, project and
+-- contract, refreshed by the application after changes of the source
+-- tables. Rows of one grouping set share the dimension; the key is the
+-- id of the entity, NULL for rows without one and for the totals.
+-- Unique indexes are required by REFRESH MATERIALIZED VIEW CONCURRENTLY.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics_work_costs AS
+SELECT
+    CASE
+        WHEN GROUPING(group_id) = 0 THEN 'group'
+        WHEN GROUPING(project_id) = 0 THEN 'project'
+        WHEN GROUPING(contract_id) = 0 THEN 'contract'
+        ELSE 'total'
+    END AS dimension,
+    COALESCE(group_id, project_id, contract_id) AS key,
+    COUNT(*) AS works_number,
+    COALESCE(SUM(cost), 0) AS total_cost
+FROM works
+GROUP BY GROUPING SETS ((group_id), (project_id), (contract_id), ());
+
+CREATE UNIQUE INDEX IF NOT EXISTS analytics_work_cost_idx
+    ON analytics_work_costs (dimension, key);
+
+-- Members of the groups of projects count for the projects and for the
+-- contracts of these projects
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics_headcounts AS
+SELECT
+    CASE
+        WHEN GROUPING(users.department_id) = 0 THEN 'department'
+        WHEN GROUPING(associations_user_group.group_id) = 0 THEN 'group'
+        WHEN GROUPING(projects.id) = 0 THEN 'project'
+        WHEN GROUPING(associations_contract_project.contract_id) = 0 THEN 'contract'
+        ELSE 'total'
+    END AS dimension,
+    COALESCE(
+        users.department_id,
+        associations_user_group.group_id,
+        projects.id,
+        associations_contract_project.contract_id
+    ) AS key,
+    COUNT(DISTINCT users.id) AS users_number
+FROM users
+LEFT JOIN associations_user_group
+    ON associations_user_group.user_id = users.id
+LEFT JOIN projects
+    ON projects.group_id = associations_user_group.group_id
+LEFT JOIN associations_contract_project
+    ON associations_contract_project.project_id = projects.id
+GROUP BY GROUPING SETS (
+    (users.department_id),
+    (associations_user_group.group_id),
+    (projects.id),
+    (associations_contract_project.contract_id),
+    ()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS analytics_headcount_idx
+    ON analytics_headcounts (dimension, key);
+
+CREATE TABLE IF NOT EXISTS analytics_refreshes (
+    name VARCHAR NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL,
+    CONSTRAINT analytics_refresh_pk PRIMARY KEY (name)
+);
+
+INSERT INTO analytics_refreshes (name, refreshed_at)
+VALUES
+    ('analytics_work_costs', now() AT TIME ZONE 'utc'),
+    ('analytics_headcounts', now() AT TIME ZONE 'utc')
+ON CONFLICT (name) DO UPDATE SET refreshed_at = excluded.refreshed_at;
@@ -0,0 +1,17 @@
+DROP TRIGGER IF EXISTS assignment_user_project_valid_during_trigger ON assignments_user_project;
+ALTER TABLE IF EXISTS assignments_user_project
+    DROP COLUMN IF EXISTS valid_during;
+
+DROP TRIGGER IF EXISTS assignment_user_contract_valid_during_trigger ON assignments_user_contract;
+ALTER TABLE IF EXISTS assignments_user_contract
+    DROP COLUMN IF EXISTS valid_during;
+
+DROP TRIGGER IF EXISTS assignment_equipment_department_valid_during_trigger ON assignments_equipment_department;
+ALTER TABLE IF EXISTS assignments_equipment_department
+    DROP COLUMN IF EXISTS valid_during;
+
+DROP TRIGGER IF EXISTS assignment_equipment_group_valid_during_trigger ON assignments_equipment_group;
+ALTER TABLE IF EXISTS assignments_equipment_group
+    DROP COLUMN IF EXISTS valid_during;
+
+DROP FUNCTION IF EXISTS assignment_valid_during_trigger();
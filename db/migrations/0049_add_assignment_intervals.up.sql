@@ -0,0 +1,144 @@
+-- migrate: lock_timeout=5s, retries=5
+-- Validity intervals of the assignment logs: an assignment is valid from
+-- its date until the date of the next event of the same pair, other
+-- events have no interval. Intervals are set on insert by a trigger and
+-- computed for the existing rows from the order of the log.
+
+CREATE OR REPLACE FUNCTION assignment_valid_during_trigger()
+RETURNS TRIGGER AS $$
+-- Arguments are the columns of the pair, e.g. 'user_id', 'project_id'
+DECLARE
+    owner_id INTEGER := (to_jsonb(NEW) ->> TG_ARGV[0])::INTEGER;
+    target_id INTEGER := (to_jsonb(NEW) ->> TG_ARGV[1])::INTEGER;
+BEGIN
+    EXECUTE format(
+        'UPDATE %I SET valid_during = daterange('
+        'lower(valid_during), GREATEST(lower(valid_during), $3)) '
+        'WHERE %I = $1 AND %I = $2 AND upper_inf(valid_during)',
+        TG_TABLE_NAME, TG_ARGV[0], TG_ARGV[1]
+    ) USING owner_id, target_id, NEW.assignment_date;
+
+    IF NEW.is_assigned THEN
+        NEW.valid_during := daterange(NEW.assignment_date, NULL);
+    ELSE
+        NEW.valid_during := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE IF EXISTS assignments_user_project
+    ADD COLUMN IF NOT EXISTS valid_during DATERANGE NULL;
+
+UPDATE assignments_user_project
+SET valid_during = CASE
+    WHEN events.is_assigned
+    THEN daterange(events.assignment_date, CASE
+        WHEN events.next_date IS NOT NULL
+        THEN GREATEST(events.assignment_date, events.next_date)
+    END)
+END
+FROM (
+    SELECT
+        id,
+        is_assigned,
+        assignment_date,
+        LEAD(assignment_date) OVER (
+            PARTITION BY user_id, project_id ORDER BY id
+        ) AS next_date
+    FROM assignments_user_project
+) AS events
+WHERE assignments_user_project.id = events.id;
+
+DROP TRIGGER IF EXISTS assignment_user_project_valid_during_trigger ON assignments_user_project;
+CREATE TRIGGER assignment_user_project_valid_during_trigger
+    BEFORE INSERT ON assignments_user_project
+    FOR EACH ROW
+    EXECUTE FUNCTION assignment_valid_during_trigger('user_id', 'project_id');
+
+ALTER TABLE IF EXISTS assignments_user_contract
+    ADD COLUMN IF NOT EXISTS valid_during DATERANGE NULL;
+
+UPDATE assignments_user_contract
+SET valid_during = CASE
+    WHEN events.is_assigned
+    THEN daterange(events.assignment_date, CASE
+        WHEN events.next_date IS NOT NULL
+        THEN GREATEST(events.assignment_date, events.next_date)
+    END)
+END
+FROM (
+    SELECT
+        id,
+        is_assigned,
+        assignment_date,
+        LEAD(assignment_date) OVER (
+            PARTITION BY user_id, contract_id ORDER BY id
+        ) AS next_date
+    FROM assignments_user_contract
+) AS events
+WHERE assignments_user_contract.id = events.id;
+
+DROP TRIGGER IF EXISTS assignment_user_contract_valid_during_trigger ON assignments_user_contract;
+CREATE TRIGGER assignment_user_contract_valid_during_trigger
+    BEFORE INSERT ON assignments_user_contract
+    FOR EACH ROW
+    EXECUTE FUNCTION assignment_valid_during_trigger('user_id', 'contract_id');
+
+ALTER TABLE IF EXISTS assignments_equipment_department
+    ADD COLUMN IF NOT EXISTS valid_during DATERANGE NULL;
+
+UPDATE assignments_equipment_department
+SET valid_during = CASE
+    WHEN events.is_assigned
+    THEN daterange(events.assignment_date, CASE
+        WHEN events.next_date IS NOT NULL
+        THEN GREATEST(events.assignment_date, events.next_date)
+    END)
+END
+FROM (
+    SELECT
+        id,
+        is_assigned,
+        assignment_date,
+        LEAD(assignment_date) OVER (
+            PARTITION BY equipment_id, department_id ORDER BY id
+        ) AS next_date
+    FROM assignments_equipment_department
+) AS events
+WHERE assignments_equipment_department.id = events.id;
+
+DROP TRIGGER IF EXISTS assignment_equipment_department_valid_during_trigger ON assignments_equipment_department;
+CREATE TRIGGER assignment_equipment_department_valid_during_trigger
+    BEFORE INSERT ON assignments_equipment_department
+    FOR EACH ROW
+    EXECUTE FUNCTION assignment_valid_during_trigger('equipment_id', 'department_id');
+
+ALTER TABLE IF EXISTS assignments_equipment_group
+    ADD COLUMN IF NOT EXISTS valid_during DATERANGE NULL;
+
+UPDATE assignments_equipment_group
+SET valid_during = CASE
+    WHEN events.is_assigned
+    THEN daterange(events.assignment_date, CASE
+        WHEN events.next_date IS NOT NULL
+        THEN GREATEST(events.assignment_date, events.next_date)
+    END)
+END
+FROM (
+    SELECT
+        id,
+        is_assigned,
+        assignment_date,
+        LEAD(assignment_date) OVER (
+            PARTITION BY equipment_id, group_id ORDER BY id
+        ) AS next_date
+    FROM assignments_equipment_group
+) AS events
+WHERE assignments_equipment_group.id = events.id;
+
+DROP TRIGGER IF EXISTS assignment_equipment_group_valid_during_trigger ON assignments_equipment_group;
+CREATE TRIGGER assignment_equipment_group_valid_during_trigger
+    BEFORE INSERT ON assignments_equipment_group
+    FOR EACH ROW
+    EXECUTE FUNCTION assignment_valid_during_trigger('equipment_id', 'group_id');
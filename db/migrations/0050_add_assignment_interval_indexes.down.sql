@@ -0,0 +1,9 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_project_user_valid_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_project_project_valid_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_contract_user_valid_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_contract_contract_valid_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_department_equipment_valid_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_department_department_valid_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_group_equipment_valid_idx;
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_group_group_valid_idx;
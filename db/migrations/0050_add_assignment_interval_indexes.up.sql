@@ -0,0 +1,36 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+-- GiST indexes over (id, interval) pairs answer "valid on the date" for
+-- one entity with one range lookup; btree_gist provides integer columns
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_project_user_valid_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_user_project_user_valid_idx
+    ON assignments_user_project USING gist (user_id, valid_during);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_project_project_valid_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_user_project_project_valid_idx
+    ON assignments_user_project USING gist (project_id, valid_during);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_contract_user_valid_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_user_contract_user_valid_idx
+    ON assignments_user_contract USING gist (user_id, valid_during);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_user_contract_contract_valid_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_user_contract_contract_valid_idx
+    ON assignments_user_contract USING gist (contract_id, valid_during);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_department_equipment_valid_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_equipment_department_equipment_valid_idx
+    ON assignments_equipment_department USING gist (equipment_id, valid_during);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_department_department_valid_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_equipment_department_department_valid_idx
+    ON assignments_equipment_department USING gist (department_id, valid_during);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_group_equipment_valid_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_equipment_group_equipment_valid_idx
+    ON assignments_equipment_group USING gist (equipment_id, valid_during);
+
+DROP INDEX CONCURRENTLY IF EXISTS assignment_equipment_group_group_valid_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assignment_equipment_group_group_valid_idx
+    ON assignments_equipment_group USING gist (group_id, valid_during);
@@ -0,0 +1,13 @@
+DROP TRIGGER IF EXISTS assignment_user_project_current_trigger ON assignments_user_project;
+DROP TABLE IF EXISTS current_assignments_user_project;
+
+DROP TRIGGER IF EXISTS assignment_user_contract_current_trigger ON assignments_user_contract;
+DROP TABLE IF EXISTS current_assignments_user_contract;
+
+DROP TRIGGER IF EXISTS assignment_equipment_department_current_trigger ON assignments_equipment_department;
+DROP TABLE IF EXISTS current_assignments_equipment_department;
+
+DROP TRIGGER IF EXISTS assignment_equipment_group_current_trigger ON assignments_equipment_group;
+DROP TABLE IF EXISTS current_assignments_equipment_group;
+
+DROP FUNCTION IF EXISTS assignment_current_trigger();
@@ -0,0 +1,201 @@
+-- migrate: lock_timeout=5s, retries=5
+-- Current state of the assignment logs: one row per pair with the last
+-- state and the date it began, upserted by a trigger in the transaction
+-- of every inserted event. Events repeating the state leave the row as
+-- it is, so it stays valid after the log is compacted.
+
+CREATE OR REPLACE FUNCTION assignment_current_trigger()
+RETURNS TRIGGER AS $$
+-- Arguments are the state table and the columns of the pair
+DECLARE
+    owner_id INTEGER := (to_jsonb(NEW) ->> TG_ARGV[1])::INTEGER;
+    target_id INTEGER := (to_jsonb(NEW) ->> TG_ARGV[2])::INTEGER;
+BEGIN
+    EXECUTE format(
+        'INSERT INTO %I AS state (%I, %I, assignment_date, is_assigned) '
+        'VALUES ($1, $2, $3, $4) '
+        'ON CONFLICT (%I, %I) DO UPDATE SET '
+        'assignment_date = excluded.assignment_date, '
+        'is_assigned = excluded.is_assigned '
+        'WHERE state.is_assigned <> excluded.is_assigned',
+        TG_ARGV[0], TG_ARGV[1], TG_ARGV[2], TG_ARGV[1], TG_ARGV[2]
+    ) USING owner_id, target_id, NEW.assignment_date, COALESCE(NEW.is_assigned, FALSE);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE IF NOT EXISTS current_assignments_user_project (
+    user_id INTEGER NOT NULL,
+    project_id INTEGER NOT NULL,
+    assignment_date DATE NULL,
+    is_assigned BOOLEAN NOT NULL,
+    CONSTRAINT current_assignment_user_project_pk PRIMARY KEY (user_id, project_id),
+    CONSTRAINT current_assignment_user_project_user_fk FOREIGN KEY (user_id)
+        REFERENCES users (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    CONSTRAINT current_assignment_user_project_project_fk FOREIGN KEY (project_id)
+        REFERENCES projects (id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS current_assignment_user_project_project_idx
+    ON current_assignments_user_project (project_id, user_id)
+    WHERE is_assigned;
+
+-- The trigger takes the lock which holds inserts of events until the
+-- backfill is committed
+DROP TRIGGER IF EXISTS assignment_user_project_current_trigger ON assignments_user_project;
+CREATE TRIGGER assignment_user_project_current_trigger
+    AFTER INSERT ON assignments_user_project
+    FOR EACH ROW
+    EXECUTE FUNCTION assignment_current_trigger('current_assignments_user_project', 'user_id', 'project_id');
+
+-- The last state and the first event of its run
+INSERT INTO current_assignments_user_project (user_id, project_id, assignment_date, is_assigned)
+SELECT DISTINCT ON (user_id, project_id)
+    user_id, project_id, assignment_date, is_assigned
+FROM (
+    SELECT
+        id,
+        user_id,
+        project_id,
+        assignment_date,
+        COALESCE(is_assigned, FALSE) AS is_assigned,
+        LAG(COALESCE(is_assigned, FALSE)) OVER (
+            PARTITION BY user_id, project_id ORDER BY id
+        ) AS previous
+    FROM assignments_user_project
+) AS events
+WHERE previous IS DISTINCT FROM is_assigned
+ORDER BY user_id, project_id, id DESC
+ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS current_assignments_user_contract (
+    user_id INTEGER NOT NULL,
+    contract_id INTEGER NOT NULL,
+    assignment_date DATE NULL,
+    is_assigned BOOLEAN NOT NULL,
+    CONSTRAINT current_assignment_user_contract_pk PRIMARY KEY (user_id, contract_id),
+    CONSTRAINT current_assignment_user_contract_user_fk FOREIGN KEY (user_id)
+        REFERENCES users (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    CONSTRAINT current_assignment_user_contract_contract_fk FOREIGN KEY (contract_id)
+        REFERENCES contracts (id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS current_assignment_user_contract_contract_idx
+    ON current_assignments_user_contract (contract_id, user_id)
+    WHERE is_assigned;
+
+-- The trigger takes the lock which holds inserts of events until the
+-- backfill is committed
+DROP TRIGGER IF EXISTS assignment_user_contract_current_trigger ON assignments_user_contract;
+CREATE TRIGGER assignment_user_contract_current_trigger
+    AFTER INSERT ON assignments_user_contract
+    FOR EACH ROW
+    EXECUTE FUNCTION assignment_current_trigger('current_assignments_user_contract', 'user_id', 'contract_id');
+
+-- The last state and the first event of its run
+INSERT INTO current_assignments_user_contract (user_id, contract_id, assignment_date, is_assigned)
+SELECT DISTINCT ON (user_id, contract_id)
+    user_id, contract_id, assignment_date, is_assigned
+FROM (
+    SELECT
+        id,
+        user_id,
+        contract_id,
+        assignment_date,
+        COALESCE(is_assigned, FALSE) AS is_assigned,
+        LAG(COALESCE(is_assigned, FALSE)) OVER (
+            PARTITION BY user_id, contract_id ORDER BY id
+        ) AS previous
+    FROM assignments_user_contract
+) AS events
+WHERE previous IS DISTINCT FROM is_assigned
+ORDER BY user_id, contract_id, id DESC
+ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS current_assignments_equipment_department (
+    equipment_id INTEGER NOT NULL,
+    department_id INTEGER NOT NULL,
+    assignment_date DATE NULL,
+    is_assigned BOOLEAN NOT NULL,
+    CONSTRAINT current_assignment_equipment_department_pk PRIMARY KEY (equipment_id, department_id),
+    CONSTRAINT current_assignment_equipment_department_equipment_fk FOREIGN KEY (equipment_id)
+        REFERENCES equipment (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    CONSTRAINT current_assignment_equipment_department_department_fk FOREIGN KEY (department_id)
+        REFERENCES departments (id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS current_assignment_equipment_department_department_idx
+    ON current_assignments_equipment_department (department_id, equipment_id)
+    WHERE is_assigned;
+
+-- The trigger takes the lock which holds inserts of events until the
+-- backfill is committed
+DROP TRIGGER IF EXISTS assignment_equipment_department_current_trigger ON assignments_equipment_department;
+CREATE TRIGGER assignment_equipment_department_current_trigger
+    AFTER INSERT ON assignments_equipment_department
+    FOR EACH ROW
+    EXECUTE FUNCTION assignment_current_trigger('current_assignments_equipment_department', 'equipment_id', 'department_id');
+
+-- The last state and the first event of its run
+INSERT INTO current_assignments_equipment_department (equipment_id, department_id, assignment_date, is_assigned)
+SELECT DISTINCT ON (equipment_id, department_id)
+    equipment_id, department_id, assignment_date, is_assigned
+FROM (
+    SELECT
+        id,
+        equipment_id,
+        department_id,
+        assignment_date,
+        COALESCE(is_assigned, FALSE) AS is_assigned,
+        LAG(COALESCE(is_assigned, FALSE)) OVER (
+            PARTITION BY equipment_id, department_id ORDER BY id
+        ) AS previous
+    FROM assignments_equipment_department
+) AS events
+WHERE previous IS DISTINCT FROM is_assigned
+ORDER BY equipment_id, department_id, id DESC
+ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS current_assignments_equipment_group (
+    equipment_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    assignment_date DATE NULL,
+    is_assigned BOOLEAN NOT NULL,
+    CONSTRAINT current_assignment_equipment_group_pk PRIMARY KEY (equipment_id, group_id),
+    CONSTRAINT current_assignment_equipment_group_equipment_fk FOREIGN KEY (equipment_id)
+        REFERENCES equipment (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    CONSTRAINT current_assignment_equipment_group_group_fk FOREIGN KEY (group_id)
+        REFERENCES groups (id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS current_assignment_equipment_group_group_idx
+    ON current_assignments_equipment_group (group_id, equipment_id)
+    WHERE is_assigned;
+
+-- The trigger takes the lock which holds inserts of events until the
+-- backfill is committed
+DROP TRIGGER IF EXISTS assignment_equipment_group_current_trigger ON assignments_equipment_group;
+CREATE TRIGGER assignment_equipment_group_current_trigger
+    AFTER INSERT ON assignments_equipment_group
+    FOR EACH ROW
+    EXECUTE FUNCTION assignment_current_trigger('current_assignments_equipment_group', 'equipment_id', 'group_id');
+
+-- The last state and the first event of its run
+INSERT INTO current_assignments_equipment_group (equipment_id, group_id, assignment_date, is_assigned)
+SELECT DISTINCT ON (equipment_id, group_id)
+    equipment_id, group_id, assignment_date, is_assigned
+FROM (
+    SELECT
+        id,
+        equipment_id,
+        group_id,
+        assignment_date,
+        COALESCE(is_assigned, FALSE) AS is_assigned,
+        LAG(COALESCE(is_assigned, FALSE)) OVER (
+            PARTITION BY equipment_id, group_id ORDER BY id
+        ) AS previous
+    FROM assignments_equipment_group
+) AS events
+WHERE previous IS DISTINCT FROM is_assigned
+ORDER BY equipment_id, group_id, id DESC
+ON CONFLICT DO NOTHING;
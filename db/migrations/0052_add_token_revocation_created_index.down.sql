@@ -0,0 +1,2 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+DROP INDEX CONCURRENTLY IF EXISTS token_revocation_created_idx;
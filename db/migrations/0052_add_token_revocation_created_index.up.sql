@@ -0,0 +1,5 @@
+-- migrate: no-transaction, lock_timeout=5s, retries=5
+-- Serves the trailing window every revocation refresh reads again
+DROP INDEX CONCURRENTLY IF EXISTS token_revocation_created_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS token_revocation_created_idx
+    ON token_revocations (created_at);
@@ -0,0 +1,7 @@
+-- Deltas not folded yet are added to the counters
+INSERT INTO entity_versions (key, version)
+SELECT key, count(*) FROM entity_version_deltas GROUP BY key
+ON CONFLICT (key) DO UPDATE
+SET version = entity_versions.version + excluded.version;
+
+DROP TABLE IF EXISTS entity_version_deltas;
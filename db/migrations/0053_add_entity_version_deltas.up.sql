@@ -0,0 +1,13 @@
+-- Changes of collections ('contracts'), references and statements
+-- ('contracts:*'), one row per commit: appending them locks no counter
+-- shared by the writers of a table. Versions are the counters plus the
+-- deltas not folded into them yet.
+
+CREATE TABLE IF NOT EXISTS entity_version_deltas (
+    id BIGSERIAL NOT NULL,
+    key VARCHAR NOT NULL,
+    CONSTRAINT entity_version_delta_pk PRIMARY KEY (id)
+);
+
+CREATE INDEX IF NOT EXISTS entity_version_delta_key_idx
+    ON entity_version_deltas (key);
@@ -0,0 +1,35 @@
+CREATE OR REPLACE FUNCTION contract_works_total_cost_refresh(contract_ids INTEGER[])
+RETURNS VOID AS $$
+    UPDATE contracts
+    SET works_total_cost = metrics.works_total_cost
+    FROM (
+        SELECT changed.id, (
+            SELECT COALESCE(SUM(works.cost), 0)
+            FROM works
+            WHERE works.contract_id = changed.id
+        ) AS works_total_cost
+        FROM (SELECT DISTINCT unnest(contract_ids) AS id) AS changed
+    ) AS metrics
+    WHERE contracts.id = metrics.id
+        AND contracts.works_total_cost <> metrics.works_total_cost;
+$$ LANGUAGE SQL;
+
+CREATE OR REPLACE FUNCTION contract_users_number_refresh(contract_ids INTEGER[])
+RETURNS VOID AS $$
+    UPDATE contracts
+    SET users_number = metrics.users_number
+    FROM (
+        SELECT changed.id, (
+            SELECT COUNT(DISTINCT associations_user_group.user_id)
+            FROM associations_contract_project
+            JOIN projects
+                ON projects.id = associations_contract_project.project_id
+            JOIN associations_user_group
+                ON associations_user_group.group_id = projects.group_id
+            WHERE associations_contract_project.contract_id = changed.id
+        ) AS users_number
+        FROM (SELECT DISTINCT unnest(contract_ids) AS id) AS changed
+    ) AS metrics
+    WHERE contracts.id = metrics.id
+        AND contracts.users_number <> metrics.users_number;
+$$ LANGUAGE SQL;
@@ -0,0 +1,56 @@
+-- migrate: lock_timeout=5s, retries=5
+-- Metrics refreshes lock the contract rows before recomputing. Without it
+-- two transactions changing works or members of the same contract both
+-- recompute from their own snapshots and the later update overwrites the
+-- other one with a stale value. The lock is taken by a statement of its
+-- own: the recomputing statement then takes its snapshot after the other
+-- writer has committed. Rows are locked in id order, so that writers of
+-- several contracts do not deadlock each other, and FOR NO KEY UPDATE like
+-- the update itself: FOR UPDATE would conflict with the key share locks
+-- the foreign keys of works take on the contract.
+
+CREATE OR REPLACE FUNCTION contract_works_total_cost_refresh(contract_ids INTEGER[])
+RETURNS VOID AS $$
+BEGIN
+    PERFORM 1 FROM contracts WHERE id = ANY(contract_ids) ORDER BY id FOR NO KEY UPDATE;
+    UPDATE contracts
+    SET works_total_cost = metrics.works_total_cost
+    FROM (
+        SELECT changed.id, (
+            SELECT COALESCE(SUM(works.cost), 0)
+            FROM works
+            WHERE works.contract_id = changed.id
+        ) AS works_total_cost
+        FROM (SELECT DISTINCT unnest(contract_ids) AS id) AS changed
+    ) AS metrics
+    WHERE contracts.id = metrics.id
+        AND contracts.works_total_cost <> metrics.works_total_cost;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION contract_users_number_refresh(contract_ids INTEGER[])
+RETURNS VOID AS $$
+BEGIN
+    PERFORM 1 FROM contracts WHERE id = ANY(contract_ids) ORDER BY id FOR NO KEY UPDATE;
+    UPDATE contracts
+    SET users_number = metrics.users_number
+    FROM (
+        SELECT changed.id, (
+            SELECT COUNT(DISTINCT associations_user_group.user_id)
+            FROM associations_contract_project
+            JOIN projects
+                ON projects.id = associations_contract_project.project_id
+            JOIN associations_user_group
+                ON associations_user_group.group_id = projects.group_id
+            WHERE associations_contract_project.contract_id = changed.id
+        ) AS users_number
+        FROM (SELECT DISTINCT unnest(contract_ids) AS id) AS changed
+    ) AS metrics
+    WHERE contracts.id = metrics.id
+        AND contracts.users_number <> metrics.users_number;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Metrics lost by concurrent writers before
+SELECT contract_works_total_cost_refresh(ARRAY(SELECT id FROM contracts));
+SELECT contract_users_number_refresh(ARRAY(SELECT id FROM contracts));
@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
 
-from fastapi import FastAPI
+import contextlib
+
+from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from app.responses import JSONResponse
+
+from app.hashing import hasher, HasherBusyError
+from app.fields import InvalidFieldsError
+from app.pagination import InvalidPageError
+from app.profiles import InvalidIdsError
+from app.expand import InvalidExpandError
 
 from app.auth.router import router as auth_router
 from app.users.router import router as users_router
@@ -11,8 +20,19 @@ from app.projects.router import router as projects_router
 from app.equipment.router import router as equipment_router
 from app.groups.router import router as groups_router
 from app.works.router import router as works_router
+from app.admin.router import router as admin_router
+from app.search.router import router as search_router
+from app.analytics.router import router as analytics_router
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    hasher.start()
+    yield
+    hasher.stop()
 
-app = FastAPI()
+
+app = FastAPI(default_response_class=JSONResponse, lifespan=lifespan)
 
 # TODO: it must be configured more carefully
 app.add_middleware(
@@ -20,8 +40,41 @@ app.add_middleware(
     allow_origins=['*'],
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=[
+        'ETag', 'X-Next-Cursor', 'X-Total-Count', 'X-Total-Count-Estimated'
+    ],
 )
 
+
+@app.exception_handler(HasherBusyError)
+def hasher_busy_handler(request, exc):
+    return JSONResponse(
+        {'msg': 'service unavailable'},
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': '1'}
+    )
+
+
+@app.exception_handler(InvalidPageError)
+def invalid_page_handler(request, exc):
+    return JSONResponse({'msg': str(exc)}, status.HTTP_400_BAD_REQUEST)
+
+
+@app.exception_handler(InvalidFieldsError)
+def invalid_fields_handler(request, exc):
+    return JSONResponse({'msg': str(exc)}, status.HTTP_400_BAD_REQUEST)
+
+
+@app.exception_handler(InvalidIdsError)
+def invalid_ids_handler(request, exc):
+    return JSONResponse({'msg': str(exc)}, status.HTTP_400_BAD_REQUEST)
+
+
+@app.exception_handler(InvalidExpandError)
+def invalid_expand_handler(request, exc):
+    return JSONResponse({'msg': str(exc)}, status.HTTP_400_BAD_REQUEST)
+
+
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(departments_router)
@@ -30,6 +83,9 @@ app.include_router(projects_router)
 app.include_router(equipment_router)
 app.include_router(groups_router)
 app.include_router(works_router)
+app.include_router(admin_router)
+app.include_router(search_router)
+app.include_router(analytics_router)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import logging
+import os
+import sys
+
+# Import the migrator on its own: importing the app package starts the
+# application, which migrates the database as its first step
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+from migrator import migrator
+
+
+def print_plan():
+    plan = migrator.plan()
+    if not plan:
+        print('Nothing to migrate')
+    for migration, statements in plan:
+        options = ', '.join(
+            key if value is True else f'{key}={value}'
+            for key, value in migration.options.items()
+        )
+        print(f'{migration.version}' + (f' [{options}]' if options else ''))
+        for statement, lock, table in statements:
+            summary = ' '.join(statement.split())
+            if len(summary) > 80:
+                summary = summary[:77] + '...'
+            target = f' on {table}' if table else ''
+            print(f'    {lock}{target}: {summary}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply database migrations')
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='print pending migrations with estimated lock levels and exit'
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.plan:
+        print_plan()
+    else:
+        migrator.up()